@@ -0,0 +1,167 @@
+import datetime
+import logging
+from collections import Counter
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from indexes import ensure_collection_indexes, register_indexes
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_PERIODS = {'day': '%Y-%m-%d', 'month': '%Y-%m'}
+# Rollup dimension -> reservation field
+ROLLUP_DIMENSIONS = {'inv_type': 'inv_type', 'inv_id': 'inv_id', 'user': 'Reserved_user'}
+# Event -> the date field it is bucketed by
+ROLLUP_EVENTS = {
+    'created': 'Reservation_created_date',
+    'returned': 'Reservation_closed_date',
+    'cancelled': 'Reservation_closed_date',
+    'expired': 'Reservation_closed_date',
+}
+CLOSING_EVENTS = {'Returned': 'returned', 'Cancelled': 'cancelled', 'Expired': 'expired'}
+# What record() needs from a reservation
+ROLLUP_PROJECTION = {'_id': 0, 'Reserved_user': 1, 'inv_id': 1, 'inv_type': 1, 'inv_name': 1,
+                     'Reservation_created_date': 1, 'Reservation_closed_date': 1}
+
+register_indexes('reservations_db', 'reservation_rollups', (
+    [('period', ASCENDING), ('dimension', ASCENDING), ('bucket', ASCENDING), ('key', ASCENDING)],
+    {'name': 'period_dimension_bucket_key_unique', 'unique': True},
+))
+
+
+class ReservationRollups:
+    """Event counts per (day or month) x (inv_type, inv_id or user), kept up to date on every change.
+
+    The incremental path counts transitions, so a reservation that expired and was
+    later returned counts under both; rebuild() counts each reservation once, under
+    its created date and its current closing status. Cancelling deletes the
+    reservation, so rebuild() no longer sees it and its counts are dropped.
+    """
+
+    def __init__(self, rollups, sources):
+        self.rollups = rollups
+        # Collections rebuild() reads reservations from, hot collection first
+        self.sources = sources
+
+    def record(self, event, reservations, when=None):
+        # One unordered bulk upsert per call. A failure is logged rather than raised:
+        # the reservation change already happened, and rebuild() repairs the drift.
+        counts = Counter()
+        names = {}
+        recorded = 0
+        for reservation in reservations:
+            at = when or reservation.get(ROLLUP_EVENTS[event])
+            if not isinstance(at, datetime.datetime):
+                continue
+            recorded += 1
+            for period, date_format in ROLLUP_PERIODS.items():
+                bucket = at.strftime(date_format)
+                for dimension, field in ROLLUP_DIMENSIONS.items():
+                    counts[(period, bucket, dimension, reservation.get(field))] += 1
+            if reservation.get('inv_name'):
+                names[reservation.get('inv_id')] = reservation['inv_name']
+        if not counts:
+            return 0
+
+        operations = []
+        for (period, bucket, dimension, key), count in counts.items():
+            update = {'$inc': {event: count}}
+            if dimension == 'inv_id' and key in names:
+                update['$set'] = {'inv_name': names[key]}
+            operations.append(UpdateOne(
+                {'period': period, 'dimension': dimension, 'bucket': bucket, 'key': key}, update, upsert=True))
+        try:
+            self.rollups.bulk_write(operations, ordered=False)
+        except PyMongoError:
+            logger.warning('Could not update %s rollups for %d reservations', event, recorded, exc_info=True)
+            return 0
+        return recorded
+
+    def rebuild_pipeline(self, output):
+        hot, *others = self.sources
+        closing_event = {'$switch': {
+            'branches': [{'case': {'$eq': ['$Reservation_status', status]}, 'then': event}
+                         for status, event in CLOSING_EVENTS.items()],
+            'default': None,
+        }}
+        pipeline = [{'$unionWith': {'coll': source.name}} for source in others]
+        pipeline += [
+            {'$project': {
+                'inv_name': 1,
+                'keys': [{'dimension': dimension, 'key': f'${field}'}
+                         for dimension, field in ROLLUP_DIMENSIONS.items()],
+                'events': [
+                    {'event': 'created', 'at': '$Reservation_created_date'},
+                    {'event': closing_event, 'at': '$Reservation_closed_date'},
+                ],
+            }},
+            {'$unwind': '$events'},
+            {'$match': {'events.event': {'$ne': None}, 'events.at': {'$type': 'date'}}},
+            {'$project': {
+                'inv_name': 1,
+                'keys': 1,
+                'event': '$events.event',
+                'buckets': [{'period': period, 'bucket': {'$dateToString': {'format': date_format, 'date': '$events.at'}}}
+                            for period, date_format in ROLLUP_PERIODS.items()],
+            }},
+            {'$unwind': '$buckets'},
+            {'$unwind': '$keys'},
+            {'$group': dict(
+                {'_id': {'period': '$buckets.period', 'dimension': '$keys.dimension',
+                         'bucket': '$buckets.bucket', 'key': '$keys.key'},
+                 'inv_name': {'$last': '$inv_name'}},
+                **{event: {'$sum': {'$cond': [{'$eq': ['$event', event]}, 1, 0]}} for event in ROLLUP_EVENTS}
+            )},
+            {'$project': dict(
+                {'_id': 0, 'period': '$_id.period', 'dimension': '$_id.dimension', 'bucket': '$_id.bucket',
+                 'key': '$_id.key',
+                 'inv_name': {'$cond': [{'$eq': ['$_id.dimension', 'inv_id']}, '$inv_name', '$$REMOVE']}},
+                **{event: 1 for event in ROLLUP_EVENTS}
+            )},
+            {'$out': output},
+        ]
+        return hot, pipeline
+
+    def rebuild(self):
+        # Aggregates into a staging collection and swaps it in, so readers never see
+        # a half-built rollup. Changes recorded while the pipeline runs are lost
+        # from the rebuilt copy; run it when writes are quiet. Needs MongoDB 4.4+
+        # for $unionWith over the history collection.
+        database = self.rollups.database
+        staging_name = f'{self.rollups.name}_rebuild'
+        database[staging_name].drop()
+        hot, pipeline = self.rebuild_pipeline(staging_name)
+        hot.aggregate(pipeline, allowDiskUse=True)
+        staging = database[staging_name]
+        ensure_collection_indexes(staging, registry_name=self.rollups.name)
+        documents = staging.estimated_document_count()
+        staging.rename(self.rollups.name, dropTarget=True)
+        return {'rollup_documents': documents}
+
+    def stats(self, period, dimension, start=None, end=None, by='bucket', top=None, limit=None):
+        # Reads only the rollup documents of one period/dimension in [start, end];
+        # limit caps the by=bucket rows
+        query = {'period': period, 'dimension': dimension}
+        if start or end:
+            query['bucket'] = {}
+            if start:
+                query['bucket']['$gte'] = start
+            if end:
+                query['bucket']['$lte'] = end
+        counts = {event: {'$sum': f'${event}'} for event in ROLLUP_EVENTS}
+        if by == 'key':
+            pipeline = [
+                {'$match': query},
+                {'$group': dict({'_id': '$key', 'inv_name': {'$last': '$inv_name'}}, **counts)},
+                {'$sort': {'created': -1, '_id': 1}},
+            ]
+            if top:
+                pipeline.append({'$limit': top})
+            pipeline.append({'$project': dict({'_id': 0, 'key': '$_id', 'inv_name': 1},
+                                              **{event: 1 for event in ROLLUP_EVENTS})})
+            return list(self.rollups.aggregate(pipeline))
+        rows = self.rollups.find(query, {'_id': 0, 'period': 0, 'dimension': 0}).sort([('bucket', 1), ('key', 1)])
+        if limit:
+            rows = rows.limit(limit)
+        return [dict({event: 0 for event in ROLLUP_EVENTS}, **row) for row in rows]
@@ -1,20 +1,23 @@
-from flask import Flask, request
-from flask_restx import Api, Resource, fields, reqparse, abort
-from pymongo import MongoClient
+from flask import request
+from flask_restx import Namespace, Resource, fields, reqparse, abort
 from bson.objectid import ObjectId
-from flasgger import Swagger
 import datetime
-import csv, os, random, string
+import os, random, string
 from bson import json_util
 from werkzeug.datastructures import FileStorage
+from indexes import ensure_collection_indexes, index_report
+from csv_ingest import (DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE, ReloadFailed, clamp_batch_size, iter_csv_rows,
+                        reload_collection)
+from mongo import get_database, mongo_health
+from pagination import InvalidPageRequest, page_limit, page_number
+from metrics import metrics_response
+from app_factory import build_app
+import config
 
 
 
-app = Flask(__name__)
-swagger = Swagger(app)
-api = Api(app, version='1.0', title='Reservation API', description='API for Reservation Management')
-mongo_client = MongoClient('mongodb://localhost:27017/')
-db = mongo_client['reservationsample3_db3']
+api = Namespace('reservations', path='/', description='Reservation CSV uploads and listings')
+db = get_database('reservationsample3_db3')
 collection = db['reservations']
 
 UPLOAD_FOLDER = 'uploads'
@@ -59,6 +62,13 @@ class UploadCSV(Resource):
 
 upload_parser = reqparse.RequestParser()
 upload_parser.add_argument('file', location='files', type=FileStorage, required=True)
+upload_parser.add_argument('batch_size', location='args', type=int, default=DEFAULT_BATCH_SIZE,
+                           help=f'Rows per insert_many batch (max {MAX_BATCH_SIZE})')
+
+def build_staging_indexes(staging):
+    _, failed = ensure_collection_indexes(staging, registry_name=collection.name)
+    if failed:
+        raise ReloadFailed('Could not build indexes on the staging collection', failed)
 
 @api.route('/inventory/upload')
 class UploadCSV(Resource):
@@ -66,16 +76,16 @@ class UploadCSV(Resource):
     def post(self):
         args = upload_parser.parse_args()
         uploaded_file = args['file']
+        batch_size = clamp_batch_size(args.get('batch_size'))
 
         try:
-            collection.delete_many({})  # Delete existing data
-            data = csv.DictReader(uploaded_file.stream.read().decode('utf-8').splitlines())
-            inserted_ids = []
-            for row in data:
-                result = collection.insert_one(row)
-                inserted_ids.append(str(result.inserted_id))
-            
-            return {'message': 'Data uploaded successfully', 'inserted_ids': inserted_ids}, 200
+            # Replace the existing data: the CSV is loaded into a staging collection
+            # and swapped in atomically, so readers never see a partial collection
+            summary = reload_collection(db, collection.name, iter_csv_rows(uploaded_file.stream),
+                                        batch_size, prepare=build_staging_indexes)
+            return {'message': 'Data uploaded successfully', **summary}, 200
+        except ReloadFailed as e:
+            return {'error': f'An error occurred while uploading data: {e}', 'errors': e.errors}, 500
         except Exception as e:
             return {'error': 'An error occurred while uploading data'}, 500
 
@@ -99,23 +109,19 @@ reservation_model = api.model('Reservation', {
 class Reservations(Resource):
     @api.doc(params={'page': 'Page number', 'limit': 'Reservations per page'}, description='View all reservations')
     def get(self):
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 5))
+        try:
+            page = page_number(request.args.get('page'))
+            limit = page_limit(request.args.get('limit'), 5)
+        except InvalidPageRequest as e:
+            return {'message': str(e)}, 400
 
         total_reservations = collection.count_documents({})
 
-        if page < 1:
-            page = 1
-
         skip = (page - 1) * limit
 
+        # _id and dates are encoded by the JSON representation
         reservations = list(collection.find({}).skip(skip).limit(limit))
 
-        for reservation in reservations:
-            reservation['_id'] = str(reservation['_id'])
-            #reservation['Reservation_created_date'] = reservation['Reservation_created_date'].isoformat()
-            #reservation['Reservation_expiry_date'] = reservation['Reservation_expiry_date'].isoformat()
-
         return {
             'page': page,
             'limit': limit,
@@ -130,7 +136,6 @@ class Reservation(Resource):
     def get(self, reservation_id):
         reservation = collection.find_one({'reservation_id': int(reservation_id)})
         if reservation:
-            reservation['_id'] = str(reservation['_id'])
             return {'reservation': reservation} 
         return {'message': 'Reservation not found'}, 404
     
@@ -213,5 +218,35 @@ class CreateReservation(Resource):
             return {'message': 'Reservation creation failed'}, 500
 
 
+@api.route('/admin/indexes')
+class IndexStats(Resource):
+    @api.doc(description='Index usage statistics for the collections this service queries')
+    def get(self):
+        try:
+            return index_report(db), 200
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+
+
+@api.route('/health')
+class Health(Resource):
+    @api.doc(description='MongoDB reachability and connection pool utilisation')
+    def get(self):
+        health = mongo_health()
+        return health, 200 if health['status'] == 'ok' else 503
+
+
+@api.route('/metrics')
+class Metrics(Resource):
+    @api.doc(description='Request, stage, MongoDB and outbound HTTP latency histograms (Prometheus text format)')
+    def get(self):
+        return metrics_response()
+
+
+def create_app(app_config=None):
+    return build_app(__name__, api, 'reservation-app', 'Reservation API', 'API for Reservation Management',
+                     databases=[db], app_config=app_config, swagger=True)
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(host=config.SERVER_HOST, port=config.APP_PORT, debug=config.SERVER_DEBUG)
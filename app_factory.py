@@ -0,0 +1,34 @@
+from flask import Flask
+from flask_restx import Api
+
+import config
+from indexes import ensure_indexes
+from logs import configure_logging, init_request_logging
+from metrics import instrument_app
+from serialisation import use_bson_json
+
+
+def build_app(import_name, namespace, service, title, description, databases=(), app_config=None, swagger=False):
+    """Flask app serving one service's namespace, with the shared logging, metrics and JSON setup.
+
+    Service modules only declare their routes on a Namespace when imported; the
+    app, the API docs and index creation are built here, once per create_app().
+    app_config is applied to app.config and may set ENSURE_INDEXES.
+    """
+    app = Flask(import_name)
+    app.config.update(app_config or {})
+    if swagger and config.API_DOCS_ENABLED:
+        # flasgger pulls in jsonschema, yaml and mistune; only import it when the docs are served
+        from flasgger import Swagger
+        Swagger(app)
+    api = Api(app, version='1.0', title=title, description=description,
+              doc='/' if config.API_DOCS_ENABLED else False)
+    api.add_namespace(namespace)
+    instrument_app(app, service)
+    configure_logging()
+    init_request_logging(app)
+    use_bson_json(app, api)
+    if app.config.get('ENSURE_INDEXES', config.ENSURE_INDEXES_ON_STARTUP):
+        for database in databases:
+            ensure_indexes(database)
+    return app
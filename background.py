@@ -0,0 +1,94 @@
+import datetime
+import logging
+import os
+import random
+import socket
+import threading
+import time
+
+from pymongo.errors import DuplicateKeyError
+
+from metrics import endpoint_scope
+
+logger = logging.getLogger(__name__)
+
+
+class Lease:
+    """A named lock document with an expiry, so only one worker runs a job at a time."""
+
+    def __init__(self, collection, name, ttl):
+        self.collection = collection
+        self.name = name
+        self.ttl = ttl
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{id(self)}'
+
+    def acquire(self):
+        now = datetime.datetime.utcnow()
+        try:
+            # Take the lease if it is free, expired or already ours; otherwise the
+            # upsert collides with the holder's document on _id.
+            self.collection.find_one_and_update(
+                {'_id': self.name, '$or': [{'expires_at': {'$lt': now}}, {'owner': self.owner}]},
+                {'$set': {'owner': self.owner, 'expires_at': now + datetime.timedelta(seconds=self.ttl)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def release(self):
+        self.collection.update_one(
+            {'_id': self.name, 'owner': self.owner},
+            {'$set': {'expires_at': datetime.datetime.utcnow()}}
+        )
+
+
+class PeriodicJob:
+    """Runs job() on a daemon thread every interval seconds plus random jitter."""
+
+    def __init__(self, name, job, interval, jitter=0.0, lease=None):
+        self.name = name
+        self.job = job
+        self.interval = interval
+        self.jitter = jitter
+        self.lease = lease
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def run_once(self):
+        # Returns the job's result, or None when another worker holds the lease
+        if self.lease and not self.lease.acquire():
+            return None
+        try:
+            with endpoint_scope(f'job {self.name}'):
+                return self.job()
+        finally:
+            if self.lease:
+                self.lease.release()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval + random.uniform(0, self.jitter)):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Background job %s failed', self.name)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 3)
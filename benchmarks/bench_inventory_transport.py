@@ -0,0 +1,102 @@
+"""Per-call cost of the reservation service's inventory operations, over HTTP and in-process.
+
+    python benchmarks/bench_inventory_transport.py [--items 1000] [--calls 2000] [--batch 100]
+
+Needs the MongoDB at MONGO_URI. Seeds --items inventory items with a bench- prefix
+into inventory_db (removed again at the end), serves prj1.create_app() on a local port for
+the HTTP transport and calls prj1's data layer directly for the local one.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.serving import make_server
+
+import prj1
+from inventory_transport import HTTPInventoryTransport, LocalInventoryTransport
+from service_client import ServiceClient
+
+ID_PREFIX = 'bench-transport-'
+
+
+def seed(count):
+    prj1.collection.delete_many({'inv_id': {'$regex': f'^{ID_PREFIX}'}})
+    prj1.collection.insert_many([
+        {
+            'inv_id': f'{ID_PREFIX}{index:06d}',
+            'inv_name': f'Benchmark item {index}',
+            'inv_description': 'Seeded by bench_inventory_transport.py',
+            'inv_type': 'Book',
+            'inv_blob': '',
+            'inv_logo': '',
+            'inv_archive_status': True,
+            'inv_copies': 1000000,
+        }
+        for index in range(count)
+    ])
+    return [f'{ID_PREFIX}{index:06d}' for index in range(count)]
+
+
+def serve(app):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def reserve_and_release(transport, inv_id):
+    transport.reserve(inv_id, 1)
+    transport.release(inv_id, 1)
+
+
+def measure(call, calls):
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return statistics.mean(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=100, help='inv_ids per batch lookup')
+    args = parser.parse_args()
+
+    inv_ids = seed(args.items)
+    server = serve(prj1.create_app({'ENSURE_INDEXES': False}))
+    transports = [
+        HTTPInventoryTransport(ServiceClient(f'http://127.0.0.1:{server.server_port}', retries=0)),
+        LocalInventoryTransport(prj1),
+    ]
+    operations = [
+        ('record', lambda transport: transport.record(random.choice(inv_ids))),
+        (f'records x{args.batch}', lambda transport: transport.records(random.sample(inv_ids, args.batch))),
+        ('reserve + release', lambda transport: reserve_and_release(transport, random.choice(inv_ids))),
+    ]
+    try:
+        print(f'{args.calls} calls per row, {args.items} seeded items')
+        for name, operation in operations:
+            baseline = None
+            for transport in transports:
+                # Warm the connection pool and the server before timing
+                measure(lambda: operation(transport), min(50, args.calls))
+                mean, p99 = measure(lambda: operation(transport), args.calls)
+                baseline = baseline or mean
+                print(f'{name:<18} {transport.name:<6} mean {mean * 1e6:9.1f} us  p99 {p99 * 1e6:9.1f} us  '
+                      f'{baseline / mean:5.1f}x')
+    finally:
+        server.shutdown()
+        prj1.collection.delete_many({'inv_id': {'$regex': f'^{ID_PREFIX}'}})
+
+
+if __name__ == '__main__':
+    main()
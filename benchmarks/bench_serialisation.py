@@ -0,0 +1,104 @@
+"""Per-record cost of encoding a 10k-reservation page.
+
+    python benchmarks/bench_serialisation.py [--records 10000] [--repeat 5]
+
+"before" is what /reservation/view did: convert the date fields in a Python loop,
+then json.dumps. The other rows encode the raw documents in one pass through
+serialisation.py, with the standard library encoder and with orjson if installed.
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+
+import serialisation
+
+DATE_FIELDS = ('Reservation_created_date', 'Reservation_expiry_date', 'Reservation_closed_date')
+
+
+def make_documents(count):
+    created = datetime.datetime(2024, 1, 1, 9, 30, 15, 123000)
+    return [
+        {
+            '_id': ObjectId(),
+            'reservation_id': f'R{index:010d}',
+            'Reserved_user': f'user{index % 500}',
+            'Reserved_user_email': f'user{index % 500}@example.com',
+            'Reservation_created_date': created + datetime.timedelta(minutes=index),
+            'Reservation_expiry_date': created + datetime.timedelta(days=30, minutes=index),
+            'Reservation_closed_date': created + datetime.timedelta(days=12, minutes=index),
+            'inv_id': f'INV{index % 2000:06d}',
+            'inv_name': 'The Pragmatic Programmer',
+            'inv_description': 'From journeyman to master',
+            'inv_type': 'Book',
+            'inv_blob': '',
+            'inv_archive_status': 'Active',
+            'inv_copies': 1,
+            'late_fee': Decimal128('1.50'),
+            'Reservation_status': 'Returned',
+            'Reservation_status_comments': 'Requesed and approved',
+        }
+        for index in range(count)
+    ]
+
+
+def before(documents):
+    for item in documents:
+        item['_id'] = str(item['_id'])
+        item['late_fee'] = str(item['late_fee'].to_decimal())
+        for field in DATE_FIELDS:
+            if field in item:
+                item[field] = item[field].isoformat()
+    return json.dumps({'data': documents}).encode('utf-8')
+
+
+def stdlib_one_pass(documents):
+    return json.dumps({'data': documents}, default=serialisation.bson_default, separators=(',', ':')).encode('utf-8')
+
+
+def fast_one_pass(documents):
+    return serialisation.dumps_bytes({'data': documents})
+
+
+def measure(encode, documents, repeat):
+    best = None
+    for _ in range(repeat):
+        # The old path mutates its input, so every run gets fresh documents
+        page = copy.deepcopy(documents)
+        started = time.perf_counter()
+        encode(page)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    documents = make_documents(args.records)
+    rows = [('before: loop + json.dumps', before), ('after: one pass, json', stdlib_one_pass)]
+    if serialisation.backend() == 'orjson':
+        rows.append(('after: one pass, orjson', fast_one_pass))
+
+    baseline = None
+    print(f'{args.records} records, best of {args.repeat}')
+    for name, encode in rows:
+        elapsed = measure(encode, documents, args.repeat)
+        baseline = baseline or elapsed
+        per_record_us = elapsed / args.records * 1e6
+        print(f'{name:<28} {elapsed * 1000:9.2f} ms  {per_record_us:7.2f} us/record  {baseline / elapsed:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
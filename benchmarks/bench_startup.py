@@ -0,0 +1,70 @@
+"""Import, create_app() and first-request latency of each service, in fresh interpreters.
+
+    python benchmarks/bench_startup.py [--runs 5] [--ensure-indexes] [--modules app prj1 prj2]
+
+Every run starts a new Python process, so nothing is cached between runs. The
+first requests go through Flask's test client: /metrics (no MongoDB access) and
+/swagger.json (the API spec, built on first use). Background jobs are switched
+off in the child processes. Index creation is off too unless --ensure-indexes is
+given, which needs the MongoDB at MONGO_URI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = '''
+import importlib, json, sys, time
+started = time.perf_counter()
+module = importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+app = module.create_app()
+created = time.perf_counter()
+client = app.test_client()
+client.get('/metrics')
+first_request = time.perf_counter()
+client.get('/swagger.json')
+spec = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_request': first_request - created,
+    'swagger_json': spec - first_request,
+}))
+'''
+
+PHASES = ('import', 'create_app', 'first_request', 'swagger_json')
+
+
+def run_once(module, ensure_indexes):
+    env = dict(os.environ,
+               INVENTORY_REPLICA_ENABLED='false',
+               EXPIRY_SWEEP_ENABLED='false',
+               HISTORY_ARCHIVE_ENABLED='false',
+               ENSURE_INDEXES_ON_STARTUP='true' if ensure_indexes else 'false')
+    output = subprocess.run([sys.executable, '-c', CHILD, module], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--ensure-indexes', action='store_true')
+    parser.add_argument('--modules', nargs='+', default=['app', 'prj1', 'prj2'])
+    args = parser.parse_args()
+
+    print(f'median of {args.runs} fresh processes, ms')
+    print(f'{"module":<8}' + ''.join(f'{phase:>15}' for phase in PHASES) + f'{"total":>15}')
+    for module in args.modules:
+        runs = [run_once(module, args.ensure_indexes) for _ in range(args.runs)]
+        medians = [statistics.median(run[phase] for run in runs) * 1000 for phase in PHASES]
+        print(f'{module:<8}' + ''.join(f'{value:15.1f}' for value in medians) + f'{sum(medians):15.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Stops calling a dependency that keeps failing or answering slowly.
+
+    Closed: calls go through and the last `window` outcomes are kept. Once at least
+    `min_calls` are recorded and the failure or slow-call rate reaches its threshold,
+    the breaker opens. Open: calls are refused for `open_seconds`. Half-open: up to
+    `half_open_calls` probes go through; all of them succeeding closes the breaker,
+    any failure or slow probe opens it again.
+    """
+
+    def __init__(self, name, failure_rate=0.5, slow_call_seconds=2.0, slow_call_rate=0.5, window=20,
+                 min_calls=10, open_seconds=15.0, half_open_calls=3, on_transition=None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        # on_transition(name, old_state, new_state)
+        self.on_transition = on_transition
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        self._counters = {'rejected': 0, 'opened': 0}
+
+    def _transition(self, state):
+        previous, self.state = self.state, state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self._counters['opened'] += 1
+        elif state == HALF_OPEN:
+            self._probes = self._probe_successes = 0
+        else:
+            self._outcomes.clear()
+        if self.on_transition:
+            self.on_transition(self.name, previous, state)
+
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() < self._opened_at + self.open_seconds:
+                    self._counters['rejected'] += 1
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self._counters['rejected'] += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def retry_after(self):
+        with self._lock:
+            if self.state != OPEN:
+                return 0
+            return max(0, round(self._opened_at + self.open_seconds - time.monotonic(), 3))
+
+    def record(self, elapsed, failed=False):
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._transition(OPEN)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self._transition(CLOSED)
+                return
+            if self.state == OPEN:
+                # A call that started before the breaker opened
+                return
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for failed_call, _ in self._outcomes if failed_call)
+            slow_calls = sum(1 for _, slow_call in self._outcomes if slow_call)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate:
+                self._transition(OPEN)
+
+    def snapshot(self):
+        with self._lock:
+            calls = len(self._outcomes)
+            return dict(
+                self._counters,
+                state=self.state,
+                window_calls=calls,
+                window_failures=sum(1 for failed, _ in self._outcomes if failed),
+                window_slow=sum(1 for _, slow in self._outcomes if slow),
+            )
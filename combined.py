@@ -0,0 +1,30 @@
+"""Inventory and reservation APIs in one WSGI application, for small deployments.
+
+    gunicorn 'combined:create_application()'        (or: python combined.py)
+
+The reservation API is served at / and the inventory API under
+COMBINED_INVENTORY_PREFIX (default /inventory-api). The reservation service then
+calls the inventory data layer in-process instead of over HTTP, unless
+INVENTORY_TRANSPORT=http is set. Split deployments keep running prj1.py and
+prj2.py on their own.
+"""
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+import config
+from inventory_transport import set_default_transport
+
+set_default_transport('local')
+
+import prj1
+import prj2
+
+
+def create_application(app_config=None):
+    return DispatcherMiddleware(prj2.create_app(app_config),
+                                {config.COMBINED_INVENTORY_PREFIX: prj1.create_app(app_config)})
+
+
+if __name__ == '__main__':
+    from werkzeug.serving import run_simple
+    run_simple(config.SERVER_HOST, config.COMBINED_PORT, create_application(),
+               use_debugger=config.SERVER_DEBUG, use_reloader=config.SERVER_DEBUG, threaded=True)
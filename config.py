@@ -0,0 +1,126 @@
+import json
+import os
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+def env_str(name, default):
+    return os.environ.get(name) or default
+
+
+def env_json(name, default):
+    value = os.environ.get(name)
+    return json.loads(value) if value else default
+
+
+# MongoDB
+MONGO_URI = env_str('MONGO_URI', 'mongodb://localhost:27017/')
+MONGO_MAX_POOL_SIZE = env_int('MONGO_MAX_POOL_SIZE', 100)
+MONGO_MIN_POOL_SIZE = env_int('MONGO_MIN_POOL_SIZE', 0)
+MONGO_CONNECT_TIMEOUT_MS = env_int('MONGO_CONNECT_TIMEOUT_MS', 5000)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)
+MONGO_SOCKET_TIMEOUT_MS = env_int('MONGO_SOCKET_TIMEOUT_MS', 0)  # 0 means no timeout
+
+# Inter-service HTTP
+INVENTORY_API_URL = env_str('INVENTORY_API_URL', 'http://10.20.100.30:5001')
+RESERVATION_API_URL = env_str('RESERVATION_API_URL', 'http://127.0.0.1:5002')
+HTTP_POOL_SIZE = env_int('HTTP_POOL_SIZE', 20)
+HTTP_CONNECT_TIMEOUT = env_float('HTTP_CONNECT_TIMEOUT', 2.0)
+HTTP_READ_TIMEOUT = env_float('HTTP_READ_TIMEOUT', 10.0)
+HTTP_RETRIES = env_int('HTTP_RETRIES', 2)
+HTTP_RETRY_BACKOFF = env_float('HTTP_RETRY_BACKOFF', 0.2)
+
+# How the reservation service reaches the inventory service: 'http' (split
+# deployments) or 'local' (in-process, both APIs in one app). Unset means http,
+# except in combined.py where it means local.
+INVENTORY_TRANSPORT = env_str('INVENTORY_TRANSPORT', '')
+# Where combined.py mounts the inventory API; the reservation API is served at /
+COMBINED_INVENTORY_PREFIX = env_str('COMBINED_INVENTORY_PREFIX', '/inventory-api')
+
+# Development server used by `python prj1.py` / `prj2.py` / `app.py` / `combined.py`;
+# production runs the create_app() factories under a WSGI server instead
+SERVER_HOST = env_str('SERVER_HOST', '127.0.0.1')
+INVENTORY_PORT = env_int('INVENTORY_PORT', 5001)
+RESERVATION_PORT = env_int('RESERVATION_PORT', 5002)
+APP_PORT = env_int('APP_PORT', 5000)
+COMBINED_PORT = env_int('COMBINED_PORT', 5000)
+SERVER_DEBUG = env_str('SERVER_DEBUG', 'false').lower() == 'true'
+
+# Circuit breaker per downstream service: opens when, over the last CIRCUIT_WINDOW
+# calls (at least CIRCUIT_MIN_CALLS), the failure or slow-call rate reaches its limit
+CIRCUIT_BREAKER_ENABLED = env_str('CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
+CIRCUIT_FAILURE_RATE = env_float('CIRCUIT_FAILURE_RATE', 0.5)
+CIRCUIT_SLOW_CALL_SECONDS = env_float('CIRCUIT_SLOW_CALL_SECONDS', 2.0)
+CIRCUIT_SLOW_CALL_RATE = env_float('CIRCUIT_SLOW_CALL_RATE', 0.5)
+CIRCUIT_WINDOW = env_int('CIRCUIT_WINDOW', 20)
+CIRCUIT_MIN_CALLS = env_int('CIRCUIT_MIN_CALLS', 10)
+CIRCUIT_OPEN_SECONDS = env_float('CIRCUIT_OPEN_SECONDS', 15.0)
+CIRCUIT_HALF_OPEN_CALLS = env_int('CIRCUIT_HALF_OPEN_CALLS', 3)
+
+# Inventory cache inside the reservation service
+INVENTORY_CACHE_TTL = env_float('INVENTORY_CACHE_TTL', 30.0)
+INVENTORY_CACHE_MAX_ENTRIES = env_int('INVENTORY_CACHE_MAX_ENTRIES', 10000)
+# Expired records are still served (and refreshed in the background) for this long
+INVENTORY_CACHE_STALE_TTL = env_float('INVENTORY_CACHE_STALE_TTL', 600.0)
+
+# Local inventory replica inside the reservation service: followed through a change
+# stream on inventory_db when the server supports it, otherwise by polling
+# /inventory/changes every INVENTORY_REPLICA_INTERVAL seconds
+INVENTORY_REPLICA_ENABLED = env_str('INVENTORY_REPLICA_ENABLED', 'true').lower() == 'true'
+INVENTORY_REPLICA_CHANGE_STREAM = env_str('INVENTORY_REPLICA_CHANGE_STREAM', 'true').lower() == 'true'
+INVENTORY_REPLICA_INTERVAL = env_float('INVENTORY_REPLICA_INTERVAL', 2.0)
+INVENTORY_REPLICA_BATCH_SIZE = env_int('INVENTORY_REPLICA_BATCH_SIZE', 1000)
+INVENTORY_REPLICA_VERSION_OVERLAP = env_int('INVENTORY_REPLICA_VERSION_OVERLAP', 100)
+INVENTORY_REPLICA_WATCH_SECONDS = env_float('INVENTORY_REPLICA_WATCH_SECONDS', 30.0)
+INVENTORY_REPLICA_LEASE_TTL = env_float('INVENTORY_REPLICA_LEASE_TTL', 120.0)
+
+# Monthly reservation quota: limit per user class, and the class of each user
+# (users not listed fall into "default")
+RESERVATION_QUOTA_LIMITS = env_json('RESERVATION_QUOTA_LIMITS', {'default': 3})
+RESERVATION_QUOTA_USER_CLASSES = env_json('RESERVATION_QUOTA_USER_CLASSES', {})
+
+# Background sweeper that expires reservations past Reservation_expiry_date
+EXPIRY_SWEEP_ENABLED = env_str('EXPIRY_SWEEP_ENABLED', 'true').lower() == 'true'
+EXPIRY_SWEEP_INTERVAL = env_float('EXPIRY_SWEEP_INTERVAL', 300.0)
+EXPIRY_SWEEP_JITTER = env_float('EXPIRY_SWEEP_JITTER', 30.0)
+EXPIRY_SWEEP_BATCH_SIZE = env_int('EXPIRY_SWEEP_BATCH_SIZE', 500)
+EXPIRY_SWEEP_MAX_BATCHES = env_int('EXPIRY_SWEEP_MAX_BATCHES', 20)
+EXPIRY_SWEEP_LEASE_TTL = env_float('EXPIRY_SWEEP_LEASE_TTL', 600.0)
+
+# Moving long-finished reservations from reservation12 to reservation_history
+HISTORY_ARCHIVE_ENABLED = env_str('HISTORY_ARCHIVE_ENABLED', 'true').lower() == 'true'
+HISTORY_ARCHIVE_MIN_AGE_DAYS = env_float('HISTORY_ARCHIVE_MIN_AGE_DAYS', 30.0)
+HISTORY_ARCHIVE_INTERVAL = env_float('HISTORY_ARCHIVE_INTERVAL', 3600.0)
+HISTORY_ARCHIVE_JITTER = env_float('HISTORY_ARCHIVE_JITTER', 300.0)
+HISTORY_ARCHIVE_BATCH_SIZE = env_int('HISTORY_ARCHIVE_BATCH_SIZE', 1000)
+HISTORY_ARCHIVE_MAX_BATCHES = env_int('HISTORY_ARCHIVE_MAX_BATCHES', 50)
+HISTORY_ARCHIVE_LEASE_TTL = env_float('HISTORY_ARCHIVE_LEASE_TTL', 1800.0)
+
+# Latency histograms served at /metrics
+METRICS_ENABLED = env_str('METRICS_ENABLED', 'true').lower() == 'true'
+
+# Application factories (create_app): Swagger UIs and startup index creation can be
+# switched off for workers and tests that do not need them
+API_DOCS_ENABLED = env_str('API_DOCS_ENABLED', 'true').lower() == 'true'
+ENSURE_INDEXES_ON_STARTUP = env_str('ENSURE_INDEXES_ON_STARTUP', 'true').lower() == 'true'
+
+# Logging: root level, per-logger overrides such as {"prj2": "DEBUG", "pymongo": "WARNING"},
+# "json" or "text" output, and the share of requests whose debug traces are kept.
+# Clients can only ask for a trace with X-Trace: 1 where LOG_TRACE_HEADER_ENABLED is
+# set, e.g. behind a gateway that strips the header from outside requests.
+LOG_LEVEL = env_str('LOG_LEVEL', 'INFO')
+LOG_LEVELS = env_json('LOG_LEVELS', {})
+LOG_FORMAT = env_str('LOG_FORMAT', 'json')
+LOG_TRACE_SAMPLE_RATE = env_float('LOG_TRACE_SAMPLE_RATE', 0.0)
+LOG_TRACE_HEADER_ENABLED = env_str('LOG_TRACE_HEADER_ENABLED', 'false').lower() == 'true'
+
+# Reservation listings whose filter/sort no index serves: "reject" (400) or "warn"
+RESERVATION_LISTING_UNINDEXED = env_str('RESERVATION_LISTING_UNINDEXED', 'reject')
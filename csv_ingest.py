@@ -0,0 +1,140 @@
+import codecs
+import csv
+
+from bson.objectid import ObjectId
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+# Only the first few write errors of a failed batch are echoed back to the client
+MAX_REPORTED_ERRORS = 10
+
+
+def iter_csv_rows(stream, encoding='utf-8-sig'):
+    # Decode the upload incrementally instead of reading the whole file into memory.
+    # The codecs reader keeps line endings, so quoted multi-line fields still parse.
+    reader = codecs.getreader(encoding)(stream)
+    return csv.DictReader(reader)
+
+
+def normalise_header(name):
+    # "\r\nreservation_created_date\r\n" and "Reservation Created Date" both become "reservation_created_date"
+    return '_'.join((name or '').split()).lower()
+
+
+def iter_chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def clamp_batch_size(value, default=DEFAULT_BATCH_SIZE):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(value, MAX_BATCH_SIZE))
+
+
+class BatchWriter:
+    """Buffers documents for one collection and writes them as unordered insert_many batches."""
+
+    def __init__(self, collection, batch_size=DEFAULT_BATCH_SIZE, name=None, on_written=None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.name = name or collection.name
+        # Called with the documents of each batch that actually reached the collection
+        self.on_written = on_written
+        self.buffer = []
+        self.inserted = 0
+        self.batches = 0
+        self.errors = []
+
+    def add(self, document):
+        self.buffer.append(document)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        self.batches += 1
+        try:
+            result = self.collection.insert_many(batch, ordered=False)
+            self.inserted += len(result.inserted_ids)
+            if self.on_written:
+                self.on_written(batch)
+        except BulkWriteError as e:
+            details = e.details or {}
+            inserted = details.get('nInserted', 0)
+            self.inserted += inserted
+            if self.on_written:
+                failed = {error.get('index') for error in details.get('writeErrors', [])}
+                self.on_written([document for index, document in enumerate(batch) if index not in failed])
+            self.errors.append({
+                'collection': self.name,
+                'batch': self.batches,
+                'size': len(batch),
+                'inserted': inserted,
+                'errors': [
+                    {'index': error.get('index'), 'code': error.get('code'), 'message': error.get('errmsg')}
+                    for error in details.get('writeErrors', [])[:MAX_REPORTED_ERRORS]
+                ],
+            })
+        except PyMongoError as e:
+            self.errors.append({
+                'collection': self.name,
+                'batch': self.batches,
+                'size': len(batch),
+                'inserted': 0,
+                'errors': [{'message': str(e)}],
+            })
+
+    def summary(self):
+        return {
+            'inserted': self.inserted,
+            'batches': self.batches,
+            'failed_batches': len(self.errors),
+        }
+
+
+class ReloadFailed(Exception):
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def reload_collection(db, collection_name, documents, batch_size=DEFAULT_BATCH_SIZE, prepare=None):
+    # Load everything into a staging collection, let prepare() build its indexes,
+    # then swap it over the live collection with one renameCollection. Readers see
+    # the old data until the swap; on any failure the staging collection is dropped
+    # and the live collection is left untouched.
+    staging = db[f'{collection_name}_staging_{ObjectId()}']
+    writer = BatchWriter(staging, batch_size, name=collection_name)
+    total_rows = 0
+    try:
+        for document in documents:
+            writer.add(document)
+            total_rows += 1
+        writer.flush()
+        if writer.errors:
+            raise ReloadFailed('Some batches could not be written', writer.errors)
+        if not total_rows:
+            # An empty upload still replaces the live data
+            db.create_collection(staging.name)
+
+        if prepare:
+            prepare(staging)
+
+        staging.rename(collection_name, dropTarget=True)
+    except Exception:
+        staging.drop()
+        raise
+    return dict(writer.summary(), total_rows=total_rows)
@@ -0,0 +1,176 @@
+import datetime
+import threading
+import time
+from collections import Counter
+
+from bson.objectid import ObjectId
+
+from background import elapsed_ms
+
+# Statuses of reservations that still hold their copies
+ACTIVE_RESERVATION_STATUSES = ['Reserved', 'Issued']
+# Statuses whose copies are given back, possibly after a failed first attempt
+RELEASING_RESERVATION_STATUSES = ['Expired', 'Returned']
+
+# A copy release is recorded in Reservation_release_pending (the time it was
+# claimed) until it succeeds. Claims older than the lease count as abandoned.
+RELEASE_PENDING_LEASE = datetime.timedelta(minutes=5)
+# Written back when a release fails, so the next attempt may claim it at once
+RELEASE_RETRY_NOW = datetime.datetime(1970, 1, 1)
+
+
+def release_not_in_flight(now):
+    # Documents without a copy release some other caller is still working on
+    return {'$or': [{'Reservation_release_pending': None},
+                    {'Reservation_release_pending': {'$lt': now - RELEASE_PENDING_LEASE}}]}
+
+
+class ExpirySweeper:
+    """Marks reservations past Reservation_expiry_date as Expired and gives their copies back."""
+
+    def __init__(self, collection, release_copies, batch_size=500, max_batches=20, on_expired=None):
+        self.collection = collection
+        # release_copies({inv_id: count}) returns copies to the inventory in one call
+        self.release_copies = release_copies
+        # on_expired(reservations) is told about each batch this sweeper expired
+        self.on_expired = on_expired
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._lock = threading.Lock()
+        self._stats = {
+            'runs': 0,
+            'swept_total': 0,
+            'duration_ms_total': 0.0,
+            'last_run': None,
+        }
+
+    def sweep_batch(self, now):
+        # Walks the (Reservation_status, Reservation_expiry_date) index for one batch
+        candidates = [
+            reservation['reservation_id']
+            for reservation in self.collection.find(
+                {'Reservation_status': {'$in': ACTIVE_RESERVATION_STATUSES},
+                 'Reservation_expiry_date': {'$lt': now}},
+                {'_id': 0, 'reservation_id': 1}
+            ).sort('Reservation_expiry_date', 1).limit(self.batch_size)
+        ]
+        if not candidates:
+            return 0, Counter()
+
+        # Only documents this sweep actually flipped carry its batch id, so a
+        # concurrent return or a second sweeper cannot release the same copies twice.
+        sweep_batch = str(ObjectId())
+        self.collection.update_many(
+            {'reservation_id': {'$in': candidates}, 'Reservation_status': {'$in': ACTIVE_RESERVATION_STATUSES}},
+            {'$set': {
+                'Reservation_status': 'Expired',
+                'Reservation_status_comments': 'Reservation expired',
+                'Reservation_release_pending': now,
+                'Reservation_closed_date': now,
+                'Reservation_sweep_batch': sweep_batch,
+                'Reservation_release_batch': sweep_batch
+            }}
+        )
+        # The expiry itself is reported once, when the status flips; only the copy
+        # release is left to retry_batch if it fails
+        if self.on_expired:
+            expired = list(self.collection.find(
+                {'reservation_id': {'$in': candidates}, 'Reservation_sweep_batch': sweep_batch},
+                {'_id': 0, 'inv_id': 1, 'inv_copies': 1, 'inv_type': 1, 'inv_name': 1, 'Reserved_user': 1,
+                 'Reservation_closed_date': 1}
+            ))
+            if expired:
+                self.on_expired(expired)
+        return self.release_batch(candidates, sweep_batch)
+
+    def retry_batch(self, now):
+        # Expired or returned reservations whose copy release failed or was
+        # abandoned by an earlier sweep or return
+        candidates = [
+            reservation['reservation_id']
+            for reservation in self.collection.find(
+                {'Reservation_release_pending': {'$lt': now - RELEASE_PENDING_LEASE},
+                 'Reservation_status': {'$in': RELEASING_RESERVATION_STATUSES}},
+                {'_id': 0, 'reservation_id': 1}
+            ).limit(self.batch_size)
+        ]
+        if not candidates:
+            return 0, Counter()
+
+        release_batch = str(ObjectId())
+        self.collection.update_many(
+            {'reservation_id': {'$in': candidates}, 'Reservation_status': {'$in': RELEASING_RESERVATION_STATUSES},
+             'Reservation_release_pending': {'$lt': now - RELEASE_PENDING_LEASE}},
+            {'$set': {'Reservation_release_pending': now, 'Reservation_release_batch': release_batch}}
+        )
+        return self.release_batch(candidates, release_batch)
+
+    def release_batch(self, candidates, release_batch):
+        # Reservation_copies_released is only set once the copies are back; until
+        # then the release stays pending and a later run retries it
+        claimed = {'reservation_id': {'$in': candidates}, 'Reservation_release_batch': release_batch}
+        copies = Counter()
+        released = list(self.collection.find(
+            claimed, {'_id': 0, 'inv_id': 1, 'inv_copies': 1, 'Reservation_copies_released': 1}))
+        for reservation in released:
+            # An expired reservation returned later already gave its copies back
+            if reservation.get('inv_id') and not reservation.get('Reservation_copies_released'):
+                copies[reservation['inv_id']] += reservation.get('inv_copies') or 1
+        if copies:
+            try:
+                self.release_copies(dict(copies))
+            except Exception:
+                self.collection.update_many(claimed, {'$set': {'Reservation_release_pending': RELEASE_RETRY_NOW}})
+                raise
+        if released:
+            self.collection.update_many(claimed, {'$set': {'Reservation_copies_released': True},
+                                                  '$unset': {'Reservation_release_pending': ''}})
+        return len(released), copies
+
+    def run(self):
+        started = time.perf_counter()
+        now = datetime.datetime.utcnow()
+        swept = batches = 0
+        released = Counter()
+        error = None
+        try:
+            for _ in range(self.max_batches):
+                batch_swept, batch_copies = self.retry_batch(now)
+                if not batch_swept:
+                    break
+                batches += 1
+                swept += batch_swept
+                released.update(batch_copies)
+                if batch_swept < self.batch_size:
+                    break
+            for _ in range(self.max_batches):
+                batch_swept, batch_copies = self.sweep_batch(now)
+                if not batch_swept:
+                    break
+                batches += 1
+                swept += batch_swept
+                released.update(batch_copies)
+                if batch_swept < self.batch_size:
+                    break
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            run = {
+                'started_at': now.isoformat(),
+                'swept': swept,
+                'batches': batches,
+                'copies_released': sum(released.values()),
+                'duration_ms': elapsed_ms(started),
+                'error': error,
+            }
+            with self._lock:
+                self._stats['runs'] += 1
+                self._stats['swept_total'] += swept
+                self._stats['duration_ms_total'] += run['duration_ms']
+                self._stats['last_run'] = run
+        return run
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,108 @@
+import datetime
+import threading
+import time
+
+from pymongo.errors import BulkWriteError
+
+from background import elapsed_ms
+
+# Reservations in these states are finished and hold no copies
+TERMINAL_RESERVATION_STATUSES = ['Returned', 'Cancelled', 'Expired']
+DUPLICATE_KEY_ERROR = 11000
+
+
+class HistoryArchiver:
+    """Moves reservations that have been terminal for min_age out of the hot collection."""
+
+    def __init__(self, hot, history, min_age_days=30, batch_size=1000, max_batches=50):
+        self.hot = hot
+        self.history = history
+        self.min_age = datetime.timedelta(days=min_age_days)
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._lock = threading.Lock()
+        self._stats = {
+            'runs': 0,
+            'archived_total': 0,
+            'last_run': None,
+        }
+
+    def candidates_query(self, cutoff):
+        # Reservation_closed_date is stamped when a reservation becomes terminal;
+        # older documents fall back to their expiry date.
+        # A reservation whose copies are still being given back stays in the hot
+        # collection, where the expiry sweeper retries the release.
+        return {
+            'Reservation_status': {'$in': TERMINAL_RESERVATION_STATUSES},
+            'Reservation_release_pending': {'$exists': False},
+            '$or': [
+                {'Reservation_closed_date': {'$lt': cutoff}},
+                {'Reservation_closed_date': {'$exists': False}, 'Reservation_expiry_date': {'$lt': cutoff}},
+            ],
+        }
+
+    def archive_batch(self, cutoff):
+        documents = list(self.hot.find(self.candidates_query(cutoff)).limit(self.batch_size))
+        if not documents:
+            return 0
+
+        # Insert-then-delete keyed on _id: if a previous run died between the two
+        # steps, the re-insert hits duplicate keys (already archived) and the
+        # delete finishes the job, so every batch is safe to repeat.
+        failed = set()
+        try:
+            self.history.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            failed = {error['index'] for error in errors if error.get('code') != DUPLICATE_KEY_ERROR}
+            # Only a duplicate _id means the document is already archived; a clash on
+            # reservation_id with some other document must stay in the hot collection
+            duplicates = {error['index'] for error in errors if error.get('code') == DUPLICATE_KEY_ERROR}
+            if duplicates:
+                archived = {document['_id'] for document in self.history.find(
+                    {'_id': {'$in': [documents[index]['_id'] for index in duplicates]}}, {'_id': 1})}
+                failed.update(index for index in duplicates if documents[index]['_id'] not in archived)
+        archived_ids = [document['_id'] for index, document in enumerate(documents) if index not in failed]
+        if not archived_ids:
+            raise RuntimeError('No reservation in the batch could be written to history')
+        self.hot.delete_many({'_id': {'$in': archived_ids},
+                              'Reservation_status': {'$in': TERMINAL_RESERVATION_STATUSES}})
+        return len(archived_ids)
+
+    def run(self):
+        started = time.perf_counter()
+        now = datetime.datetime.utcnow()
+        cutoff = now - self.min_age
+        archived = batches = 0
+        error = None
+        try:
+            for _ in range(self.max_batches):
+                batch_archived = self.archive_batch(cutoff)
+                if not batch_archived:
+                    break
+                batches += 1
+                archived += batch_archived
+                if batch_archived < self.batch_size:
+                    break
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            run = {
+                'started_at': now.isoformat(),
+                'cutoff': cutoff.isoformat(),
+                'archived': archived,
+                'batches': batches,
+                'duration_ms': elapsed_ms(started),
+                'error': error,
+            }
+            with self._lock:
+                self._stats['runs'] += 1
+                self._stats['archived_total'] += archived
+                self._stats['last_run'] = run
+        return run
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
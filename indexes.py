@@ -0,0 +1,162 @@
+import logging
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# How long inventory deletions stay replayable through /inventory/changes
+TOMBSTONE_TTL_SECONDS = 7 * 24 * 3600
+
+# Declarative index registry: database -> collection -> [(keys, options)].
+# Each service applies the entries for its own database at startup; create_index
+# is a no-op for indexes that already exist, so applying it again is safe.
+# options['replaces'] names an older index on the same keys (MongoDB refuses a
+# second index with the same keys); it is dropped when the new one is built.
+INDEXES = {
+    'inventory_db': {
+        'inventory_items': [
+            # inv_id_1 is the plain index the keyset pagination used to create
+            ([('inv_id', ASCENDING)], {'name': 'inv_id_unique', 'unique': True, 'replaces': 'inv_id_1'}),
+            # /inventory/changes
+            ([('version', ASCENDING)], {'name': 'version'}),
+        ],
+        'inventory_tombstones': [
+            ([('version', ASCENDING)], {'name': 'version'}),
+            # Replicas that fall further behind than this resync from a snapshot
+            # (InventoryReplica.missed_deletions)
+            ([('deleted_at', ASCENDING)], {'name': 'deleted_at_ttl', 'expireAfterSeconds': TOMBSTONE_TTL_SECONDS}),
+        ],
+        'archived_inventory': [
+            ([('inv_id', ASCENDING)], {'name': 'inv_id_unique', 'unique': True}),
+        ],
+    },
+    'reservations_db': {
+        'reservation12': [
+            ([('reservation_id', ASCENDING)],
+             {'name': 'reservation_id_unique', 'unique': True, 'replaces': 'reservation_id_1'}),
+            # Duplicate-reservation check in CreateReservation.post
+            ([('Reserved_user', ASCENDING), ('inv_id', ASCENDING)], {'name': 'user_inv_id'}),
+            # The expiry sweeper uses reservation_listing's status_expiry_date_id
+            # History archiver
+            ([('Reservation_status', ASCENDING), ('Reservation_closed_date', ASCENDING)],
+             {'name': 'status_closed_date'}),
+            # Copy releases the expiry sweeper has to retry; only pending documents are indexed
+            ([('Reservation_release_pending', ASCENDING)],
+             {'name': 'release_pending',
+              'partialFilterExpression': {'Reservation_release_pending': {'$exists': True}}}),
+        ],
+        # Local copy of inventory_db.inventory_items kept by the inventory replica
+        'inventory_replica': [
+            ([('inv_id', ASCENDING)], {'name': 'inv_id_unique', 'unique': True}),
+        ],
+        'reservation_history': [
+            ([('reservation_id', ASCENDING)], {'name': 'reservation_id_unique', 'unique': True}),
+        ],
+        'usercounts': [
+            ([('Reserved_user', ASCENDING), ('counts.reservation_month', ASCENDING)], {'name': 'user_month'}),
+        ],
+        # Monthly quota counters; the unique index is what rejects an acquire past the limit
+        'reservation_quotas': [
+            ([('Reserved_user', ASCENDING), ('year', ASCENDING), ('month', ASCENDING)],
+             {'name': 'user_year_month_unique', 'unique': True}),
+        ],
+    },
+    'reservationsample3_db3': {
+        'reservations': [
+            # CSV uploads carry blank reservation_ids, so this one cannot be unique
+            ([('reservation_id', ASCENDING)], {'name': 'reservation_id'}),
+            # Monthly limit query in CreateReservation.post
+            ([('Reserved_user', ASCENDING), ('Reservation_created_date', ASCENDING)], {'name': 'user_created_date'}),
+        ],
+    },
+}
+
+
+# Indexes that are no longer registered and are dropped from existing deployments.
+# status_expiry_date is a prefix of reservation_listing's status_expiry_date_id.
+RETIRED_INDEXES = {
+    'reservations_db': {
+        'reservation12': ['status_expiry_date'],
+    },
+}
+
+
+def register_indexes(db_name, collection_name, *specs):
+    # Lets feature modules declare the indexes their queries rely on next to the code
+    INDEXES.setdefault(db_name, {}).setdefault(collection_name, []).extend(specs)
+
+
+def ensure_collection_indexes(collection, db_name=None, registry_name=None):
+    # registry_name builds another collection's indexes, e.g. on a staging copy before a swap
+    db_name = db_name or collection.database.name
+    created, failed = [], []
+    for keys, options in INDEXES.get(db_name, {}).get(registry_name or collection.name, []):
+        options = dict(options)
+        replaces = options.pop('replaces', None)
+        try:
+            if replaces and replaces in collection.index_information():
+                created.append(replace_index(collection, replaces, keys, options))
+            else:
+                created.append(collection.create_index(keys, **options))
+        except OperationFailure as e:
+            # Existing duplicates or a conflicting legacy index must not stop the service from booting
+            logger.warning('Could not create index %s on %s.%s: %s',
+                           options.get('name'), db_name, collection.name, e)
+            failed.append({'collection': collection.name, 'index': options.get('name'), 'error': str(e)})
+    if not failed:
+        # Only once every registered index exists, so nothing is left without the index replacing it
+        retired = RETIRED_INDEXES.get(db_name, {}).get(registry_name or collection.name, [])
+        existing = collection.index_information() if retired else {}
+        for name in retired:
+            if name in existing:
+                collection.drop_index(name)
+                logger.info('Dropped retired index %s on %s.%s', name, db_name, collection.name)
+    return created, failed
+
+
+def replace_index(collection, old_name, keys, options):
+    # The old index is put back if the new one cannot be built, e.g. because
+    # existing duplicates block a unique index
+    old_index = collection.index_information()[old_name]
+    collection.drop_index(old_name)
+    try:
+        return collection.create_index(keys, **options)
+    except OperationFailure:
+        collection.create_index(old_index['key'], name=old_name)
+        raise
+
+
+def ensure_indexes(db):
+    created, failed = [], []
+    for collection_name in INDEXES.get(db.name, {}):
+        collection_created, collection_failed = ensure_collection_indexes(db[collection_name], db.name)
+        created.extend(f'{collection_name}.{name}' for name in collection_created)
+        failed.extend(collection_failed)
+    return {'created': created, 'failed': failed}
+
+
+def index_report(db):
+    # $indexStats per registered collection, plus the server-wide collection scan counter
+    report = {'database': db.name, 'collections': {}}
+    for collection_name in INDEXES.get(db.name, {}):
+        stats = db[collection_name].aggregate([{'$indexStats': {}}])
+        report['collections'][collection_name] = [
+            {
+                'name': stat['name'],
+                'key': dict(stat['key']),
+                'ops': stat['accesses']['ops'],
+                'since': stat['accesses']['since'].isoformat(),
+            }
+            for stat in stats
+        ]
+    try:
+        query_executor = db.client.admin.command('serverStatus')['metrics']['queryExecutor']
+        report['query_executor'] = {
+            'scanned': query_executor.get('scanned'),
+            'scanned_objects': query_executor.get('scannedObjects'),
+            'collection_scans': dict(query_executor.get('collectionScans', {})),
+        }
+    except (OperationFailure, KeyError):
+        report['query_executor'] = None
+    return report
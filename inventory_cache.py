@@ -0,0 +1,266 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    # One in-progress load that concurrent misses for the same inv_id wait on
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.stale = False
+
+
+class InventoryCache:
+    """In-process inventory records keyed by inv_id, with TTL, LRU eviction and single-flight loads.
+
+    With a `stale_ttl`, an expired record is kept that much longer as the last known
+    good copy: reads return it straight away and refresh it in the background, and
+    a record that has to be reloaded (invalidated) falls back to it when the load
+    fails. `on_stale(inv_id, age)` is called whenever a stale record is returned.
+    """
+
+    def __init__(self, loader, batch_loader=None, ttl=30.0, max_entries=10000, stale_ttl=0.0, on_stale=None,
+                 refresh_workers=2):
+        self._loader = loader
+        self._batch_loader = batch_loader
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.on_stale = on_stale
+        self.refresh_workers = refresh_workers
+        self._refresher = None
+        # inv_id -> (record or None, expires_at, revalidate); revalidate entries are
+        # only served when reloading them fails
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'coalesced': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'errors': 0,
+            'stale_served': 0,
+            'stale_fallbacks': 0,
+            'background_refreshes': 0,
+        }
+
+    def _lookup(self, inv_id, now):
+        # Returns (found, record, stale age or None)
+        entry = self._entries.get(inv_id)
+        if entry is None:
+            return False, None, None
+        record, expires_at, revalidate = entry
+        if expires_at > now and not revalidate:
+            self._entries.move_to_end(inv_id)
+            return True, record, None
+        if expires_at + self.stale_ttl <= now:
+            del self._entries[inv_id]
+            return False, None, None
+        if revalidate or record is None:
+            return False, None, None
+        self._entries.move_to_end(inv_id)
+        return True, record, now - expires_at
+
+    def _stale_fallback(self, inv_id, now):
+        # Last known good record for an inv_id whose reload failed
+        entry = self._entries.get(inv_id)
+        if entry is None or entry[0] is None or entry[1] + self.stale_ttl <= now:
+            return False, None
+        self._counters['stale_fallbacks'] += 1
+        return True, entry[0]
+
+    def _store(self, inv_id, record, now):
+        # Unknown ids are cached as None too, so a bad id cannot hammer the inventory service
+        self._entries[inv_id] = (record, now + self.ttl, False)
+        self._entries.move_to_end(inv_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    @staticmethod
+    def _copy(record):
+        return dict(record) if record is not None else None
+
+    def _served_stale(self, inv_id, age):
+        if self.on_stale:
+            self.on_stale(inv_id, age)
+
+    def _refresh_in_background(self, inv_id):
+        # Called with the lock held; at most one refresh per inv_id runs at a time
+        if inv_id in self._flights:
+            return
+        self._flights[inv_id] = flight = _Flight()
+        self._counters['background_refreshes'] += 1
+        if self._refresher is None:
+            self._refresher = ThreadPoolExecutor(max_workers=self.refresh_workers,
+                                                 thread_name_prefix='inventory-cache-refresh')
+        self._refresher.submit(self._refresh, inv_id, flight)
+
+    def _refresh(self, inv_id, flight):
+        try:
+            flight.value = self._loader(inv_id)
+            with self._lock:
+                self._counters['refreshes'] += 1
+                if not flight.stale:
+                    self._store(inv_id, flight.value, time.monotonic())
+        except Exception as e:
+            # The stale record stays in place until its grace period runs out
+            flight.error = e
+            with self._lock:
+                self._counters['errors'] += 1
+            logger.warning('Background refresh of inv_id %s failed: %s', inv_id, e)
+        finally:
+            with self._lock:
+                self._flights.pop(inv_id, None)
+            flight.event.set()
+
+    def get(self, inv_id):
+        with self._lock:
+            found, record, stale_age = self._lookup(inv_id, time.monotonic())
+            if found and stale_age is None:
+                self._counters['hits'] += 1
+                return self._copy(record)
+            if found:
+                self._counters['stale_served'] += 1
+                self._refresh_in_background(inv_id)
+            else:
+                self._counters['misses'] += 1
+                flight = self._flights.get(inv_id)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[inv_id] = _Flight()
+                else:
+                    self._counters['coalesced'] += 1
+
+        if found:
+            return self._serve_stale(inv_id, record, stale_age)
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                with self._lock:
+                    fallback, record = self._stale_fallback(inv_id, time.monotonic())
+                if fallback:
+                    return self._serve_stale(inv_id, record, None)
+                raise flight.error
+            return self._copy(flight.value)
+
+        try:
+            flight.value = self._loader(inv_id)
+            with self._lock:
+                self._counters['refreshes'] += 1
+                if not flight.stale:
+                    self._store(inv_id, flight.value, time.monotonic())
+            return self._copy(flight.value)
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self._counters['errors'] += 1
+                fallback, record = self._stale_fallback(inv_id, time.monotonic())
+            if fallback:
+                logger.warning('Serving last known inv_id %s, reload failed: %s', inv_id, e)
+                return self._serve_stale(inv_id, record, None)
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(inv_id, None)
+            flight.event.set()
+
+    def _serve_stale(self, inv_id, record, age):
+        # age is None when falling back after a failed reload; it is then measured
+        # from when the record expired (or was invalidated)
+        if age is None:
+            with self._lock:
+                entry = self._entries.get(inv_id)
+                age = max(0.0, time.monotonic() - entry[1]) if entry else 0.0
+        self._served_stale(inv_id, age)
+        return self._copy(record)
+
+    def get_many(self, inv_ids):
+        # Returns {inv_id: record} for known ids; all misses are loaded with one batch call
+        records, missing, stale = {}, [], {}
+        with self._lock:
+            now = time.monotonic()
+            for inv_id in dict.fromkeys(inv_ids):
+                found, record, stale_age = self._lookup(inv_id, now)
+                if found and stale_age is not None:
+                    self._counters['stale_served'] += 1
+                    self._refresh_in_background(inv_id)
+                    stale[inv_id] = stale_age
+                elif found:
+                    self._counters['hits'] += 1
+                else:
+                    self._counters['misses'] += 1
+                    missing.append(inv_id)
+                    continue
+                if record is not None:
+                    records[inv_id] = self._copy(record)
+        for inv_id, age in stale.items():
+            self._served_stale(inv_id, age)
+
+        if missing:
+            if self._batch_loader is None:
+                loaded = {inv_id: record for inv_id in missing
+                          if (record := self.get(inv_id)) is not None}
+            else:
+                try:
+                    loaded = self._batch_loader(missing)
+                except Exception as e:
+                    with self._lock:
+                        self._counters['errors'] += 1
+                        now = time.monotonic()
+                        fallbacks = {inv_id: record for inv_id in missing
+                                     for fallback, record in [self._stale_fallback(inv_id, now)] if fallback}
+                    if len(fallbacks) < len(missing):
+                        raise
+                    logger.warning('Serving %d last known inventory records, reload failed: %s', len(fallbacks), e)
+                    records.update({inv_id: self._serve_stale(inv_id, record, None)
+                                    for inv_id, record in fallbacks.items()})
+                    return records
+                with self._lock:
+                    self._counters['refreshes'] += 1
+                    now = time.monotonic()
+                    for inv_id in missing:
+                        if inv_id not in self._flights:
+                            self._store(inv_id, loaded.get(inv_id), now)
+            records.update({inv_id: self._copy(record) for inv_id, record in loaded.items()})
+        return records
+
+    def invalidate(self, inv_id=None):
+        # Forces a reload of one inv_id, keeping it as the fallback should that reload
+        # fail; with no inv_id everything is dropped. Loads already in flight are not cached.
+        with self._lock:
+            self._counters['invalidations'] += 1
+            if inv_id is None:
+                self._entries.clear()
+                for flight in self._flights.values():
+                    flight.stale = True
+            else:
+                entry = self._entries.get(inv_id)
+                if entry is not None:
+                    if self.stale_ttl and entry[0] is not None:
+                        self._entries[inv_id] = (entry[0], min(entry[1], time.monotonic()), True)
+                    else:
+                        del self._entries[inv_id]
+                if inv_id in self._flights:
+                    self._flights[inv_id].stale = True
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return dict(
+                self._counters,
+                size=len(self._entries),
+                max_entries=self.max_entries,
+                ttl=self.ttl,
+                stale_ttl=self.stale_ttl,
+                hit_ratio=round(self._counters['hits'] / lookups, 4) if lookups else None,
+            )
@@ -0,0 +1,238 @@
+import datetime
+import logging
+import threading
+import time
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from background import elapsed_ms
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+# Standalone servers have no change streams; a resume token older than the oplog cannot resume
+CHANGE_STREAM_UNSUPPORTED = (40573, 136)
+CHANGE_STREAM_HISTORY_LOST = (286, 280)
+# Copy counts change on every reservation and stay owned by the inventory service
+REPLICA_EXCLUDED_FIELDS = ('_id', 'inv_copies')
+# Bookkeeping fields of replica entries, left out of the records handed out
+REPLICA_PROJECTION = {'_id': 0, 'deleted': 0, 'snapshot': 0}
+
+
+class InventoryReplica:
+    """Versioned local copy of inventory items, kept in sync from the inventory service.
+
+    Every item and deletion carries the version the inventory service gave it. Writes
+    here only replace an entry with an equal or newer version, so changes can be
+    replayed in any order and more than once. Deletions are kept as entries marked
+    deleted for the same reason.
+    """
+
+    def __init__(self, replica, state, fetch_changes, fetch_page, source_db=None, items_name='inventory_items',
+                 tombstones_name='inventory_tombstones', batch_size=1000, version_overlap=100,
+                 watch_seconds=30.0, resync_after=None, name='inventory'):
+        self.replica = replica
+        self.state = state
+        # fetch_changes(since, limit) and fetch_page(cursor, limit) call the inventory service
+        self.fetch_changes = fetch_changes
+        self.fetch_page = fetch_page
+        # With source_db, changes are followed through a change stream when the server supports it
+        self.source_db = source_db
+        self.items_name = items_name
+        self.tombstones_name = tombstones_name
+        self.batch_size = batch_size
+        # Writes that took a version before a poll but committed after it show up
+        # below the watermark; each poll re-reads this many versions to catch them.
+        self.version_overlap = version_overlap
+        self.watch_seconds = watch_seconds
+        # Tombstone lifetime as a timedelta: a replica that has not synced for longer resyncs
+        self.resync_after = resync_after
+        self.name = name
+        self.change_streams = source_db is not None
+        self._ready = False
+        self._lock = threading.Lock()
+        self._stats = {'runs': 0, 'applied_total': 0, 'last_run': None}
+
+    def _load_state(self):
+        return self.state.find_one({'_id': self.name})
+
+    def _save_state(self, **fields):
+        fields['synced_at'] = datetime.datetime.utcnow()
+        self.state.update_one({'_id': self.name}, {'$set': fields}, upsert=True)
+
+    def ready(self):
+        # True once a snapshot has been loaded; checked against the state document until then
+        if not self._ready:
+            state = self._load_state()
+            self._ready = bool(state and state.get('version') is not None)
+        return self._ready
+
+    def apply(self, items=(), deleted=(), snapshot=None):
+        operations = []
+        for item in items:
+            record = {key: value for key, value in item.items() if key not in REPLICA_EXCLUDED_FIELDS}
+            record['version'] = item.get('version') or 0
+            record['deleted'] = False
+            if snapshot:
+                record['snapshot'] = snapshot
+            operations.append(UpdateOne({'inv_id': record['inv_id'], 'version': {'$lte': record['version']}},
+                                        {'$set': record}, upsert=True))
+        for tombstone in deleted:
+            operations.append(UpdateOne({'inv_id': tombstone['inv_id'], 'version': {'$lte': tombstone['version']}},
+                                        {'$set': {'version': tombstone['version'], 'deleted': True}}, upsert=True))
+        if not operations:
+            return 0
+        try:
+            self.replica.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # A duplicate key means the replica already holds a newer version of that item
+            errors = [error for error in e.details.get('writeErrors', []) if error.get('code') != DUPLICATE_KEY_ERROR]
+            if errors:
+                raise
+        return len(operations)
+
+    def bootstrap(self):
+        # Version first, then the full listing: anything written meanwhile is at or
+        # above that version and is replayed by the next poll. On a resync, entries
+        # up to that version that the listing did not include were deleted while
+        # this replica was behind.
+        version = self.fetch_changes(0, 1)['version']
+        snapshot = str(ObjectId())
+        applied = 0
+        cursor = None
+        while True:
+            records, cursor = self.fetch_page(cursor, self.batch_size)
+            applied += self.apply(items=records, snapshot=snapshot)
+            if not cursor:
+                break
+        self.replica.update_many(
+            {'snapshot': {'$ne': snapshot}, 'version': {'$lte': version}, 'deleted': {'$ne': True}},
+            {'$set': {'deleted': True}}
+        )
+        self._save_state(version=version, resume_token=None)
+        self._ready = True
+        return 'snapshot', applied, version
+
+    def missed_deletions(self, state, changes):
+        # Tombstones expire; deletions below the oldest one the inventory service
+        # still keeps, or made while this replica did not sync for longer than
+        # they are kept, may never be replayed
+        oldest_tombstone = changes.get('oldest_tombstone')
+        if oldest_tombstone is not None and state['version'] < oldest_tombstone - 1:
+            return True
+        synced_at = state.get('synced_at')
+        return bool(self.resync_after and synced_at
+                    and synced_at < datetime.datetime.utcnow() - self.resync_after)
+
+    def poll(self, state):
+        watermark = state['version']
+        since = max(0, watermark - self.version_overlap)
+        applied = 0
+        changes = self.fetch_changes(since, self.batch_size)
+        if self.missed_deletions(state, changes):
+            logger.warning('Inventory replica %s is behind the kept tombstones; resyncing from a snapshot', self.name)
+            return self.bootstrap()
+        while True:
+            applied += self.apply(changes['items'], changes['deleted'])
+            since = changes['next']
+            watermark = max(watermark, since)
+            if not changes['more']:
+                break
+            changes = self.fetch_changes(since, self.batch_size)
+        self._save_state(version=watermark)
+        return 'poll', applied, watermark
+
+    def follow(self, state):
+        # Opens the stream before catching up by polling, so nothing written in
+        # between is missed; events already applied by the poll are harmless repeats.
+        pipeline = [{'$match': {'ns.coll': {'$in': [self.items_name, self.tombstones_name]},
+                                'operationType': {'$in': ['insert', 'update', 'replace']}}}]
+        options = {'full_document': 'updateLookup', 'max_await_time_ms': 1000}
+        if state.get('resume_token'):
+            options['resume_after'] = state['resume_token']
+        applied = 0
+        watermark = state['version']
+        with self.source_db.watch(pipeline, **options) as stream:
+            if not state.get('resume_token'):
+                _, applied, watermark = self.poll(state)
+            deadline = time.monotonic() + self.watch_seconds
+            items, deleted = [], []
+            while stream.alive and time.monotonic() < deadline:
+                change = stream.try_next()
+                document = change and change.get('fullDocument')
+                if document:
+                    target = deleted if change['ns']['coll'] == self.tombstones_name else items
+                    target.append(document)
+                    watermark = max(watermark, document.get('version') or 0)
+                if items or deleted:
+                    if change is None or len(items) + len(deleted) >= self.batch_size:
+                        applied += self.apply(items, deleted)
+                        items, deleted = [], []
+                        self._save_state(version=watermark, resume_token=stream.resume_token)
+            applied += self.apply(items, deleted)
+            self._save_state(version=watermark, resume_token=stream.resume_token)
+        return 'change_stream', applied, watermark
+
+    def sync(self):
+        started = time.perf_counter()
+        mode = None
+        applied = 0
+        version = None
+        error = None
+        try:
+            state = self._load_state()
+            if state is None or state.get('version') is None:
+                mode, applied, version = self.bootstrap()
+            elif self.change_streams:
+                try:
+                    mode, applied, version = self.follow(state)
+                except OperationFailure as e:
+                    if e.code in CHANGE_STREAM_UNSUPPORTED:
+                        logger.info('Change streams unavailable (%s); polling the inventory service instead', e)
+                        self.change_streams = False
+                    elif e.code in CHANGE_STREAM_HISTORY_LOST:
+                        logger.warning('Inventory change stream cannot resume (%s); catching up by polling', e)
+                        self._save_state(resume_token=None)
+                    else:
+                        raise
+                    mode, applied, version = self.poll(state)
+            else:
+                mode, applied, version = self.poll(state)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            run = {
+                'mode': mode,
+                'applied': applied,
+                'version': version,
+                'duration_ms': elapsed_ms(started),
+                'error': error,
+            }
+            with self._lock:
+                self._stats['runs'] += 1
+                self._stats['applied_total'] += applied
+                self._stats['last_run'] = run
+        return run
+
+    def get(self, inv_id):
+        record = self.replica.find_one({'inv_id': inv_id, 'deleted': {'$ne': True}}, REPLICA_PROJECTION)
+        return record if record is not None and record.get('inv_archive_status') != 'FALSE' else None
+
+    def get_many(self, inv_ids):
+        return {
+            record['inv_id']: record
+            for record in self.replica.find({'inv_id': {'$in': list(inv_ids)}, 'deleted': {'$ne': True}},
+                                            REPLICA_PROJECTION)
+            if record.get('inv_archive_status') != 'FALSE'
+        }
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        state = self._load_state() or {}
+        stats.update(version=state.get('version'), synced_at=state.get('synced_at'),
+                     change_streams=self.change_streams)
+        return stats
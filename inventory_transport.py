@@ -0,0 +1,222 @@
+import threading
+from urllib.parse import quote
+
+import config
+from service_client import inventory_client
+
+TRANSPORTS = ('http', 'local')
+# Ids per /inventory/lookup, reserve-many and release-many call (prj1.MAX_LOOKUP_IDS)
+HTTP_BATCH_SIZE = 1000
+
+
+class HTTPInventoryTransport:
+    """Inventory operations as calls to the inventory service, for split deployments."""
+
+    name = 'http'
+
+    def __init__(self, client=None, batch_size=HTTP_BATCH_SIZE):
+        self._client = client
+        self.batch_size = batch_size
+
+    @property
+    def client(self):
+        return self._client or inventory_client()
+
+    def _batches(self, inv_ids):
+        inv_ids = list(inv_ids)
+        for start in range(0, len(inv_ids), self.batch_size):
+            yield inv_ids[start:start + self.batch_size]
+
+    def record(self, inv_id, fields=None):
+        params = {'fields': ','.join(fields)} if fields else None
+        response = self.client.get(f'/inventory/{quote(inv_id, safe="")}',
+                                   endpoint='GET /inventory/<inv_id>', params=params)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def records(self, inv_ids, fields=None):
+        records = {}
+        for batch in self._batches(dict.fromkeys(inv_ids)):
+            payload = {'inv_ids': batch}
+            if fields:
+                payload['fields'] = list(fields)
+            response = self.client.post('/inventory/lookup', json=payload)
+            response.raise_for_status()
+            records.update(response.json()['data'])
+        return records
+
+    def changes(self, since, limit):
+        response = self.client.get('/inventory/changes', params={'since': since, 'limit': limit})
+        response.raise_for_status()
+        return response.json()
+
+    def page(self, cursor, limit):
+        # An empty cursor asks for the first keyset page
+        params = {'limit': limit, 'cursor': cursor or ''}
+        response = self.client.get('/inventory/view', params=params)
+        response.raise_for_status()
+        page = response.json()
+        return page['data'], page['next']
+
+    def reserve(self, inv_id, copies):
+        response = self.client.post(f'/inventory/{quote(inv_id, safe="")}/reserve',
+                                    endpoint='POST /inventory/<inv_id>/reserve', json={'copies': copies})
+        if response.status_code in (404, 409):
+            return None
+        response.raise_for_status()
+        return response.json()['inv_copies']
+
+    def reserve_many(self, copies):
+        granted = {}
+        for batch in self._batches(copies):
+            response = self.client.post('/inventory/reserve-many',
+                                        json={'copies': {inv_id: copies[inv_id] for inv_id in batch}})
+            response.raise_for_status()
+            granted.update(response.json()['granted'])
+        return granted
+
+    def release(self, inv_id, copies):
+        response = self.client.post(f'/inventory/{quote(inv_id, safe="")}/release',
+                                    endpoint='POST /inventory/<inv_id>/release', json={'copies': copies})
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()['inv_copies']
+
+    def release_many(self, copies):
+        missing = []
+        for batch in self._batches(copies):
+            response = self.client.post('/inventory/release-many',
+                                        json={'copies': {inv_id: copies[inv_id] for inv_id in batch}})
+            response.raise_for_status()
+            missing.extend(response.json()['missing'])
+        return missing
+
+
+class LocalInventoryTransport:
+    """Inventory operations as direct calls into prj1's data layer, for co-located deployments.
+
+    No HTTP request, no JSON round trip and no second Flask dispatch: the same
+    functions the inventory routes use run in this process, against the same
+    MongoDB connection pool.
+    """
+
+    name = 'local'
+
+    def __init__(self, inventory):
+        # The prj1 module
+        self.inventory = inventory
+
+    def record(self, inv_id, fields=None):
+        return self.inventory.find_inventory_record(inv_id.strip(), self.inventory.inventory_projection(fields))
+
+    def records(self, inv_ids, fields=None):
+        return self.inventory.find_inventory_records(dict.fromkeys(inv_ids),
+                                                     self.inventory.inventory_projection(fields))
+
+    def changes(self, since, limit):
+        return self.inventory.list_inventory_changes(since, max(1, min(limit, self.inventory.MAX_CHANGES_LIMIT)))
+
+    def page(self, cursor, limit):
+        return self.inventory.inventory_page(cursor, min(limit, self.inventory.MAX_PAGE_LIMIT))
+
+    def reserve(self, inv_id, copies):
+        record = self.inventory.reserve_copies(inv_id, copies)
+        return record['inv_copies'] if record else None
+
+    def reserve_many(self, copies):
+        return self.inventory.reserve_many_copies(copies)
+
+    def release(self, inv_id, copies):
+        record = self.inventory.release_copies(inv_id, copies)
+        return record['inv_copies'] if record else None
+
+    def release_many(self, copies):
+        _, missing = self.inventory.release_many_copies(copies)
+        return missing
+
+
+_default_transport = 'http'
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def set_default_transport(name):
+    # Used by the combined application; INVENTORY_TRANSPORT still overrides it
+    global _default_transport, _transport
+    if name not in TRANSPORTS:
+        raise ValueError(f'Unknown inventory transport {name!r}, expected one of {", ".join(TRANSPORTS)}')
+    with _transport_lock:
+        _default_transport = name
+        _transport = None
+
+
+def create_transport(name):
+    if name == 'http':
+        return HTTPInventoryTransport()
+    if name == 'local':
+        import prj1
+        return LocalInventoryTransport(prj1)
+    raise ValueError(f'Unknown inventory transport {name!r}, expected one of {", ".join(TRANSPORTS)}')
+
+
+def inventory_transport():
+    global _transport
+    transport = _transport
+    if transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = create_transport(config.INVENTORY_TRANSPORT or _default_transport)
+            transport = _transport
+    return transport
+
+
+# Inventory operations the reservation service uses. These used to live in prj1,
+# which meant importing the whole inventory service to call them.
+
+def fetch_inventory_data():
+    # The full listing, always over HTTP
+    response = inventory_client().get('/inventory/view-all')
+    inventory_data = response.json()
+    return inventory_data
+
+
+def fetch_inventory_record(inv_id, fields=None):
+    # Returns the record, or None if the inventory service does not know the inv_id
+    return inventory_transport().record(inv_id, fields)
+
+
+def fetch_inventory_records(inv_ids, fields=None):
+    # Returns {inv_id: record} for the ids that exist
+    return inventory_transport().records(inv_ids, fields)
+
+
+def fetch_inventory_changes(since, limit=1000):
+    return inventory_transport().changes(since, limit)
+
+
+def fetch_inventory_page(cursor=None, limit=1000):
+    # One keyset page of every inventory item: (records, next cursor)
+    return inventory_transport().page(cursor, limit)
+
+
+def reserve_inventory_copies(inv_id, copies=1):
+    # Returns the new inv_copies, or None if the item is unknown or has too few copies
+    return inventory_transport().reserve(inv_id, copies)
+
+
+def reserve_many_inventory_copies(copies):
+    # copies maps inv_id -> count wanted; returns inv_id -> count actually taken
+    return inventory_transport().reserve_many(copies)
+
+
+def release_many_inventory_copies(copies):
+    # copies maps inv_id -> count; returns the inv_ids the inventory service did not know
+    return inventory_transport().release_many(copies)
+
+
+def release_inventory_copies(inv_id, copies=1):
+    # Returns the new inv_copies, or None if the item is unknown
+    return inventory_transport().release(inv_id, copies)
@@ -0,0 +1,111 @@
+import datetime
+import json
+import logging
+import random
+import threading
+import uuid
+
+from flask import request
+
+import config
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+TRACE_HEADER = 'X-Trace'
+
+# Request id and trace decision for the request the current thread is serving
+_context = threading.local()
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def current_request_id():
+    return getattr(_context, 'request_id', None)
+
+
+def is_traced():
+    return getattr(_context, 'traced', False)
+
+
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = current_request_id() or '-'
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line; the message and fields are only rendered here."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' ' + ' '.join(f'{key}={value!r}' for key, value in fields.items())
+        return text
+
+
+def configure_logging():
+    # Idempotent, since every service module calls it at import time
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler()
+        handler.addFilter(RequestContextFilter())
+        handler.setFormatter(JSONFormatter() if config.LOG_FORMAT == 'json' else TextFormatter())
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(config.LOG_LEVEL.upper())
+        for name, level in config.LOG_LEVELS.items():
+            logging.getLogger(name).setLevel(level.upper())
+        _configured = True
+
+
+def trace(logger, msg, *args, **fields):
+    # Debug-level request trace. Emitted when the logger is at DEBUG, or when this
+    # request was sampled (LOG_TRACE_SAMPLE_RATE, or an X-Trace: 1 header where
+    # LOG_TRACE_HEADER_ENABLED allows it) even if the logger is at INFO. Otherwise it returns before anything is formatted.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(msg, *args, extra={'fields': fields})
+    elif is_traced():
+        record = logger.makeRecord(logger.name, logging.DEBUG, '(trace)', 0, msg, args, None,
+                                   extra={'fields': fields})
+        logger.handle(record)
+
+
+def init_request_logging(app):
+    @app.before_request
+    def assign_request_id():
+        _context.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        _context.traced = ((config.LOG_TRACE_HEADER_ENABLED and request.headers.get(TRACE_HEADER) == '1')
+                           or random.random() < config.LOG_TRACE_SAMPLE_RATE)
+
+    @app.after_request
+    def echo_request_id(response):
+        if current_request_id():
+            response.headers[REQUEST_ID_HEADER] = current_request_id()
+        return response
+
+    @app.teardown_request
+    def clear_request_id(exc):
+        _context.request_id = None
+        _context.traced = False
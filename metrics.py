@@ -0,0 +1,208 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, request
+from pymongo.monitoring import CommandListener
+
+import config
+
+# Upper bounds in seconds, from sub-millisecond Mongo commands to slow bulk uploads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+NO_ENDPOINT = 'none'
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, description, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, value):
+        # One bisect and a few integer bumps under a short lock; buckets are
+        # stored per-bucket and only made cumulative when rendered.
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count)
+                        for labels, (counts, total, count) in self._series.items()]
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for labels, counts, total, count in sorted(snapshot):
+            label_text = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(self.labelnames, labels))
+            prefix = f'{label_text},' if label_text else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return '\n'.join(lines)
+
+
+class Sample:
+    """A counter or gauge: one float per tuple of label values."""
+
+    def __init__(self, name, description, labelnames, kind):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self):
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        for labels, value in snapshot:
+            label_text = ','.join(f'{name}="{escape_label(label)}"' for name, label in zip(self.labelnames, labels))
+            lines.append(f'{self.name}{{{label_text}}} {value}')
+        return '\n'.join(lines)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Inbound request latency per route.',
+    ('service', 'endpoint', 'method', 'status'))
+STAGE_SECONDS = Histogram(
+    'request_stage_duration_seconds', 'Latency of named stages inside a request.',
+    ('endpoint', 'stage'))
+MONGO_SECONDS = Histogram(
+    'mongo_command_duration_seconds', 'MongoDB command latency per calling endpoint.',
+    ('endpoint', 'command', 'outcome'))
+OUTBOUND_SECONDS = Histogram(
+    'outbound_http_duration_seconds', 'Latency of calls to other services per calling endpoint.',
+    ('endpoint', 'target', 'outcome'))
+BREAKER_STATE = Sample(
+    'circuit_breaker_state', 'Outbound circuit breaker state: 0 closed, 1 half-open, 2 open.',
+    ('breaker',), 'gauge')
+BREAKER_TRANSITIONS = Sample(
+    'circuit_breaker_transitions_total', 'Circuit breaker state changes.', ('breaker', 'from', 'to'), 'counter')
+BREAKER_REJECTED = Sample(
+    'circuit_breaker_rejected_total', 'Calls refused without being sent because the breaker was open.',
+    ('breaker',), 'counter')
+BREAKER_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+COLLECTORS = [REQUEST_SECONDS, STAGE_SECONDS, MONGO_SECONDS, OUTBOUND_SECONDS,
+              BREAKER_STATE, BREAKER_TRANSITIONS, BREAKER_REJECTED]
+
+# The route (or background job) the current thread is working for; Mongo and
+# HTTP callbacks run synchronously on that thread, so they can attribute to it.
+_current = threading.local()
+
+
+def current_endpoint():
+    return getattr(_current, 'endpoint', NO_ENDPOINT)
+
+
+@contextmanager
+def endpoint_scope(endpoint):
+    previous = current_endpoint()
+    _current.endpoint = endpoint
+    try:
+        yield
+    finally:
+        _current.endpoint = previous
+
+
+@contextmanager
+def stage(name):
+    # with stage('quota'): ... times one step of the current request
+    if not config.METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe((current_endpoint(), name), time.perf_counter() - started)
+
+
+def observe_outbound(target, elapsed, error=False):
+    if config.METRICS_ENABLED:
+        OUTBOUND_SECONDS.observe((current_endpoint(), target, 'error' if error else 'ok'), elapsed)
+
+
+def observe_breaker_state(breaker, state):
+    BREAKER_STATE.set((breaker,), BREAKER_STATE_VALUES[state])
+
+
+def observe_breaker_transition(breaker, previous, state):
+    BREAKER_TRANSITIONS.inc((breaker, previous, state))
+    observe_breaker_state(breaker, state)
+
+
+def observe_breaker_rejection(breaker):
+    BREAKER_REJECTED.inc((breaker,))
+
+
+class CommandMetrics(CommandListener):
+    """Feeds every pymongo command's duration into MONGO_SECONDS."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_SECONDS.observe((current_endpoint(), event.command_name, 'ok'), event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_SECONDS.observe((current_endpoint(), event.command_name, 'error'), event.duration_micros / 1e6)
+
+
+def route_name():
+    rule = request.url_rule
+    return f'{request.method} {rule.rule}' if rule is not None else f'{request.method} unmatched'
+
+
+def instrument_app(app, service):
+    if not config.METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        _current.endpoint = route_name()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            REQUEST_SECONDS.observe((service, rule, request.method, str(response.status_code)),
+                                    time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def clear_endpoint(exc):
+        _current.endpoint = NO_ENDPOINT
+
+
+def metrics_response():
+    body = '\n'.join(collector.render() for collector in COLLECTORS) + '\n'
+    return Response(body, mimetype=None, content_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from pymongo.monitoring import ConnectionPoolListener
+
+import config
+from metrics import CommandMetrics
+
+
+class PoolStats(ConnectionPoolListener):
+    """Tracks open and checked-out connections per server for the health endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers = {}
+
+    def _server(self, address):
+        key = f'{address[0]}:{address[1]}'
+        return self._servers.setdefault(key, {'open': 0, 'in_use': 0, 'checkout_failures': 0})
+
+    def _bump(self, address, field, delta):
+        with self._lock:
+            stats = self._server(address)
+            stats[field] = max(0, stats[field] + delta)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._servers.pop(f'{event.address[0]}:{event.address[1]}', None)
+
+    def connection_created(self, event):
+        self._bump(event.address, 'open', 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._bump(event.address, 'open', -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._bump(event.address, 'checkout_failures', 1)
+
+    def connection_checked_out(self, event):
+        self._bump(event.address, 'in_use', 1)
+
+    def connection_checked_in(self, event):
+        self._bump(event.address, 'in_use', -1)
+
+    def snapshot(self):
+        with self._lock:
+            return {address: dict(stats) for address, stats in self._servers.items()}
+
+
+_client = None
+_client_pid = None
+_pool_stats = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    # One client per process, created on first use. A forked worker gets its own
+    # client instead of reusing sockets inherited from the parent.
+    global _client, _client_pid, _pool_stats
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _pool_stats = PoolStats()
+                listeners = [_pool_stats]
+                if config.METRICS_ENABLED:
+                    listeners.append(CommandMetrics())
+                _client = MongoClient(
+                    config.MONGO_URI,
+                    maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=config.MONGO_MIN_POOL_SIZE,
+                    connectTimeoutMS=config.MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    socketTimeoutMS=config.MONGO_SOCKET_TIMEOUT_MS or None,
+                    event_listeners=listeners,
+                    connect=False,
+                )
+                _client_pid = pid
+    return _client
+
+
+class LazyCollection:
+    """Collection handle that resolves against the current process's client on every use."""
+
+    def __init__(self, db_name, name):
+        self.db_name = db_name
+        self.name = name
+
+    def resolve(self):
+        return get_client()[self.db_name][self.name]
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __getitem__(self, name):
+        return LazyCollection(self.db_name, f'{self.name}.{name}')
+
+    def __repr__(self):
+        return f'LazyCollection({self.db_name!r}, {self.name!r})'
+
+
+class LazyDatabase:
+    """Database handle that can be created at import time without touching the network."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def resolve(self):
+        return get_client()[self.name]
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __getitem__(self, name):
+        return LazyCollection(self.name, name)
+
+    def __repr__(self):
+        return f'LazyDatabase({self.name!r})'
+
+
+def get_database(name):
+    return LazyDatabase(name)
+
+
+def mongo_health():
+    client = get_client()
+    started = time.perf_counter()
+    try:
+        client.admin.command('ping')
+        status = 'ok'
+        error = None
+    except PyMongoError as e:
+        status = 'error'
+        error = str(e)
+    ping_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    max_pool_size = config.MONGO_MAX_POOL_SIZE
+    servers = _pool_stats.snapshot() if _pool_stats else {}
+    for stats in servers.values():
+        stats['utilisation'] = round(stats['in_use'] / max_pool_size, 4) if max_pool_size else None
+
+    health = {
+        'status': status,
+        'ping_ms': ping_ms,
+        'pid': os.getpid(),
+        'pool': {
+            'max_pool_size': max_pool_size,
+            'min_pool_size': config.MONGO_MIN_POOL_SIZE,
+            'servers': servers,
+        },
+    }
+    if error:
+        health['error'] = error
+    return health
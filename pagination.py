@@ -0,0 +1,175 @@
+import base64
+import heapq
+import threading
+import time
+
+from bson import json_util
+
+MAX_PAGE_LIMIT = 10000
+EXACT_COUNT_TTL = 60  # seconds an exact count_documents result is reused
+MAX_CACHED_COUNTS = 1000
+
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+
+class InvalidPageRequest(ValueError):
+    pass
+
+
+class InvalidCursor(InvalidPageRequest):
+    pass
+
+
+def page_limit(value, default, maximum=MAX_PAGE_LIMIT):
+    # Every paged route reads its limit through here, so it is always 1..maximum
+    if value in (None, ''):
+        return default
+    try:
+        return max(1, min(int(value), maximum))
+    except (TypeError, ValueError):
+        raise InvalidPageRequest(f'limit must be an integer, got {value!r}')
+
+
+def page_number(value):
+    if value in (None, ''):
+        return 1
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        raise InvalidPageRequest(f'page must be an integer, got {value!r}')
+
+
+def wants_keyset(args):
+    # Keyset pages are opt-in with ?cursor= (empty for the first page). Without it
+    # the listings keep their page/skip responses, total_records included.
+    return 'cursor' in args
+
+
+def encode_cursor(last_key):
+    # Extended JSON so datetime sort keys survive the round trip
+    payload = json_util.dumps({'k': last_key}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')))['k']
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {token}') from e
+
+
+def sort_spec(sort_key, direction=1, tie_breaker=None):
+    keys = [sort_key] if tie_breaker in (None, sort_key) else [sort_key, tie_breaker]
+    return [(key, direction) for key in keys]
+
+
+def seek_filter(cursor, sort_key, direction=1, tie_breaker=None):
+    # Documents strictly after the cursor in (sort_key, tie_breaker) order
+    if not cursor:
+        return {}
+    last = decode_cursor(cursor)
+    op = '$gt' if direction == 1 else '$lt'
+    if tie_breaker in (None, sort_key):
+        return {sort_key: {op: last}}
+    try:
+        last_value, last_tie = last
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor}') from e
+    return {'$or': [{sort_key: {op: last_value}}, {sort_key: last_value, tie_breaker: {op: last_tie}}]}
+
+
+def keyset_query(query, cursor, sort_key, direction=1, tie_breaker=None):
+    seek = seek_filter(cursor, sort_key, direction, tie_breaker)
+    if query and seek:
+        return {'$and': [query, seek]}
+    return query or seek
+
+
+def page_key(document, sort_key, tie_breaker=None):
+    if tie_breaker in (None, sort_key):
+        return document.get(sort_key)
+    return [document.get(sort_key), document.get(tie_breaker)]
+
+
+def keyset_page(collection, sort_key, limit, cursor=None, projection=None, query=None, direction=1,
+                tie_breaker=None):
+    # Seek past the last seen key instead of skipping, so every page walks the
+    # sort index from the same starting cost. A tie_breaker (a unique field) makes
+    # the order total when sort_key has duplicates; the cursor then carries both.
+    limit = max(1, limit)
+    find_query = keyset_query(query, cursor, sort_key, direction, tie_breaker)
+
+    projection = dict(projection or {})
+    # The sort keys are needed to build the next token even if the caller hides them
+    including = any(value for key, value in projection.items() if key != '_id')
+    hidden = []
+    for key, _ in sort_spec(sort_key, direction, tie_breaker):
+        if projection.get(key) == 0:
+            projection.pop(key)
+            hidden.append(key)
+        elif including and key not in projection:
+            projection[key] = 1
+            hidden.append(key)
+
+    # Fetch one extra document to know whether another page exists
+    data = list(collection.find(find_query, projection or None)
+                .sort(sort_spec(sort_key, direction, tie_breaker)).limit(limit + 1))
+    next_cursor = None
+    if len(data) > limit:
+        data = data[:limit]
+        next_cursor = encode_cursor(page_key(data[-1], sort_key, tie_breaker))
+    for key in hidden:
+        for item in data:
+            item.pop(key, None)
+    return data, next_cursor
+
+
+def merge_keyset_pages(pages, sort_key, limit, direction=1, tie_breaker=None):
+    # pages are (data, next_cursor) results of keyset_page over several collections
+    # with the same cursor; their union holds the first `limit` documents of the merge.
+    # The sort keys must still be present in the documents.
+    if len(pages) == 1:
+        return pages[0]
+    merged = merge_sorted([data for data, _ in pages], sort_key, direction, tie_breaker)
+    has_more = len(merged) > limit or any(next_cursor for _, next_cursor in pages)
+    data = merged[:limit]
+    next_cursor = encode_cursor(page_key(data[-1], sort_key, tie_breaker)) if has_more and data else None
+    return data, next_cursor
+
+
+def merge_sorted(sources, sort_key, direction=1, tie_breaker=None):
+    # Merges document lists that are each already sorted on (sort_key, tie_breaker).
+    # Missing keys sort first, as MongoDB sorts null below other values.
+    def order(document):
+        key = page_key(document, sort_key, tie_breaker)
+        return [(value is not None, value) for value in (key if isinstance(key, list) else [key])]
+    return list(heapq.merge(*sources, key=order, reverse=direction == -1))
+
+
+def count_total(collection, mode, query=None):
+    # Totals are opt-in: 'estimated' reads collection metadata, 'exact' runs
+    # count_documents at most once per EXACT_COUNT_TTL for each collection and
+    # filter. A filtered total is always exact; metadata cannot estimate it.
+    if mode == 'estimated' and not query:
+        return collection.estimated_document_count()
+    if mode not in ('exact', 'estimated'):
+        return None
+
+    key = (collection.database.name, collection.name, json_util.dumps(query or {}, sort_keys=True))
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+    total = collection.count_documents(query or {})
+    with _count_cache_lock:
+        if len(_count_cache) >= MAX_CACHED_COUNTS:
+            # Filtered totals make the key space open-ended; drop what has expired
+            for stale in [k for k, (_, expires) in _count_cache.items() if expires <= now]:
+                del _count_cache[stale]
+            if len(_count_cache) >= MAX_CACHED_COUNTS:
+                _count_cache.clear()
+        _count_cache[key] = (total, now + EXACT_COUNT_TTL)
+    return total
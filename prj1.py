@@ -1,22 +1,32 @@
-from flask import Flask, request
-from flask_restx import Api, Resource, fields, reqparse
-from pymongo import MongoClient
-import csv
+from flask import request
+from flask_restx import Namespace, Resource, fields, reqparse
+from pymongo import ReturnDocument, UpdateOne
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
 from bson.objectid import ObjectId
 import random
 import string
 import datetime
-import requests 
-
-app = Flask(__name__)
-api = Api(app, version='1.0', title='Inventory API', description='API for Library Management System')
-mongo_client = MongoClient('mongodb://localhost:27017/')
-db = mongo_client['inventory_db']
+from csv_ingest import (BatchWriter, DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE, clamp_batch_size,
+                        iter_chunks, iter_csv_rows)
+from pagination import (InvalidPageRequest, MAX_PAGE_LIMIT, count_total, keyset_page, page_limit, page_number,
+                        wants_keyset)
+from streaming import ndjson_response, stream_batch_size, wants_ndjson
+from indexes import index_report
+from mongo import get_database, mongo_health
+from metrics import metrics_response
+from app_factory import build_app
+import config
+
+api = Namespace('inventory', path='/', description='Inventory items, copies and their change feed')
+db = get_database('inventory_db')
 collection = db['inventory_items']
 
 archived_collection = db['archived_inventory']
+# Every write to inventory_items takes the next version from here; deletions leave
+# a tombstone with their version, so /inventory/changes can replay both.
+counters = db['inventory_counters']
+tombstones = db['inventory_tombstones']
 
 
 inventory_model = api.model('Inventory', {
@@ -30,7 +40,6 @@ inventory_model = api.model('Inventory', {
 })
 
 UPLOAD_FOLDER = 'uploads'
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'csv'
@@ -41,45 +50,226 @@ upload_model = api.model('UploadCSV', {
 
 upload_parser = reqparse.RequestParser()
 upload_parser.add_argument('file', location='files', type=FileStorage, required=True)
+upload_parser.add_argument('batch_size', location='args', type=int, default=DEFAULT_BATCH_SIZE,
+                           help=f'Rows per insert_many batch (max {MAX_BATCH_SIZE})')
 
 def generate_inventory_id():
     timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
     random_suffix = ''.join(random.choices(string.digits, k=4))
     return f'r{timestamp}{random_suffix}'
 
+INVENTORY_FIELDS = ('inv_logo', 'inv_id', 'inv_name', 'inv_description', 'inv_type', 'inv_blob',
+                    'inv_archive_status', 'inv_copies')
+MAX_LOOKUP_IDS = 1000
+
+# Same filter as /inventory/view-all, so point lookups see exactly what the full listing sees
+ACTIVE_INVENTORY_FILTER = {'inv_archive_status': {'$ne': 'FALSE'}}
+# inv_reserve_claims is bookkeeping for retried reserve-many calls, not part of an item
+INVENTORY_PROJECTION = {'_id': 0, 'inv_reserve_claims': 0}
+
+MAX_CHANGES_LIMIT = 5000
+
+def allocate_versions(count=1):
+    # Reserves `count` consecutive versions with one $inc and returns the first
+    counter = counters.find_one_and_update(
+        {'_id': 'inventory_version'},
+        {'$inc': {'value': count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter['value'] - count + 1
+
+def current_version():
+    counter = counters.find_one({'_id': 'inventory_version'})
+    return counter['value'] if counter else 0
+
+def stamp_versions(documents):
+    documents = list(documents)
+    if documents:
+        first = allocate_versions(len(documents))
+        updated_at = datetime.datetime.utcnow()
+        for offset, document in enumerate(documents):
+            document['version'] = first + offset
+            document['updated_at'] = updated_at
+    return documents
+
+def write_tombstones(inv_ids):
+    inv_ids = list(inv_ids)
+    if inv_ids:
+        deleted_at = datetime.datetime.utcnow()
+        first = allocate_versions(len(inv_ids))
+        tombstones.insert_many([{'inv_id': inv_id, 'version': first + offset, 'deleted_at': deleted_at}
+                                for offset, inv_id in enumerate(inv_ids)], ordered=False)
+
+def inventory_projection(requested_fields=None):
+    if isinstance(requested_fields, str):
+        requested_fields = [field.strip() for field in requested_fields.split(',') if field.strip()]
+    if not requested_fields:
+        return dict(INVENTORY_PROJECTION)
+    unknown = [field for field in requested_fields if field not in INVENTORY_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown inventory fields: {", ".join(unknown)}')
+    projection = {'_id': 0}
+    projection.update({field: 1 for field in requested_fields})
+    projection['inv_id'] = 1
+    return projection
+
+def coerce_inventory_rows(rows):
+    for row in rows:
+        row['inv_id'] = str(ObjectId())  # Generate unique inv_id
+
+        # Convert inv_archive_status to boolean
+        row['inv_archive_status'] = (row.get('inv_archive_status') or '').strip().upper() == 'TRUE'
+
+        # Convert "inv_copies" to integer if possible
+        try:
+            row['inv_copies'] = int(row.get('inv_copies') or '')
+        except ValueError:
+            row['inv_copies'] = 0  # Default to 0 if conversion to int fails
+    return rows
+
+# Inventory operations the reservation service uses. The routes below and the
+# in-process transport (inventory_transport.LocalInventoryTransport) both call these.
+
+def find_inventory_record(inv_id, projection=None):
+    return collection.find_one(dict(ACTIVE_INVENTORY_FILTER, inv_id=inv_id), projection or INVENTORY_PROJECTION)
+
+def find_inventory_records(inv_ids, projection=None):
+    cursor = collection.find(dict(ACTIVE_INVENTORY_FILTER, inv_id={'$in': list(inv_ids)}),
+                             projection or INVENTORY_PROJECTION)
+    return {record['inv_id']: record for record in cursor}
+
+def list_inventory_changes(since, limit):
+    version = current_version()
+    # Tombstones expire (indexes.py deleted_at_ttl); deletions below the oldest one
+    # kept may be gone, so callers that are further behind have to resync
+    oldest_tombstone = tombstones.find_one({}, {'_id': 0, 'version': 1}, sort=[('version', 1)])
+    items = list(collection.find({'version': {'$gt': since}}, INVENTORY_PROJECTION).sort('version', 1).limit(limit + 1))
+    deleted = list(tombstones.find({'version': {'$gt': since}}, {'_id': 0, 'inv_id': 1, 'version': 1})
+                   .sort('version', 1).limit(limit + 1))
+    # If either list was cut off, only return what lies below both cut-offs so
+    # the caller can continue from `next` without skipping anything.
+    bounds = [page[limit - 1]['version'] for page in (items, deleted) if len(page) > limit]
+    if bounds:
+        upto = min(bounds)
+        items = [item for item in items if item['version'] <= upto]
+        deleted = [item for item in deleted if item['version'] <= upto]
+        next_version = upto
+    else:
+        next_version = max([since] + [item['version'] for item in items + deleted])
+    return {
+        'version': version,
+        'next': next_version,
+        'more': bool(bounds),
+        'oldest_tombstone': oldest_tombstone['version'] if oldest_tombstone else None,
+        'items': items,
+        'deleted': deleted
+    }
+
+def reserve_copies(inv_id, copies):
+    # The inv_copies guard and the decrement happen in one document update,
+    # so concurrent reservations can never drive the count below zero.
+    # Returns None if the item is unknown or has too few copies.
+    return collection.find_one_and_update(
+        {'inv_id': inv_id, 'inv_copies': {'$gte': copies}},
+        {'$inc': {'inv_copies': -copies}},
+        projection={'_id': 0, 'inv_id': 1, 'inv_copies': 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+def reserve_many_copies(copies):
+    # Every item is one guarded $inc in a single bulk write. Each update that
+    # matched also tags its item with this round's claim, so when some did not,
+    # one find tells which were granted and how many copies the others have
+    # left; those are retried once for whatever is left.
+    granted = {inv_id: 0 for inv_id in copies}
+    wanted = {inv_id: count for inv_id, count in copies.items() if count > 0}
+    for attempt in range(2):
+        if not wanted:
+            break
+        claim = f'inv_reserve_claims.{ObjectId()}'
+        result = collection.bulk_write([
+            UpdateOne({'inv_id': inv_id, 'inv_copies': {'$gte': count}},
+                      {'$inc': {'inv_copies': -count}, '$set': {claim: count}})
+            for inv_id, count in wanted.items()
+        ], ordered=False)
+        if result.modified_count == len(wanted):
+            granted.update(wanted)
+            claimed = set(wanted)
+            wanted = {}
+        else:
+            claimed, short = set(), {}
+            for record in collection.find({'inv_id': {'$in': list(wanted)}},
+                                          {'_id': 0, 'inv_id': 1, 'inv_copies': 1, 'inv_reserve_claims': 1}):
+                if claim.split('.', 1)[1] in (record.get('inv_reserve_claims') or {}):
+                    granted[record['inv_id']] = wanted[record['inv_id']]
+                    claimed.add(record['inv_id'])
+                elif isinstance(record.get('inv_copies'), int) and record['inv_copies'] >= 1:
+                    short[record['inv_id']] = min(wanted[record['inv_id']], record['inv_copies'])
+            wanted = short
+        if claimed:
+            collection.update_many({'inv_id': {'$in': list(claimed)}}, {'$unset': {claim: ''}})
+    return granted
+
+def release_copies(inv_id, copies):
+    # Returns None if the item is unknown
+    return collection.find_one_and_update(
+        {'inv_id': inv_id},
+        {'$inc': {'inv_copies': copies}},
+        projection={'_id': 0, 'inv_id': 1, 'inv_copies': 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+def release_many_copies(copies):
+    # Returns (released, missing inv_ids) after one bulk write
+    existing = {record['inv_id'] for record in
+                collection.find({'inv_id': {'$in': list(copies)}}, {'_id': 0, 'inv_id': 1})}
+    operations = [UpdateOne({'inv_id': inv_id}, {'$inc': {'inv_copies': count}})
+                  for inv_id, count in copies.items() if inv_id in existing]
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return ({inv_id: count for inv_id, count in copies.items() if inv_id in existing},
+            [inv_id for inv_id in copies if inv_id not in existing])
+
+def inventory_page(cursor=None, limit=1000):
+    # One keyset page of every inventory item: (records, next cursor)
+    return keyset_page(collection, 'inv_id', limit, cursor=cursor, projection=INVENTORY_PROJECTION)
+
 @api.route('/inventory/upload')
 class UploadCSV(Resource):
     @api.expect(upload_parser)
     def post(self):
         args = upload_parser.parse_args()
         uploaded_file = args['file']
+        batch_size = clamp_batch_size(args.get('batch_size'))
 
         try:
-            data = csv.DictReader(uploaded_file.stream.read().decode('utf-8').splitlines())
-            inserted_ids = []
-
-            for row in data:
-                row['inv_id'] = str(ObjectId())  # Generate unique inv_id
-
-                # Convert inv_archive_status to boolean
-                inv_archive_status = row.get('inv_archive_status', '').upper() == 'TRUE'
-                row['inv_archive_status'] = inv_archive_status
-
-                # Convert "inv_copies" to integer if possible
-                inv_copies = row.get('inv_copies', '')
-                try:
-                    row['inv_copies'] = int(inv_copies)
-                except ValueError:
-                    row['inv_copies'] = 0  # Default to 0 if conversion to int fails
+            # One bounded buffer per target collection
+            writers = {
+                True: BatchWriter(collection, batch_size),
+                False: BatchWriter(archived_collection, batch_size),
+            }
+            total_rows = 0
 
-                if inv_archive_status:
-                    result = collection.insert_one(row)
-                else:
-                    result = archived_collection.insert_one(row)
+            rows = iter_csv_rows(uploaded_file.stream)
+            for chunk in iter_chunks(rows, batch_size):
+                for row in stamp_versions(coerce_inventory_rows(chunk)):
+                    writers[row['inv_archive_status']].add(row)
+                total_rows += len(chunk)
 
-                inserted_ids.append(str(result.inserted_id))
+            for writer in writers.values():
+                writer.flush()
 
-            return {'message': 'Data uploaded successfully', 'inserted_ids': inserted_ids}, 200
+            inserted = sum(writer.inserted for writer in writers.values())
+            errors = [error for writer in writers.values() for error in writer.errors]
+            return {
+                'message': 'Data uploaded successfully' if not errors else 'Data uploaded with errors',
+                'total_rows': total_rows,
+                'inserted': inserted,
+                'failed': total_rows - inserted,
+                'collections': {writer.name: writer.summary() for writer in writers.values()},
+                'errors': errors
+            }, 200 if not errors else 207
         except Exception as e:
             return {'error': f'An error occurred while uploading data: {e}'}, 500
 
@@ -100,7 +290,7 @@ class CreateInventory(Resource):
             inv_id = generate_inventory_id()  # Generate unique integer inv_id
 
             if inv_archive_status:
-                result = collection.insert_one({
+                result = collection.insert_one(stamp_versions([{
                     'inv_logo': inv_logo,
                     'inv_id': inv_id,
                     'inv_name': inv_name,
@@ -109,7 +299,7 @@ class CreateInventory(Resource):
                     'inv_blob': inv_blob,
                     'inv_archive_status': inv_archive_status,
                     'inv_copies': inv_copies
-                })
+                }])[0])
             else:
                 result = archived_collection.insert_one({
                     'inv_logo': inv_logo,
@@ -130,9 +320,15 @@ class CreateInventory(Resource):
         
 @api.route('/inventory/view-all')
 class DisplayAllInventory(Resource):
+    @api.doc(params={
+        'format': 'Set to "ndjson" to stream newline-delimited JSON (or send Accept: application/x-ndjson)',
+        'batch_size': 'Documents per streamed batch'
+    })
     def get(self):
         try:
-            cursor = collection.find({'inv_archive_status': {'$ne': 'FALSE'}}, {'_id': 0})
+            cursor = collection.find(ACTIVE_INVENTORY_FILTER, INVENTORY_PROJECTION)
+            if wants_ndjson(request):
+                return ndjson_response(cursor, stream_batch_size(request))
             data = list(cursor)
             total_records = len(data)
             return {
@@ -146,9 +342,15 @@ class DisplayAllInventory(Resource):
 
 @api.route('/archived_inventory/view-all')
 class DisplayAllArchivedInventory(Resource):
+    @api.doc(params={
+        'format': 'Set to "ndjson" to stream newline-delimited JSON (or send Accept: application/x-ndjson)',
+        'batch_size': 'Documents per streamed batch'
+    })
     def get(self):
         try:
             cursor = archived_collection.find({}, {'_id': 0})
+            if wants_ndjson(request):
+                return ndjson_response(cursor, stream_batch_size(request))
             data = list(cursor)
             total_records = len(data)
             return {
@@ -172,7 +374,7 @@ class UpdateResource(Resource):
     def put(self, inv_id):
         try:
             data = api.payload
-            result = collection.update_one({'inv_id': inv_id}, {'$set': data})
+            result = collection.update_one({'inv_id': inv_id}, {'$set': stamp_versions([dict(data)])[0]})
             if result.matched_count:
                 return {'message': 'Record updated successfully'}, 200
             return {'message': 'Record not found'}, 404
@@ -186,6 +388,7 @@ class DeleteResource(Resource):
             result = collection.delete_one({'inv_id': inv_id})
 
             if result.deleted_count > 0:
+                write_tombstones([inv_id])
                 return {'message': 'Inventory item deleted successfully'}, 200
             else:
                 return {'message': 'Failed to delete inventory item'}, 500
@@ -209,8 +412,12 @@ class DeleteManyResource(Resource):
             return {'error': 'No inventory IDs provided for deletion'}, 400
 
         try:
-            result = collection.delete_many({'inv_id': {'$in': inventory_ids}})
+            # Only ids that exist get a tombstone; unknown ones were never replicated
+            inv_ids = [record['inv_id'] for record in
+                       collection.find({'inv_id': {'$in': inventory_ids}}, {'_id': 0, 'inv_id': 1})]
+            result = collection.delete_many({'inv_id': {'$in': inv_ids}})
             if result.deleted_count > 0:
+                write_tombstones(inv_ids)
                 return {'message': f'{result.deleted_count} inventory items deleted successfully'}, 200
             else:
                 return {'message': 'No inventory items deleted'}, 404
@@ -223,8 +430,10 @@ class DeleteAllResource(Resource):
     @api.doc(description='Delete all inventory records')
     def delete(self):
         try:
+            inv_ids = [record['inv_id'] for record in collection.find({}, {'_id': 0, 'inv_id': 1})]
             result = collection.delete_many({})
             if result.deleted_count > 0:
+                write_tombstones(inv_ids)
                 return {'message': f'{result.deleted_count} inventory items deleted successfully'}, 200
             else:
                 return {'message': 'No inventory items deleted'}, 404
@@ -234,28 +443,203 @@ class DeleteAllResource(Resource):
 
 @api.route('/inventory/view')
 class DisplayUploadedCSV(Resource):
-    @api.doc(params={'page': 'Page number', 'limit': 'Items per page'})
+    @api.doc(params={
+        'page': 'Page number (skip-based, the default)',
+        'limit': f'Items per page (1-{MAX_PAGE_LIMIT})',
+        'cursor': 'Keyset pagination: empty for the first page, then the previous response\'s "next" field',
+        'total': 'Include total_records: "estimated" or "exact" (cached)'
+    })
     def get(self):
         try:
-            page = int(request.args.get('page', 1))
-            limit = int(request.args.get('limit', 10))
-            total_records = collection.count_documents({})
-            
-            if page < 1:
-                page = 1
-            skip = (page - 1) * limit
-            cursor = collection.find({}, {'_id': 0}).skip(skip).limit(limit)
-            data = list(cursor)
-            
-            return {
-                'page': page,
+            limit = page_limit(request.args.get('limit'), 10)
+            total_mode = request.args.get('total')
+
+            if not wants_keyset(request.args):
+                page = page_number(request.args.get('page'))
+                skip = (page - 1) * limit
+                cursor = collection.find({}, INVENTORY_PROJECTION).skip(skip).limit(limit)
+                data = list(cursor)
+
+                return {
+                    'page': page,
+                    'limit': limit,
+                    'total_records': count_total(collection, total_mode or 'exact'),
+                    'data': data
+                }, 200
+
+            data, next_cursor = inventory_page(request.args.get('cursor'), limit)
+            response = {
                 'limit': limit,
-                'total_records': total_records,
+                'next': next_cursor,
                 'data': data
+            }
+            if total_mode:
+                response['total_records'] = count_total(collection, total_mode)
+            return response, 200
+        except InvalidPageRequest as e:
+            return {'message': str(e)}, 400
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+
+@api.route('/inventory/changes')
+class InventoryChanges(Resource):
+    @api.doc(params={
+        'since': 'Return changes with a version above this one',
+        'limit': f'Maximum items and deletions returned (max {MAX_CHANGES_LIMIT})'
+    }, description='Inventory items written and deleted since a version, in version order')
+    def get(self):
+        try:
+            since = int(request.args.get('since', 0))
+            limit = max(1, min(int(request.args.get('limit', 1000)), MAX_CHANGES_LIMIT))
+        except ValueError:
+            return {'message': 'since and limit must be integers'}, 400
+
+        try:
+            return list_inventory_changes(since, limit), 200
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+
+@api.route('/inventory/lookup')
+class LookupInventory(Resource):
+    @api.doc(description='Look up several inventory records by inv_id')
+    @api.expect(api.model('InventoryLookup', {
+        'inv_ids': fields.List(fields.String, required=True, description=f'Inventory IDs (max {MAX_LOOKUP_IDS})'),
+        'fields': fields.List(fields.String, description='Fields to return (defaults to all)')
+    }))
+    def post(self):
+        data = api.payload or {}
+        inv_ids = [inv_id.strip() for inv_id in data.get('inv_ids', []) if isinstance(inv_id, str)]
+
+        if not inv_ids:
+            return {'error': 'No inventory IDs provided for lookup'}, 400
+        if len(inv_ids) > MAX_LOOKUP_IDS:
+            return {'error': f'At most {MAX_LOOKUP_IDS} inventory IDs can be looked up at once'}, 400
+
+        try:
+            projection = inventory_projection(data.get('fields'))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        try:
+            records = find_inventory_records(inv_ids, projection)
+            return {
+                'data': records,
+                'missing': [inv_id for inv_id in dict.fromkeys(inv_ids) if inv_id not in records]
             }, 200
         except Exception as e:
             return {'message': f'Error: {e}'}, 500
 
+@api.route('/inventory/<string:inv_id>')
+class InventoryRecord(Resource):
+    @api.doc(params={'fields': 'Comma separated fields to return (defaults to all)'},
+             description='View an inventory record by inv_id')
+    def get(self, inv_id):
+        try:
+            projection = inventory_projection(request.args.get('fields'))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        try:
+            record = find_inventory_record(inv_id.strip(), projection)
+            if record:
+                return record, 200
+            return {'message': 'Record not found'}, 404
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+
+copies_model = api.model('InventoryCopies', {
+    'copies': fields.Integer(description='Number of copies (defaults to 1)', default=1)
+})
+
+def requested_copies(payload):
+    copies = (payload or {}).get('copies', 1)
+    if isinstance(copies, bool) or not isinstance(copies, int) or copies < 1:
+        raise ValueError('copies must be a positive integer')
+    return copies
+
+@api.route('/inventory/<string:inv_id>/reserve')
+class ReserveInventoryCopies(Resource):
+    @api.doc(description='Atomically take copies of an inventory item if enough are available')
+    @api.expect(copies_model)
+    def post(self, inv_id):
+        try:
+            copies = requested_copies(api.payload)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        try:
+            record = reserve_copies(inv_id, copies)
+            if record:
+                return record, 200
+            if collection.count_documents({'inv_id': inv_id}, limit=1):
+                return {'message': 'Not enough copies available in inventory'}, 409
+            return {'message': 'Record not found'}, 404
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+
+@api.route('/inventory/<string:inv_id>/release')
+class ReleaseInventoryCopies(Resource):
+    @api.doc(description='Atomically return copies of an inventory item')
+    @api.expect(copies_model)
+    def post(self, inv_id):
+        try:
+            copies = requested_copies(api.payload)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        try:
+            record = release_copies(inv_id, copies)
+            if record:
+                return record, 200
+            return {'message': 'Record not found'}, 404
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+
+@api.route('/inventory/reserve-many')
+class ReserveManyInventoryCopies(Resource):
+    @api.doc(description='Take copies of several inventory items, as many as each one has available')
+    @api.expect(api.model('BulkReserveData', {
+        'copies': fields.Raw(required=True, description='Map of inv_id to the number of copies wanted')
+    }))
+    def post(self):
+        copies = (api.payload or {}).get('copies') or {}
+        if not isinstance(copies, dict) or not copies:
+            return {'error': 'No inventory copies provided for reservation'}, 400
+        if len(copies) > MAX_LOOKUP_IDS:
+            return {'error': f'At most {MAX_LOOKUP_IDS} inventory IDs can be reserved at once'}, 400
+        try:
+            copies = {inv_id: requested_copies({'copies': count}) for inv_id, count in copies.items()}
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        try:
+            return {'granted': reserve_many_copies(copies)}, 200
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+
+@api.route('/inventory/release-many')
+class ReleaseManyInventoryCopies(Resource):
+    @api.doc(description='Return copies for several inventory items with one bulk write')
+    @api.expect(api.model('BulkReleaseData', {
+        'copies': fields.Raw(required=True, description='Map of inv_id to the number of copies to return')
+    }))
+    def post(self):
+        copies = (api.payload or {}).get('copies') or {}
+        if not isinstance(copies, dict) or not copies:
+            return {'error': 'No inventory copies provided for release'}, 400
+        if len(copies) > MAX_LOOKUP_IDS:
+            return {'error': f'At most {MAX_LOOKUP_IDS} inventory IDs can be released at once'}, 400
+        try:
+            copies = {inv_id: requested_copies({'copies': count}) for inv_id, count in copies.items()}
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        try:
+            released, missing = release_many_copies(copies)
+            return {'released': released, 'missing': missing}, 200
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+
 @api.route('/archived_inventory/delete-all')
 class DeleteAllArchivedInventory(Resource):
     @api.doc(description='Delete all archived inventory records')
@@ -271,13 +655,35 @@ class DeleteAllArchivedInventory(Resource):
 
 
 
-def fetch_inventory_data():
-    inventory_api_url = 'http://10.20.100.30:5001/inventory/view-all'
-    #inventory_api_url = 'http://localhost:5001/inventory/view-all'  # Update URL as needed
-    response = requests.get(inventory_api_url)
-    inventory_data = response.json()
-    return inventory_data
+@api.route('/admin/indexes')
+class IndexStats(Resource):
+    @api.doc(description='Index usage statistics for the collections this service queries')
+    def get(self):
+        try:
+            return index_report(db), 200
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+
+
+@api.route('/health')
+class Health(Resource):
+    @api.doc(description='MongoDB reachability and connection pool utilisation')
+    def get(self):
+        health = mongo_health()
+        return health, 200 if health['status'] == 'ok' else 503
+
+
+@api.route('/metrics')
+class Metrics(Resource):
+    @api.doc(description='Request, stage, MongoDB and outbound HTTP latency histograms (Prometheus text format)')
+    def get(self):
+        return metrics_response()
+
+
+def create_app(app_config=None):
+    return build_app(__name__, api, 'inventory', 'Inventory API', 'API for Library Management System',
+                     databases=[db], app_config=dict({'UPLOAD_FOLDER': UPLOAD_FOLDER}, **(app_config or {})))
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
+    create_app().run(host=config.SERVER_HOST, port=config.INVENTORY_PORT, debug=config.SERVER_DEBUG)
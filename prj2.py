@@ -1,8 +1,7 @@
-from flask import Flask, request
-from flask_restx import Api, Resource, fields, reqparse, abort
-from pymongo import MongoClient
+from flask import g, has_request_context, request
+from flask_restx import Resource, fields, reqparse, abort
 from bson.objectid import ObjectId
-from flasgger import Swagger
+from pymongo.errors import BulkWriteError
 import datetime
 import csv, os, random, string
 from bson import json_util
@@ -12,9 +11,9 @@ import requests
 import sys
 import logging
 from bson import ObjectId
-import json
 from flask import jsonify
-from collections import defaultdict
+from collections import Counter, defaultdict
+import itertools
 from flask_restx import Namespace, Resource
 
 
@@ -22,19 +21,114 @@ from flask_restx import Namespace, Resource
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(parent_dir)
 
-# Configure the logging
-logging.basicConfig(level=logging.DEBUG)  # Set the logging level to DEBUG
-
-from prj1 import fetch_inventory_data
-
-app = Flask(__name__)
-swagger = Swagger(app)
-api = Api(app, version='1.0', title='Reservation API', description='API for Reservation Management')
-mongo_client = MongoClient('mongodb://localhost:27017/')
-db = mongo_client['reservations_db']
+from inventory_cache import InventoryCache
+from inventory_replica import InventoryReplica
+from inventory_transport import (fetch_inventory_changes, fetch_inventory_page, fetch_inventory_record,
+                                 fetch_inventory_records, inventory_transport, release_inventory_copies,
+                                 release_many_inventory_copies, reserve_inventory_copies,
+                                 reserve_many_inventory_copies)
+from service_client import CircuitOpenError, client_stats, reservation_client
+import config
+from pagination import (InvalidPageRequest, MAX_PAGE_LIMIT, count_total, keyset_page, keyset_query, merge_keyset_pages,
+                        merge_sorted, page_limit, page_number, wants_keyset)
+from reservation_listing import (InvalidListingQuery, TIE_BREAKER, parse_listing_args, plan_summary,
+                                 supported_combinations, supporting_index)
+from indexes import TOMBSTONE_TTL_SECONDS, index_report
+from mongo import get_database, mongo_health
+from quota import QuotaExceeded, ReservationQuota
+from background import Lease, PeriodicJob
+from metrics import metrics_response, stage
+from logs import trace
+from app_factory import build_app
+from expiry_sweeper import ExpirySweeper, RELEASE_PENDING_LEASE, RELEASE_RETRY_NOW, release_not_in_flight
+from history import HistoryArchiver, TERMINAL_RESERVATION_STATUSES
+from analytics import CLOSING_EVENTS, ROLLUP_DIMENSIONS, ROLLUP_PERIODS, ROLLUP_PROJECTION, ReservationRollups
+from csv_ingest import (BatchWriter, DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE, clamp_batch_size, iter_chunks,
+                        iter_csv_rows, normalise_header)
+
+api = Namespace('reservations', path='/', description='Reservations, their history and statistics')
+logger = logging.getLogger(__name__)
+db = get_database('reservations_db')
 collection = db['reservation12']
+history_collection = db['reservation_history']
+reservation_rollups = ReservationRollups(db['reservation_rollups'], [collection, history_collection])
 user_reservation_counts=db['usercounts']
 
+reservation_quota = ReservationQuota(
+    db['reservation_quotas'],
+    config.RESERVATION_QUOTA_LIMITS,
+    config.RESERVATION_QUOTA_USER_CLASSES
+)
+
+inventory_replica = InventoryReplica(
+    db['inventory_replica'],
+    db['replica_state'],
+    fetch_inventory_changes,
+    fetch_inventory_page,
+    source_db=get_database('inventory_db') if config.INVENTORY_REPLICA_CHANGE_STREAM else None,
+    batch_size=config.INVENTORY_REPLICA_BATCH_SIZE,
+    version_overlap=config.INVENTORY_REPLICA_VERSION_OVERLAP,
+    watch_seconds=config.INVENTORY_REPLICA_WATCH_SECONDS,
+    resync_after=datetime.timedelta(seconds=TOMBSTONE_TTL_SECONDS)
+)
+
+def replica_enabled():
+    # Co-located with the inventory service, the replica would only copy a
+    # collection this process already reads directly
+    return config.INVENTORY_REPLICA_ENABLED and inventory_transport().name == 'http'
+
+def load_inventory_record(inv_id):
+    # The local replica answers for every item it has seen. Only ids it does not know
+    # (e.g. created since the last sync) go to the inventory service; while that
+    # service is unreachable they cannot be confirmed, and the error is raised (503).
+    if not replica_enabled() or not inventory_replica.ready():
+        return fetch_inventory_record(inv_id)
+    record = inventory_replica.get(inv_id)
+    if record is None:
+        record = fetch_inventory_record(inv_id)
+    return record
+
+def load_inventory_records(inv_ids):
+    if not replica_enabled() or not inventory_replica.ready():
+        return fetch_inventory_records(inv_ids)
+    records = inventory_replica.get_many(inv_ids)
+    missing = [inv_id for inv_id in inv_ids if inv_id not in records]
+    if missing:
+        records.update(fetch_inventory_records(missing))
+    return records
+
+STALE_INVENTORY_HEADER = 'X-Inventory-Stale-Seconds'
+
+def note_stale_inventory(inv_id, age):
+    # Remember how old the stalest inventory record used by this request was
+    if has_request_context():
+        g.inventory_stale_seconds = max(age, g.get('inventory_stale_seconds', 0.0))
+
+inventory_cache = InventoryCache(
+    load_inventory_record,
+    load_inventory_records,
+    ttl=config.INVENTORY_CACHE_TTL,
+    max_entries=config.INVENTORY_CACHE_MAX_ENTRIES,
+    stale_ttl=config.INVENTORY_CACHE_STALE_TTL,
+    on_stale=note_stale_inventory
+)
+
+def add_inventory_staleness(response):
+    age = g.pop('inventory_stale_seconds', None)
+    if age is not None:
+        response.headers[STALE_INVENTORY_HEADER] = f'{age:.3f}'
+        response.headers['Warning'] = '110 - "Response is Stale"'
+    return response
+
+@api.errorhandler(CircuitOpenError)
+def inventory_unavailable(e):
+    return {'message': f'Error: {e}'}, 503, {'Retry-After': str(max(1, int(e.retry_after + 0.999)))}
+
+@api.errorhandler(requests.RequestException)
+def inventory_unreachable(e):
+    # Registered after CircuitOpenError, which is a RequestException too and is matched first
+    return {'message': f'Error: {e}'}, 503
+
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'csv'}
 
@@ -63,62 +157,205 @@ def generate_reservation_id():
     random_suffix = ''.join(random.choices(string.digits, k=4))
     return f'r{timestamp}{random_suffix}'
 
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (datetime, ObjectId)):  # Add ObjectId if needed
-            return obj.isoformat()
-        return super().default(obj)
+def reservation_id_sequence():
+    # generate_reservation_id() only has 4 random digits per second, so batches share
+    # one generated prefix and number their ids sequentially after it
+    prefix = generate_reservation_id()
+    for sequence in itertools.count():
+        yield f'{prefix}{sequence:06d}'
 
-app.json_encoder = CustomJSONEncoder
+def generate_reservation_ids(count):
+    return list(itertools.islice(reservation_id_sequence(), count))
 
 # Define the function to reduce inventory copies
 def reduce_inventory_copies(inv_id, num_copies_to_reduce):
-    # Lookup the inventory record by inv_id in your inventory data
-    inventory_record = find_inventory_record_by_id(inv_id)
-
-    if inventory_record is not None:
-        inv_copies = inventory_record.get('inv_copies', 0)
-        if int(inv_copies) >= num_copies_to_reduce:
-            # Reduce the inventory copies by the specified amount
-            #inventory_record['inv_copies'] = int(inv_copies) - num_copies_to_reduce
-            # Save the updated inventory record back to your data store
-            updated_inv_copies = int(inv_copies) - num_copies_to_reduce
-            inventory_record['inv_copies'] = updated_inv_copies
-
-            # Save the updated inventory record back to your data store
-            save_inventory_record(inventory_record)  # Implement this function
-
-            # Return True to indicate success
-            return True
-        else:
-            # Return False to indicate not enough copies
-            return False
+    # One atomic conditional decrement on the inventory service; False if the
+    # record was not found or does not have enough copies
+    try:
+        return reserve_inventory_copies(inv_id, num_copies_to_reduce) is not None
+    finally:
+        inventory_cache.invalidate(inv_id)
+
+# Function to find an inventory record by inv_id
+def find_inventory_record_by_id(inv_id, fields=None):
+    # Served from the inventory cache; returns None if the inv_id is unknown
+    record = inventory_cache.get(inv_id)
+    if record is not None and fields:
+        record = {field: record[field] for field in ('inv_id', *fields) if field in record}
+    return record
+
+
+upload_parser = reqparse.RequestParser()
+upload_parser.add_argument('file', location='files', type=FileStorage, required=True)
+upload_parser.add_argument('batch_size', location='args', type=int, default=DEFAULT_BATCH_SIZE,
+                           help=f'Rows per insert_many batch (max {MAX_BATCH_SIZE})')
+
+# Normalised CSV header -> reservation field
+RESERVATION_CSV_FIELDS = {
+    'reservation_id': 'reservation_id',
+    'reserved_user': 'Reserved_user',
+    'reserved_user_email': 'Reserved_user_email',
+    'reserved_user_mail': 'Reserved_user_email',
+    'reservation_created_date': 'Reservation_created_date',
+    'inv_id': 'inv_id',
+    'inv_name': 'inv_name',
+    'inv_desc': 'inv_description',
+    'inv_description': 'inv_description',
+    'inv_type': 'inv_type',
+    'reservation_status': 'Reservation_status',
+    'reservation_status_comments': 'Reservation_status_comments',
+    'reservation_expiry_date': 'Reservation_expiry_date',
+    'books': 'Books',
+    'inv_copies': 'inv_copies',
+}
+RESERVATION_CSV_DATE_FORMATS = ('%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S',
+                                '%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y')
+MAX_REPORTED_REJECTIONS = 100
+
+def parse_csv_date(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    for date_format in RESERVATION_CSV_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise ValueError(f'Unrecognised date {value!r}')
+
+def is_seekable(stream):
+    try:
+        return stream.seekable()
+    except AttributeError:
+        return hasattr(stream, 'seek')
+
+def read_reservation_csv(stream):
+    rows = iter_csv_rows(stream)
+    rows.fieldnames = [RESERVATION_CSV_FIELDS.get(normalise_header(name), normalise_header(name))
+                       for name in rows.fieldnames or []]
+    return rows
+
+def coerce_reservation_rows(rows, known_inventory, imported_at):
+    # Returns (documents, rejections) for one chunk; rejections are (row number, error)
+    documents, rejections = [], []
+    for row_number, row in rows:
+        row = {field: value.strip() if isinstance(value, str) else value
+               for field, value in row.items() if field is not None}
+        inv_id = row.get('inv_id') or ''
+        if inv_id and inv_id not in known_inventory:
+            rejections.append((row_number, f'inv_id {inv_id} does not exist in the inventory'))
+            continue
+        try:
+            created_date = parse_csv_date(row.get('Reservation_created_date')) or imported_at
+            expiry_date = (parse_csv_date(row.get('Reservation_expiry_date'))
+                           or created_date + datetime.timedelta(days=30))
+            inv_copies = int(row.get('inv_copies') or 1)
+        except ValueError as e:
+            rejections.append((row_number, str(e)))
+            continue
+
+        document = dict(row,
+                        Reservation_created_date=created_date,
+                        Reservation_expiry_date=expiry_date,
+                        Reservation_status=row.get('Reservation_status') or 'Reserved',
+                        inv_copies=inv_copies)
+        if inv_id:
+            record = known_inventory[inv_id]
+            for field in ('inv_name', 'inv_description', 'inv_type', 'inv_blob', 'inv_archive_status'):
+                if not document.get(field):
+                    document[field] = record.get(field, '')
+        documents.append(document)
+    return documents, rejections
+
+@api.route('/reservation/upload')
+class UploadReservationsCSV(Resource):
+    @api.doc(description='Import reservations from a CSV sheet')
+    @api.expect(upload_parser)
+    def post(self):
+        args = upload_parser.parse_args()
+        uploaded_file = args['file']
+        batch_size = clamp_batch_size(args.get('batch_size'))
+
+        if not allowed_file(uploaded_file.filename or ''):
+            return {'error': 'Only .csv files can be imported'}, 400
+
+        try:
+            return import_reservations(uploaded_file.stream, batch_size)
+        except Exception as e:
+            return {'error': f'An error occurred while importing reservations: {e}'}, 500
+
+def import_reservations(stream, batch_size):
+    # Historical imports do not count against the monthly quota. They do hold
+    # copies, which are taken in one aggregated request once every row is written.
+    known_inventory = {}
+    if is_seekable(stream):
+        # First pass only collects inv_ids, so they are validated with one batched lookup
+        inv_ids = {(row.get('inv_id') or '').strip() for row in read_reservation_csv(stream)}
+        inv_ids.discard('')
+        known_inventory = inventory_cache.get_many(inv_ids)
+        stream.seek(0)
+        prefetched = True
     else:
-        # Return False to indicate that the record was not found
-        return False
-
-def save_inventory_record(inventory_record):
-    # Connect to your MongoDB
-    client = MongoClient('mongodb://localhost:27017')
-    db = client['inventory_db']  # Replace with your actual database name
-    collection = db['inventory_items']  # Replace with your actual collection name
-
-    # Update the inventory record in the collection
-    collection.update_one({'inv_id': inventory_record['inv_id']}, {'$set': inventory_record})
-    
-    # Close the MongoDB connection
-    client.close()
-
-# Function to find an inventory record by inv_id (you'll need to implement this)
-def find_inventory_record_by_id(inv_id):
-    # Implement the logic to find an inventory record by inv_id from your data store
-    # Return the inventory record if found, or None if not found
-    # Example:
-    inventory_data = fetch_inventory_data()  # Fetch your inventory data
-    for record in inventory_data['data']:
-        if record['inv_id'] == inv_id:
-            return record
-    return None
+        prefetched = False
+
+    copies_held = Counter()
+
+    def count_held_copies(documents):
+        reservation_rollups.record('created', documents)
+        for document in documents:
+            if document.get('inv_id') and document['Reservation_status'] not in TERMINAL_RESERVATION_STATUSES:
+                copies_held[document['inv_id']] += document['inv_copies']
+
+    writer = BatchWriter(collection, batch_size, on_written=count_held_copies)
+    imported_at = datetime.datetime.utcnow()
+    # One prefix for the whole import; a prefix per chunk could repeat within a second
+    reservation_ids = reservation_id_sequence()
+    total_rows = 0
+    rejected = 0
+    rejections = []
+
+    # Row numbers count the header as row 1, like a spreadsheet
+    rows = enumerate(read_reservation_csv(stream), start=2)
+    for chunk in iter_chunks(rows, batch_size):
+        if not prefetched:
+            new_inv_ids = {(row.get('inv_id') or '').strip() for _, row in chunk} - set(known_inventory)
+            new_inv_ids.discard('')
+            if new_inv_ids:
+                known_inventory.update(inventory_cache.get_many(new_inv_ids))
+
+        documents, chunk_rejections = coerce_reservation_rows(chunk, known_inventory, imported_at)
+        missing_ids = [document for document in documents if not document.get('reservation_id')]
+        for document in missing_ids:
+            document['reservation_id'] = next(reservation_ids)
+        for document in documents:
+            writer.add(document)
+
+        total_rows += len(chunk)
+        rejected += len(chunk_rejections)
+        rejections.extend(chunk_rejections[:MAX_REPORTED_REJECTIONS - len(rejections)])
+    writer.flush()
+
+    granted, copies_shortfall = {}, {}
+    if copies_held:
+        try:
+            granted = reserve_many_inventory_copies(dict(copies_held))
+        finally:
+            for inv_id in copies_held:
+                inventory_cache.invalidate(inv_id)
+        copies_shortfall = {inv_id: count - granted.get(inv_id, 0)
+                            for inv_id, count in copies_held.items() if granted.get(inv_id, 0) < count}
+
+    return {
+        'message': 'Reservations imported successfully' if not (writer.errors or rejected) else 'Reservations imported with errors',
+        'total_rows': total_rows,
+        'inserted': writer.inserted,
+        'rejected': rejected,
+        'rejections': [{'row': row_number, 'error': error} for row_number, error in rejections],
+        'batches': writer.summary(),
+        'errors': writer.errors,
+        'copies_reserved': {inv_id: count for inv_id, count in granted.items() if count},
+        'copies_shortfall': copies_shortfall
+    }, 200 if not (writer.errors or rejected) else 207
 
 
 user_inv_reservations={}
@@ -127,61 +364,33 @@ class CreateReservation(Resource):
     @api.doc(description='Create a new reservation', body=reservation_model)
     def post(self):
         reservation_data = api.payload
-        inventory_data = fetch_inventory_data()
         # Ensure a unique reservation_id is generated for each reservation
         reservation_id = generate_reservation_id()
         
-        # Initialize inv_id_set here
-        inv_id_set = set()
         inv_copies = reservation_data.get('inv_copies')
         
         
-        logging.debug(f'reservation_data: {reservation_data}')
-        logging.debug(f'inventory_data: {inventory_data}')
-        logging.debug(f'reservation_id: {reservation_id}')
-        logging.debug(f'inv_id_set: {inv_id_set}')
+        trace(logger, 'Creating reservation %s', reservation_id, reservation_data=reservation_data)
 
         # Strip leading and trailing whitespace from inv_id
         inv_id = reservation_data['inv_id'].strip()
-        inv_description = None
-        inv_name = None
-        inv_blob = None
-        inv_archive_status = None
-        requested_copies = None  # Change inv_copies to requested_copies
-        inv_type = None  # Initialize inv_type
-
-        for item in inventory_data['data']:
-            if item['inv_id'] == inv_id:
-                inv_name = item.get('inv_name', '')
-                inv_description = item.get('inv_description', '')
-                inv_type = item.get('inv_type', '')  # Initialize inv_type here
-                inv_blob = item.get('inv_blob', '')
-                inv_archive_status = item.get('inv_archive_status', '')
-                break
-
-    
-        # Log inv_id values before the check
-        logging.debug(f'inv_id from reservation_data: {inv_id}')
-        logging.debug(f'inv_id from inventory_data: {inv_id_set}')
-
-        # Log inv_description and inv_type here
-        logging.debug(f'inv_description: {inv_description}')
-        logging.debug(f'inv_type: {inv_type}')
-        logging.debug(f'inv_blob: {inv_blob}')
-        logging.debug(f'inv_archive_status: {inv_archive_status}')
-       
-        
 
-        # Extract required fields from the inventory data
-        if 'data' in inventory_data and len(inventory_data['data']) > 0:
-            inv_id_set = set(item['inv_id'] for item in inventory_data['data'])
-        else:
-            abort(500, error='No inventory data available')
-
-        # Verify that inv_id is in inv_id_set
-        if inv_id not in inv_id_set:
+        # Verify that inv_id exists in the inventory
+        with stage('inventory_lookup'):
+            inventory_record = find_inventory_record_by_id(
+                inv_id, ['inv_name', 'inv_description', 'inv_type', 'inv_blob', 'inv_archive_status'])
+        if inventory_record is None:
             abort(400, error=f'inv_id {inv_id} does not exist in the inventory')
 
+        inv_name = inventory_record.get('inv_name', '')
+        inv_description = inventory_record.get('inv_description', '')
+        inv_type = inventory_record.get('inv_type', '')
+        inv_blob = inventory_record.get('inv_blob', '')
+        inv_archive_status = inventory_record.get('inv_archive_status', '')
+
+        trace(logger, 'Inventory record for %s', inv_id, inv_description=inv_description, inv_type=inv_type,
+              inv_blob=inv_blob, inv_archive_status=inv_archive_status)
+
         inv_id = request.json['inv_id']
         
 
@@ -197,81 +406,26 @@ class CreateReservation(Resource):
         # Calculate the Reservation_expiry_date (30 days after the creation date)
         reservation_expiry_date = current_datetime + datetime.timedelta(days=30)
 
-        # Query the user reservation count for this month
-        user_reservation_count_doc = user_reservation_counts.find_one({
-            'Reserved_user': user,
-            'counts.reservation_month': current_datetime.month
-        })
-
-        if user_reservation_count_doc is None:
-            # User doesn't exist in the schema for this month, create a new document with count 1
-            user_reservation_counts.insert_one({
+        with stage('duplicate_check'):
+            existing_reservation = collection.find_one({
                 'Reserved_user': user,
-                'counts': [
-                    {
-                        'reservation_month': current_datetime.month,
-                        'reservation_count': 1,
-                        'inv_names': inv_name,
-                        'inv_copies': [requested_copies]
-                    }
-                ]
+                'inv_id': inv_id
             })
-            user_reservation_count = 1
-        else:
-            # User exists for this month, get their current count
-            current_counts = user_reservation_count_doc.get('counts', [])
-            current_count = 0
-
-            # Find the current reservation count for this month
-            for count_entry in current_counts:
-                if count_entry['reservation_month'] == current_datetime.month:
-                    current_count = count_entry['reservation_count']
-            
-            current_month=datetime.datetime.now().month
-            
-            
-            if current_count >= 3:
-                # If the user exceeds the maximum limit of reservations for this month, return an error
-                abort(400, error='Maximum 3 reservations allowed per month')
-            
-            existing_reservation = collection.find_one({
-            'Reserved_user': user,
-            'inv_id': inv_id
-             })
 
-            if existing_reservation:
-                return {'message': 'User already has a reservation for the same inv_id'}, 400
-            
-        
-            if inv_copies > 1:
-               return {'message': 'You can only reserve 1 copy of the inventory'}, 400
-
-
-            # Add the inv_id and inv_copies to the last count
-            for count_entry in current_counts:
-                if count_entry['reservation_month'] == current_datetime.month:
-                    count_entry_inv_names = count_entry.get('inv_names', [])
-                    if not isinstance(count_entry_inv_names, list):
-                        count_entry_inv_names = [count_entry_inv_names]
-                    count_entry_inv_names.append(inv_name)
-                    count_entry['reservation_count'] += 1
-                    count_entry['inv_names'] = count_entry_inv_names
-                    user_reservation_counts.update_one(
-                        {'Reserved_user': user},
-                        {'$set': {'counts': current_counts}}
-                    )
-                    user_reservation_count = count_entry['reservation_count']
-                    break
-        
-        print(f'Reservation data: {reservation_data}')
-        print(f'inv_id: {inv_id}')
-        print(f'Reducing inventory copies...')
+        if existing_reservation:
+            return {'message': 'User already has a reservation for the same inv_id'}, 400
 
-        if reduce_inventory_copies(inv_id, inv_copies):
-            print(f'Inventory copies reduced successfully')
-        else:
-            abort(400, error='Not enough copies available in inventory')
+        if inv_copies > 1:
+            return {'message': 'You can only reserve 1 copy of the inventory'}, 400
 
+        # Take one unit of this month's quota in a single atomic round trip
+        try:
+            with stage('quota'):
+                user_reservation_count = reservation_quota.acquire(user, current_datetime)
+        except QuotaExceeded as e:
+            # If the user exceeds the maximum limit of reservations for this month, return an error
+            abort(400, error=str(e))
+        
 
         #if reduce_inventory_copies(inv_id, 1):
             #print(f'Inventory copies reduced successfully')
@@ -293,7 +447,27 @@ class CreateReservation(Resource):
            
         }
 
-        result = collection.insert_one(new_reservation)
+        trace(logger, 'Reducing inventory copies for %s', inv_id, inv_copies=inv_copies)
+        copies_reserved = False
+        try:
+            with stage('reserve_copies'):
+                copies_reserved = reduce_inventory_copies(inv_id, inv_copies)
+            if copies_reserved:
+                trace(logger, 'Inventory copies reduced for %s', inv_id)
+                with stage('insert'):
+                    result = collection.insert_one(new_reservation)
+        except Exception:
+            # Any failure (inventory service unreachable or erroring, insert failed) gives
+            # back the quota and the copies already taken, as create_reservations does
+            reservation_quota.release(user, current_datetime)
+            if copies_reserved:
+                increase_inventory_copies(inv_id, inv_copies)
+            raise
+        if not copies_reserved:
+            # Give the quota back, nothing was reserved
+            reservation_quota.release(user, current_datetime)
+            abort(400, error='Not enough copies available in inventory')
+        reservation_rollups.record('created', [new_reservation])
 
         if result.inserted_id:
                 inserted_id = str(result.inserted_id)
@@ -308,6 +482,178 @@ class CreateReservation(Resource):
             
        
         
+MAX_BATCH_RESERVATIONS = 1000
+
+reservation_entry_model = api.model('ReservationEntry', {
+    'Reserved_user': fields.String(required=True, description='Name of the user making the reservation'),
+    'Reserved_user_email': fields.String(required=True, description='Reserverd user email'),
+    'inv_id': fields.String(required=True, description='the inventory id'),
+})
+
+@api.route('/reservations/create-many')
+class CreateManyReservations(Resource):
+    @api.doc(description='Create reservations for several users in one request')
+    @api.expect(api.model('CreateManyReservations', {
+        'reservations': fields.List(fields.Nested(reservation_entry_model), required=True,
+                                    description=f'Reservations to create (max {MAX_BATCH_RESERVATIONS})')
+    }))
+    def post(self):
+        entries = (api.payload or {}).get('reservations') or []
+        if not entries:
+            return {'error': 'No reservations provided'}, 400
+        if len(entries) > MAX_BATCH_RESERVATIONS:
+            return {'error': f'At most {MAX_BATCH_RESERVATIONS} reservations can be created at once'}, 400
+
+        try:
+            results, created = create_reservations(entries)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            return {'error': f'An error occurred while creating reservations: {str(e)}'}, 500
+
+        if created:
+            return {'message': f'{created} reservations created successfully', 'results': results}, 201
+        return {'message': 'No reservations created', 'results': results}, 400
+
+def create_reservations(entries):
+    # Every check runs once for the whole batch: one inventory lookup, one duplicate
+    # query, one quota bulk write, one bulk copy reservation and one insert_many.
+    results = [None] * len(entries)
+    pending = []
+
+    def fail(index, error):
+        results[index] = {'index': index, 'status': 'error', 'error': error}
+
+    for index, entry in enumerate(entries):
+        entry = entry if isinstance(entry, dict) else {}
+        user = entry.get('Reserved_user')
+        email = entry.get('Reserved_user_email')
+        inv_id = (entry.get('inv_id') or '').strip()
+        if not user or not email or not inv_id:
+            fail(index, 'Reserved_user, Reserved_user_email and inv_id are required')
+        else:
+            pending.append((index, user, email, inv_id))
+
+    inventory_records = inventory_cache.get_many({inv_id for _, _, _, inv_id in pending})
+    existing_pairs = set()
+    if pending:
+        existing_pairs = {
+            (reservation['Reserved_user'], reservation['inv_id'])
+            for reservation in collection.find(
+                {'Reserved_user': {'$in': list({user for _, user, _, _ in pending})},
+                 'inv_id': {'$in': list({inv_id for _, _, _, inv_id in pending})}},
+                {'_id': 0, 'Reserved_user': 1, 'inv_id': 1}
+            )
+        }
+
+    checked = []
+    for index, user, email, inv_id in pending:
+        if inv_id not in inventory_records:
+            fail(index, f'inv_id {inv_id} does not exist in the inventory')
+        elif (user, inv_id) in existing_pairs:
+            fail(index, 'User already has a reservation for the same inv_id')
+        else:
+            # Later entries for the same user and inv_id in this batch are duplicates too
+            existing_pairs.add((user, inv_id))
+            checked.append((index, user, email, inv_id))
+
+    current_datetime = datetime.datetime.utcnow()
+    quota_granted = reservation_quota.acquire_many(Counter(user for _, user, _, _ in checked), current_datetime)
+    with_quota = []
+    for index, user, email, inv_id in checked:
+        if quota_granted.get(user, 0) > 0:
+            quota_granted[user] -= 1
+            with_quota.append((index, user, email, inv_id))
+        else:
+            fail(index, f'Maximum {reservation_quota.limit_for(user)} reservations allowed per month')
+
+    copies_granted = {}
+    if with_quota:
+        try:
+            copies_granted = reserve_many_inventory_copies(Counter(inv_id for _, _, _, inv_id in with_quota))
+        except Exception:
+            reservation_quota.release_many((user, current_datetime) for _, user, _, _ in with_quota)
+            raise
+        finally:
+            for inv_id in {inv_id for _, _, _, inv_id in with_quota}:
+                inventory_cache.invalidate(inv_id)
+
+    reservable, quota_refunds = [], []
+    for index, user, email, inv_id in with_quota:
+        if copies_granted.get(inv_id, 0) > 0:
+            copies_granted[inv_id] -= 1
+            reservable.append((index, user, email, inv_id))
+        else:
+            fail(index, 'Not enough copies available in inventory')
+            quota_refunds.append((user, current_datetime))
+
+    reservation_expiry_date = current_datetime + datetime.timedelta(days=30)
+    documents = []
+    for (index, user, email, inv_id), reservation_id in zip(reservable, generate_reservation_ids(len(reservable))):
+        record = inventory_records[inv_id]
+        documents.append({
+            'reservation_id': reservation_id,
+            'Reserved_user': user,
+            'Reserved_user_email': email,
+            'Reservation_created_date': current_datetime,
+            'inv_id': inv_id,
+            'inv_type': record.get('inv_type', ''),
+            'inv_name': record.get('inv_name', ''),
+            'inv_description': record.get('inv_description', ''),
+            'inv_blob': record.get('inv_blob', ''),
+            'inv_archive_status': record.get('inv_archive_status', ''),
+            'Reservation_status': 'Reserved',
+            'Reservation_status_comments': 'Requesed and approved',
+            'Reservation_expiry_date': reservation_expiry_date,
+            'inv_copies': 1
+        })
+
+    failed_inserts = {}
+    if documents:
+        try:
+            collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            failed_inserts = {error['index']: error.get('errmsg') for error in e.details.get('writeErrors', [])}
+        except Exception as e:
+            # Some documents may have been written before the failure; everything
+            # that cannot be found is refunded below like a rejected insert.
+            try:
+                inserted = {reservation['reservation_id'] for reservation in collection.find(
+                    {'reservation_id': {'$in': [document['reservation_id'] for document in documents]}},
+                    {'_id': 0, 'reservation_id': 1}
+                )}
+            except Exception:
+                inserted = set()
+            failed_inserts = {position: str(e) for position, document in enumerate(documents)
+                              if document['reservation_id'] not in inserted}
+
+    reservation_rollups.record('created', [document for position, document in enumerate(documents)
+                                           if position not in failed_inserts])
+
+    copies_refunds = Counter()
+    created = 0
+    for position, ((index, user, _, inv_id), document) in enumerate(zip(reservable, documents)):
+        if position in failed_inserts:
+            fail(index, f'Reservation creation failed: {failed_inserts[position]}')
+            quota_refunds.append((user, current_datetime))
+            copies_refunds[inv_id] += 1
+        else:
+            created += 1
+            results[index] = {
+                'index': index,
+                'status': 'created',
+                'reservation_id': document['reservation_id'],
+                '_id': str(document['_id'])
+            }
+
+    # Give back whatever was taken for entries that did not end up as reservations
+    if quota_refunds:
+        reservation_quota.release_many(quota_refunds)
+    if copies_refunds:
+        release_many_inventory_copies(dict(copies_refunds))
+
+    return results, created
+
 """
 @api.route('/reservation/update/<string:reservation_id>')
 class UpdateReservation(Resource):
@@ -366,29 +712,44 @@ class UpdateReservation(Resource):
             update_data = api.payload
             new_status = update_data.get('Reservation_status')
             new_comments = update_data.get('Reservation_status_comments')
+            previous_status = reservation.get('Reservation_status')
+
+            if new_status == 'Returned':
+                # Same path as bulk returns: the status flips first and the copies are
+                # released after, with the release left pending until it succeeds
+                try:
+                    response, _ = return_reservations(
+                        [reservation_id], new_comments or reservation.get('Reservation_status_comments'))
+                except Exception as e:
+                    return {'message': f'Error: {e}'}, 500
+                outcome = response['results'][reservation_id]
+                if outcome in ('returned', 'returned_inventory_missing'):
+                    return {'message': 'Reservation updated successfully'}, 200
+                if outcome == 'release_pending' and 'error' in response:
+                    return {'message': 'Reservation updated, giving its copies back failed and will be retried'}, 202
+                return {'message': 'Failed to update reservation'}, 500
 
             if new_status:
                 # Update the Reservation_status
                 reservation['Reservation_status'] = new_status
 
-                # If the new status indicates a return (e.g., 'Returned'), update inventory copies
-                if new_status == 'Returned':
-                    returned_inv_id = reservation.get('inv_id')
-                    # Increase the inv_copies in the inventory
-                    increase_inventory_copies(returned_inv_id)
-
             if new_comments and reservation['Reservation_status'] != new_status:
                 # Update the Reservation_status_comments
                 reservation['Reservation_status_comments'] = new_comments
 
             if new_status or new_comments:
+                changes = {
+                    'Reservation_status': reservation['Reservation_status'],
+                    'Reservation_status_comments': reservation['Reservation_status_comments']
+                }
+                if new_status in TERMINAL_RESERVATION_STATUSES and previous_status != new_status:
+                    changes['Reservation_closed_date'] = datetime.datetime.utcnow()
                 updated_result = collection.update_one(
                     {'reservation_id': reservation_id},
-                    {'$set': {
-                        'Reservation_status': reservation['Reservation_status'],
-                        'Reservation_status_comments': reservation['Reservation_status_comments']
-                    }}
+                    {'$set': changes}
                 )
+                if 'Reservation_closed_date' in changes and updated_result.modified_count:
+                    reservation_rollups.record(CLOSING_EVENTS[new_status], [dict(reservation, **changes)])
 
             if updated_result.modified_count > 0:
                 return {'message': 'Reservation updated successfully'}, 200
@@ -397,12 +758,18 @@ class UpdateReservation(Resource):
         else:
             return {'message': 'Reservation not found'}, 404
 
-def increase_inventory_copies(inv_id):
-    # Find the inventory item by inv_id and increment the inv_copies count
-    inventory_item = find_inventory_record_by_id(inv_id)
-    if inventory_item:
-        inventory_item['inv_copies'] = inventory_item.get('inv_copies', 0) + 1
-        save_inventory_record(inventory_item)
+def increase_inventory_copies(inv_id, num_copies_to_increase=1):
+    # Atomically give the copies back to the inventory item
+    try:
+        return release_inventory_copies(inv_id, num_copies_to_increase) is not None
+    finally:
+        inventory_cache.invalidate(inv_id)
+
+def release_reservation_quota(reservation):
+    # Returned or cancelled reservations give back the quota of the month they were made in
+    created_date = reservation.get('Reservation_created_date')
+    if isinstance(created_date, datetime.datetime):
+        reservation_quota.release(reservation['Reserved_user'], created_date)
 
 # Rest of your code
 
@@ -424,26 +791,131 @@ class UpdateManyReservations(Resource):
             return {'error': 'No reservation IDs provided for update'}, 400
 
         try:
+            if new_status == 'Returned':
+                return return_reservations(reservation_ids, new_comments)
+
+            changes = {
+                'Reservation_status': new_status,
+                'Reservation_status_comments': new_comments
+            }
+            closing = []
+            if new_status in TERMINAL_RESERVATION_STATUSES:
+                changes['Reservation_closed_date'] = datetime.datetime.utcnow()
+                # Reservations entering this status now, for the analytics rollups
+                closing = list(collection.find(
+                    {'reservation_id': {'$in': reservation_ids}, 'Reservation_status': {'$ne': new_status}},
+                    ROLLUP_PROJECTION
+                ))
             updated_result = collection.update_many(
                 {'reservation_id': {'$in': reservation_ids}},
-                {'$set': {
-                    'Reservation_status': new_status,
-                    'Reservation_status_comments': new_comments
-                }}
+                {'$set': changes}
             )
+            if closing:
+                reservation_rollups.record(CLOSING_EVENTS[new_status], closing, changes['Reservation_closed_date'])
 
             if updated_result.modified_count > 0:
-                for reservation_id in reservation_ids:
-                    reservation = collection.find_one({'reservation_id': reservation_id})
-                    if reservation:
-                        if new_status == 'Returned':
-                            returned_inv_id = reservation.get('inv_id')
-                            increase_inventory_copies(returned_inv_id)
                 return {'message': f'{updated_result.modified_count} reservations updated successfully'}, 200
             else:
                 return {'message': 'No reservations updated'}, 404
         except Exception as e:
             return {'error': f'An error occurred while updating reservations: {str(e)}'}, 500
+
+def return_reservations(reservation_ids, comments):
+    # Bulk return: flip the status only on reservations that are not returned yet,
+    # tagging them with a batch id so exactly those documents count as returned
+    # (rollups, quota) once. Giving the copies back is claimed separately through
+    # Reservation_release_batch and stays pending until the inventory service has
+    # taken them; a failed release is retried by the expiry sweeper or by
+    # returning the same ids again.
+    return_batch = str(ObjectId())
+    now = datetime.datetime.utcnow()
+    updated_result = collection.update_many(
+        {'reservation_id': {'$in': reservation_ids}, 'Reservation_status': {'$ne': 'Returned'},
+         **release_not_in_flight(now)},
+        {'$set': {
+            'Reservation_status': 'Returned',
+            'Reservation_status_comments': comments,
+            'Reservation_return_batch': return_batch,
+            'Reservation_release_batch': return_batch,
+            'Reservation_release_pending': now,
+            'Reservation_closed_date': now
+        }}
+    )
+    retried_result = collection.update_many(
+        {'reservation_id': {'$in': reservation_ids}, 'Reservation_status': 'Returned',
+         'Reservation_release_pending': {'$lt': now - RELEASE_PENDING_LEASE}},
+        {'$set': {'Reservation_release_batch': return_batch, 'Reservation_release_pending': now}}
+    )
+
+    reservations = collection.find(
+        {'reservation_id': {'$in': reservation_ids}},
+        dict(ROLLUP_PROJECTION, reservation_id=1, inv_copies=1, Reservation_return_batch=1,
+             Reservation_release_batch=1, Reservation_copies_released=1, Reservation_release_pending=1)
+    )
+
+    results = {reservation_id: 'not_found' for reservation_id in reservation_ids}
+    copies_by_inv_id = Counter()
+    returned = []
+    releasing = []
+    for reservation in reservations:
+        if reservation.get('Reservation_release_batch') != return_batch:
+            # A release still pending belongs to a return or a sweep in progress
+            pending = reservation.get('Reservation_release_pending') is not None
+            results[reservation['reservation_id']] = 'release_pending' if pending else 'already_returned'
+            continue
+        results[reservation['reservation_id']] = 'returned'
+        if reservation.get('Reservation_return_batch') == return_batch:
+            returned.append(reservation)
+        releasing.append(reservation)
+        # Expired reservations had their copies released by the expiry sweeper
+        if not reservation.get('Reservation_copies_released'):
+            copies_by_inv_id[reservation['inv_id']] += reservation.get('inv_copies') or 1
+
+    if returned:
+        reservation_rollups.record('returned', returned)
+        reservation_quota.release_many(
+            (reservation['Reserved_user'], reservation['Reservation_created_date'])
+            for reservation in returned
+            if isinstance(reservation.get('Reservation_created_date'), datetime.datetime)
+        )
+
+    claimed = {'reservation_id': {'$in': reservation_ids}, 'Reservation_release_batch': return_batch}
+    missing_inv_ids = set()
+    release_error = None
+    if copies_by_inv_id:
+        try:
+            missing_inv_ids = set(release_many_inventory_copies(dict(copies_by_inv_id)))
+        except Exception as e:
+            logger.warning('Releasing copies of %d returned reservations failed, left pending: %s', len(releasing), e)
+            collection.update_many(claimed, {'$set': {'Reservation_release_pending': RELEASE_RETRY_NOW}})
+            release_error = str(e)
+        finally:
+            for inv_id in copies_by_inv_id:
+                inventory_cache.invalidate(inv_id)
+    if releasing and release_error is None:
+        collection.update_many(claimed, {'$set': {'Reservation_copies_released': True},
+                                         '$unset': {'Reservation_release_pending': ''}})
+    for reservation in releasing:
+        if release_error is not None:
+            results[reservation['reservation_id']] = 'release_pending'
+        elif reservation['inv_id'] in missing_inv_ids:
+            results[reservation['reservation_id']] = 'returned_inventory_missing'
+
+    updated_count = updated_result.modified_count + retried_result.modified_count
+    if release_error is not None:
+        # The statuses did change; only the copies are still to go back
+        return {
+            'message': f'{updated_count} reservations updated, giving their copies back failed and will be retried',
+            'results': results,
+            'error': release_error
+        }, 207
+    if updated_count > 0:
+        return {
+            'message': f'{updated_count} reservations updated successfully',
+            'results': results,
+            'released_copies': dict(copies_by_inv_id)
+        }, 200
+    return {'message': 'No reservations updated', 'results': results}, 404
             
 @api.route('/reservation/delete/<string:reservation_id>')
 class DeleteReservation(Resource):
@@ -473,6 +945,12 @@ class DeleteReservation(Resource):
             # Delete the reservation
             result = collection.delete_one({'reservation_id': reservation_id})
             if result.deleted_count > 0:
+                # A returned reservation already gave its quota back
+                if reservation.get('Reservation_status') != 'Returned':
+                    release_reservation_quota(reservation)
+                # Closed reservations were counted when they closed
+                if reservation.get('Reservation_status') not in TERMINAL_RESERVATION_STATUSES:
+                    reservation_rollups.record('cancelled', [reservation], when=datetime.datetime.utcnow())
                 return {'message': 'Reservation cancelled successfully'}, 200
             else:
                 return {'message': 'Failed to cancel reservation'}, 500
@@ -594,6 +1072,12 @@ class DeleteReservation(Resource):
         else:
             return {'message': 'Reservation not found'}, 404
 """
+@api.route('/reservation/quota/<string:user>')
+class ReservationQuotaUsage(Resource):
+    @api.doc(description="A user's reservation count and limit for the current month")
+    def get(self, user):
+        return reservation_quota.usage(user), 200
+
 @api.route('/reservations/delete-all')
 class DeleteAllReservations(Resource):
     @api.doc(description='Delete all reservation records')
@@ -607,56 +1091,144 @@ class DeleteAllReservations(Resource):
         except Exception as e:
             return {'message': f'Error: {e}'}, 500
         
+LISTING_PARAMS = {
+    'Reserved_user': 'Filter by user (comma-separated for several)',
+    'Reservation_status': 'Filter by status (comma-separated for several)',
+    'inv_id': 'Filter by inventory id (comma-separated for several)',
+    'inv_type': 'Filter by inventory type (comma-separated for several)',
+    'created_from': 'Created on or after this ISO date/datetime',
+    'created_before': 'Created before this ISO date/datetime',
+    'expiry_from': 'Expiring on or after this ISO date/datetime',
+    'expiry_before': 'Expiring before this ISO date/datetime',
+    'sort': 'reservation_id, Reservation_created_date or Reservation_expiry_date; "-" prefix for descending '
+            '(default reservation_id, or -Reservation_created_date when filtering)',
+    'fields': 'Comma-separated fields to return',
+}
+
+def unindexed_listing(listing):
+    # Returns (error response or None, warnings) for a filter/sort no index serves.
+    # In "warn" mode the query runs anyway and the warning is logged and returned.
+    if supporting_index(listing) is not None:
+        return None, []
+    message = f'No index serves this filter and sort: {listing.describe()}'
+    if config.RESERVATION_LISTING_UNINDEXED == 'reject':
+        return ({'message': message, 'supported': supported_combinations()}, 400), []
+    logger.warning('Unindexed reservation listing %s', listing.describe())
+    return None, [message]
+
 @api.route('/reservation/view')
 class DisplayUploadedCSV(Resource):
-    @api.doc(params={'page': 'Page number', 'limit': 'Items per page'})
+    @api.doc(params=dict(LISTING_PARAMS, **{
+        'page': 'Page number (skip-based, the default)',
+        'limit': f'Items per page (1-{MAX_PAGE_LIMIT})',
+        'cursor': 'Keyset pagination: empty for the first page, then the previous response\'s "next" field',
+        'total': 'Include total_records: "estimated" or "exact" (cached)',
+        'include_history': 'Also read archived reservations (keyset pagination only)',
+        'explain': 'Add the winning query plan and the keys/documents it examined'
+    }))
     def get(self):
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 100))
-        total_records = collection.count_documents({})
-        if page < 1:
-            page = 1
-        skip = (page - 1) * limit
-
-        # Set a practical upper limit for the limit parameter
-        if limit > 10000:
-            limit = 10000
-
-        cursor = collection.find({}, {'_id': 0}).skip(skip).limit(limit)
-        data = list(cursor)
-
-        # Convert datetime objects to ISO formatted strings
-        for item in data:
-            if 'Reservation_created_date' in item:
-                item['Reservation_created_date'] = item['Reservation_created_date'].isoformat()
-            if 'Reservation_expiry_date' in item:
-                item['Reservation_expiry_date'] = item['Reservation_expiry_date'].isoformat()
-        return {
-            'page': page,
-            'limit': limit,
-            'total_records': total_records,
-            'data': data
-        }
+        total_mode = request.args.get('total')
+        include_history = request.args.get('include_history', '').lower() == 'true'
+        explain = request.args.get('explain', '').lower() == 'true'
+
+        try:
+            limit = page_limit(request.args.get('limit'), 100)
+            listing = parse_listing_args(request.args)
+        except (InvalidPageRequest, InvalidListingQuery) as e:
+            return {'message': str(e)}, 400
+        error, warnings = unindexed_listing(listing)
+        if error:
+            return error
+
+        if not wants_keyset(request.args):
+            if include_history:
+                return {'message': 'include_history requires keyset pagination (pass cursor=)'}, 400
+            try:
+                page = page_number(request.args.get('page'))
+            except InvalidPageRequest as e:
+                return {'message': str(e)}, 400
+            skip = (page - 1) * limit
+            cursor = collection.find(listing.query, listing.projection).sort(listing.sort()).skip(skip).limit(limit)
+            data = list(cursor)
+            response = {
+                'page': page,
+                'limit': limit,
+                'total_records': count_total(collection, total_mode or 'exact', listing.query),
+                'data': data
+            }
+            if explain:
+                response['explain'] = plan_summary(cursor.clone().explain())
+        else:
+            collections = [collection, history_collection] if include_history else [collection]
+            projection, added_keys = listing.page_projection()
+            try:
+                pages = [keyset_page(source, listing.sort_key, limit, cursor=request.args.get('cursor'),
+                                     projection=projection, query=listing.query, direction=listing.direction,
+                                     tie_breaker=TIE_BREAKER)
+                         for source in collections]
+                if explain:
+                    plan = collection.find(
+                        keyset_query(listing.query, request.args.get('cursor'), listing.sort_key,
+                                     listing.direction, TIE_BREAKER),
+                        projection
+                    ).sort(listing.sort()).limit(limit + 1).explain()
+            except InvalidPageRequest as e:
+                return {'message': str(e)}, 400
+            data, next_cursor = merge_keyset_pages(pages, listing.sort_key, limit, listing.direction, TIE_BREAKER)
+            for item in data:
+                for key in added_keys:
+                    item.pop(key, None)
+            response = {
+                'limit': limit,
+                'next': next_cursor,
+                'data': data
+            }
+            if total_mode:
+                response['total_records'] = sum(count_total(source, total_mode, listing.query)
+                                                for source in collections)
+            if explain:
+                response['explain'] = plan_summary(plan)
+
+        if explain:
+            response['explain']['index'] = supporting_index(listing)
+        if warnings:
+            response['warnings'] = warnings
+        # Dates are written as ISO strings by the JSON representation
+        return response
 
 @api.route('/reservation/viewall')
 class DisplayUploadedCSV(Resource):
+    @api.doc(params=dict(LISTING_PARAMS, include_history='Also read archived reservations'))
     def get(self):
         try:
-            # Retrieve all reservations from the database
-            cursor = collection.find({}, {'_id': 0})
-            data = list(cursor)
-
-            # Convert datetime objects to ISO formatted strings
-            for item in data:
-                if 'Reservation_created_date' in item:
-                    item['Reservation_created_date'] = item['Reservation_created_date'].isoformat()
-                if 'Reservation_expiry_date' in item:
-                    item['Reservation_expiry_date'] = item['Reservation_expiry_date'].isoformat()
+            listing = parse_listing_args(request.args)
+        except InvalidListingQuery as e:
+            return {'message': str(e)}, 400
+        error, warnings = unindexed_listing(listing)
+        if error:
+            return error
+        try:
+            # Retrieve the matching reservations from the database
+            if request.args.get('include_history', '').lower() == 'true':
+                # Both collections come back in listing order and are merged on the sort key
+                projection, added_keys = listing.page_projection()
+                data = merge_sorted([list(source.find(listing.query, projection).sort(listing.sort()))
+                                     for source in (collection, history_collection)],
+                                    listing.sort_key, listing.direction, TIE_BREAKER)
+                for item in data:
+                    for key in added_keys:
+                        item.pop(key, None)
+            else:
+                cursor = collection.find(listing.query, listing.projection).sort(listing.sort())
+                data = list(cursor)
 
-            return {
+            response = {
                 'total_records': len(data),
                 'data': data
             }
+            if warnings:
+                response['warnings'] = warnings
+            return response
         except Exception as e:
             return {'message': f'Error: {str(e)}'}, 500
         
@@ -664,17 +1236,215 @@ class DisplayUploadedCSV(Resource):
 
 
 
+MAX_STATS_TOP = 1000
+# by=bucket returns one row per bucket and key; wider ranges have to be narrowed with from/to
+MAX_STATS_ROWS = 10000
+
+@api.route('/reservation/stats')
+class ReservationStats(Resource):
+    @api.doc(params={
+        'period': 'day or month (default month)',
+        'dimension': 'inv_type, inv_id or user (default inv_type)',
+        'from': 'First bucket, e.g. 2024-01 or 2024-01-15 to match the period',
+        'to': 'Last bucket (inclusive)',
+        'by': '"bucket" for one row per bucket and key (capped), "key" for totals per key over the range',
+        'top': 'With by=key, the number of keys with most reservations to return'
+    })
+    def get(self):
+        period = request.args.get('period', 'month')
+        dimension = request.args.get('dimension', 'inv_type')
+        by = request.args.get('by', 'bucket')
+        if period not in ROLLUP_PERIODS:
+            return {'message': f'period must be one of {", ".join(ROLLUP_PERIODS)}'}, 400
+        if dimension not in ROLLUP_DIMENSIONS:
+            return {'message': f'dimension must be one of {", ".join(ROLLUP_DIMENSIONS)}'}, 400
+        if by not in ('bucket', 'key'):
+            return {'message': 'by must be "bucket" or "key"'}, 400
+        try:
+            top = int(request.args.get('top', 20))
+        except ValueError:
+            return {'message': 'top must be a positive integer'}, 400
+        if top <= 0:
+            return {'message': 'top must be a positive integer'}, 400
+        top = min(top, MAX_STATS_TOP)
+        try:
+            # One row past the cap tells whether the range had more
+            rows = reservation_rollups.stats(period, dimension, request.args.get('from'), request.args.get('to'),
+                                             by=by, top=top, limit=MAX_STATS_ROWS + 1)
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+        stats = {'period': period, 'dimension': dimension, 'by': by, 'data': rows[:MAX_STATS_ROWS]}
+        if len(rows) > MAX_STATS_ROWS:
+            stats['truncated'] = True
+            stats['message'] = f'Only the first {MAX_STATS_ROWS} rows are returned; narrow the range with from/to'
+        return stats, 200
+
+@api.route('/admin/analytics/rebuild')
+class RebuildReservationStats(Resource):
+    @api.doc(description='Recompute the reservation rollups from reservation12 and reservation_history')
+    def post(self):
+        try:
+            return reservation_rollups.rebuild(), 200
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+
+@api.route('/admin/indexes')
+class IndexStats(Resource):
+    @api.doc(description='Index usage statistics for the collections this service queries')
+    def get(self):
+        try:
+            return index_report(db), 200
+        except Exception as e:
+            return {'message': f'Error: {e}'}, 500
+
+
+@api.route('/health')
+class Health(Resource):
+    @api.doc(description='MongoDB reachability and connection pool utilisation')
+    def get(self):
+        health = mongo_health()
+        return health, 200 if health['status'] == 'ok' else 503
+
+
+@api.route('/metrics')
+class Metrics(Resource):
+    @api.doc(description='Request, stage, MongoDB and outbound HTTP latency histograms (Prometheus text format)')
+    def get(self):
+        return metrics_response()
+
+
+@api.route('/admin/inventory-cache')
+class InventoryCacheStats(Resource):
+    @api.doc(description='Inventory cache hit/miss/refresh counters')
+    def get(self):
+        return inventory_cache.stats(), 200
+
+    @api.doc(description='Drop every cached inventory record')
+    def delete(self):
+        inventory_cache.invalidate()
+        return {'message': 'Inventory cache cleared'}, 200
+
+
+inventory_replica_job = PeriodicJob(
+    'inventory-replica',
+    inventory_replica.sync,
+    interval=config.INVENTORY_REPLICA_INTERVAL,
+    lease=Lease(db['job_leases'], 'inventory-replica', config.INVENTORY_REPLICA_LEASE_TTL)
+)
+
+@api.route('/admin/inventory-replica')
+class InventoryReplicaStats(Resource):
+    @api.doc(description='Version and last sync of the local inventory replica')
+    def get(self):
+        return dict(inventory_replica.stats(), enabled=replica_enabled(),
+                    ready=inventory_replica.ready(), running=inventory_replica_job.running), 200
+
+    @api.doc(description='Sync the replica now (skipped if another worker holds the lease)')
+    def post(self):
+        try:
+            run = inventory_replica_job.run_once()
+        except Exception as e:
+            return {'error': f'An error occurred while syncing the inventory replica: {e}'}, 500
+        if run is None:
+            return {'message': 'Another worker is syncing the inventory replica'}, 409
+        return run, 200
+
+
+def release_expired_copies(copies):
+    try:
+        release_many_inventory_copies(copies)
+    finally:
+        for inv_id in copies:
+            inventory_cache.invalidate(inv_id)
+
+expiry_sweeper = ExpirySweeper(
+    collection,
+    release_expired_copies,
+    batch_size=config.EXPIRY_SWEEP_BATCH_SIZE,
+    max_batches=config.EXPIRY_SWEEP_MAX_BATCHES,
+    on_expired=lambda reservations: reservation_rollups.record('expired', reservations)
+)
+expiry_sweep_job = PeriodicJob(
+    'reservation-expiry-sweeper',
+    expiry_sweeper.run,
+    interval=config.EXPIRY_SWEEP_INTERVAL,
+    jitter=config.EXPIRY_SWEEP_JITTER,
+    lease=Lease(db['job_leases'], 'reservation-expiry-sweeper', config.EXPIRY_SWEEP_LEASE_TTL)
+)
+
+history_archiver = HistoryArchiver(
+    collection,
+    history_collection,
+    min_age_days=config.HISTORY_ARCHIVE_MIN_AGE_DAYS,
+    batch_size=config.HISTORY_ARCHIVE_BATCH_SIZE,
+    max_batches=config.HISTORY_ARCHIVE_MAX_BATCHES
+)
+history_archive_job = PeriodicJob(
+    'reservation-history-archiver',
+    history_archiver.run,
+    interval=config.HISTORY_ARCHIVE_INTERVAL,
+    jitter=config.HISTORY_ARCHIVE_JITTER,
+    lease=Lease(db['job_leases'], 'reservation-history-archiver', config.HISTORY_ARCHIVE_LEASE_TTL)
+)
+
+def start_background_jobs():
+    # Started with the first request so importing the module or forking workers spawns no threads
+    if replica_enabled():
+        inventory_replica_job.start()
+    if config.EXPIRY_SWEEP_ENABLED:
+        expiry_sweep_job.start()
+    if config.HISTORY_ARCHIVE_ENABLED:
+        history_archive_job.start()
+
+@api.route('/admin/expiry-sweeper')
+class ExpirySweeperStats(Resource):
+    @api.doc(description='Reservations swept per run and sweep duration')
+    def get(self):
+        return dict(expiry_sweeper.stats(), enabled=config.EXPIRY_SWEEP_ENABLED,
+                    running=expiry_sweep_job.running, interval=expiry_sweep_job.interval), 200
+
+    @api.doc(description='Run one sweep now (skipped if another worker holds the lease)')
+    def post(self):
+        try:
+            run = expiry_sweep_job.run_once()
+        except Exception as e:
+            return {'error': f'An error occurred while sweeping reservations: {e}'}, 500
+        if run is None:
+            return {'message': 'Another worker is sweeping'}, 409
+        return run, 200
+
+
+@api.route('/admin/history-archiver')
+class HistoryArchiverStats(Resource):
+    @api.doc(description='Reservations moved to reservation_history per run')
+    def get(self):
+        return dict(history_archiver.stats(), enabled=config.HISTORY_ARCHIVE_ENABLED,
+                    running=history_archive_job.running, interval=history_archive_job.interval), 200
+
+    @api.doc(description='Archive one round now (skipped if another worker holds the lease)')
+    def post(self):
+        try:
+            run = history_archive_job.run_once()
+        except Exception as e:
+            return {'error': f'An error occurred while archiving reservations: {e}'}, 500
+        if run is None:
+            return {'message': 'Another worker is archiving'}, 409
+        return run, 200
+
+@api.route('/admin/http-clients')
+class HTTPClientStats(Resource):
+    @api.doc(description='Per-endpoint latency of outbound calls to other services')
+    def get(self):
+        return client_stats(), 200
+
+
 def fetch_reservation_data():
-    reservation_api_url = 'http://127.0.0.1:5002/reservation/view'  # Update URL as needed
-    #reservation_api_url='http://10.20.100.30:5002/reservation/view'
-    response = requests.get(reservation_api_url)
+    response = reservation_client().get('/reservation/view')
     reservation_data = response.json()
     return reservation_data
 
 def fetch_reservation_data():
-    reservation_api_url = 'http://127.0.0.1:5002/reservation/update/'  # Update URL as needed
-    #reservation_api_url='http://10.20.100.30:5002/reservation/update'
-    response = requests.get(reservation_api_url)
+    response = reservation_client().get('/reservation/update/')
     reservation_data = response.json()
     return reservation_data
 
@@ -710,31 +1480,14 @@ if __name__ == '__main__':
 
 """
 
-if __name__ == '__main__':
-    inventory_api_url = 'http://10.20.100.30:5001/inventory/view-all'
-    #inventory_api_url = 'http://localhost:5001/inventory/view-all'
-    response = requests.get(inventory_api_url)
-    
-
-    if response.status_code == 200:
-        inventory_data = response.json()
-        
-        if 'data' in inventory_data:
-            inventory_items = inventory_data['data']
-            
-            for item in inventory_items:
-                inv_id = item['inv_id']
-                inv_name = item['inv_name']
-                inv_description = item.get('inv_description', '')  # Use get() to handle optional fields
-                
-                # Further processing or integration with your reservation logic
-                # For example, you can store the extracted information, make decisions, etc.
-                
-        else:
-            print("No inventory data found in the response.")
-    else:
-        print("API request failed with status code:", response.status_code)
+def create_app(app_config=None):
+    app = build_app(__name__, api, 'reservation', 'Reservation API', 'API for Reservation Management',
+                    databases=[db], app_config=app_config, swagger=True)
+    app.after_request(add_inventory_staleness)
+    app.before_first_request(start_background_jobs)
+    return app
 
-    app.run(debug=True,host="10.20.100.30",port=5002)
-    #app.run(debug=True,port=5002)
 
+if __name__ == '__main__':
+    # Serves straight away; inventory records are loaded on demand by the cache and replica
+    create_app().run(host=config.SERVER_HOST, port=config.RESERVATION_PORT, debug=config.SERVER_DEBUG)
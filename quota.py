@@ -0,0 +1,131 @@
+import datetime
+from collections import Counter
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, user, limit):
+        super().__init__(f'Maximum {limit} reservations allowed per month')
+        self.user = user
+        self.limit = limit
+
+
+class ReservationQuota:
+    """Monthly reservation counters, one document per (user, year, month)."""
+
+    def __init__(self, collection, limits, user_classes=None, default_class='default'):
+        self.collection = collection
+        self.limits = limits
+        self.user_classes = user_classes or {}
+        self.default_class = default_class
+
+    def limit_for(self, user):
+        user_class = self.user_classes.get(user, self.default_class)
+        return self.limits.get(user_class, self.limits[self.default_class])
+
+    @staticmethod
+    def period(when=None):
+        when = when or datetime.datetime.utcnow()
+        return when.year, when.month
+
+    def _key(self, user, when):
+        year, month = self.period(when)
+        return {'Reserved_user': user, 'year': year, 'month': month}
+
+    def acquire(self, user, when=None):
+        # Conditional upsert: the filter only matches while count < limit. Once the
+        # limit is reached the upsert tries to insert a second document for the same
+        # period and the unique index rejects it, so the check and the increment are
+        # one atomic round trip.
+        limit = self.limit_for(user)
+        if limit <= 0:
+            # No counter can satisfy count < 0, so the upsert would insert one at 1
+            raise QuotaExceeded(user, limit)
+        key = self._key(user, when)
+        for attempt in range(2):
+            try:
+                counter = self.collection.find_one_and_update(
+                    dict(key, count={'$lt': limit}),
+                    {'$inc': {'count': 1}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                return counter['count']
+            except DuplicateKeyError:
+                # Either the limit is reached, or another request created the
+                # period's document first; one retry tells the two apart.
+                continue
+        raise QuotaExceeded(user, limit)
+
+    def acquire_many(self, requested, when=None):
+        # requested maps user -> units wanted; returns user -> units granted. One read
+        # works out how much room each user has, then every grant is applied as a
+        # guarded conditional upsert in one bulk write, so a concurrent request can
+        # still never push a user past the limit (its grant just comes back as 0).
+        year, month = self.period(when)
+        users = [user for user, amount in requested.items() if amount > 0 and self.limit_for(user) > 0]
+        current = {
+            counter['Reserved_user']: counter['count']
+            for counter in self.collection.find(
+                {'Reserved_user': {'$in': users}, 'year': year, 'month': month},
+                {'_id': 0, 'Reserved_user': 1, 'count': 1}
+            )
+        }
+
+        granted = {user: 0 for user, amount in requested.items() if amount > 0}
+        for user in users:
+            limit = self.limit_for(user)
+            granted[user] = max(0, min(requested[user], limit - current.get(user, 0)))
+        planned = [user for user in users if granted[user] > 0]
+        if not planned:
+            return granted
+
+        operations = [
+            UpdateOne(
+                {'Reserved_user': user, 'year': year, 'month': month,
+                 'count': {'$lte': self.limit_for(user) - granted[user]}},
+                {'$inc': {'count': granted[user]}},
+                upsert=True
+            )
+            for user in planned
+        ]
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                granted[planned[error['index']]] = 0
+        return granted
+
+    def release(self, user, when=None, amount=1):
+        key = self._key(user, when)
+        result = self.collection.update_one(
+            dict(key, count={'$gte': amount}),
+            {'$inc': {'count': -amount}}
+        )
+        return result.modified_count == 1
+
+    def release_many(self, entries):
+        # entries is an iterable of (user, when); all decrements go out as one bulk write
+        amounts = Counter(self.period(when) + (user,) for user, when in entries)
+        if not amounts:
+            return 0
+        operations = [
+            UpdateOne(
+                {'Reserved_user': user, 'year': year, 'month': month, 'count': {'$gte': amount}},
+                {'$inc': {'count': -amount}}
+            )
+            for (year, month, user), amount in amounts.items()
+        ]
+        return self.collection.bulk_write(operations, ordered=False).modified_count
+
+    def usage(self, user, when=None):
+        counter = self.collection.find_one(self._key(user, when), {'_id': 0, 'count': 1})
+        return {
+            'Reserved_user': user,
+            'year': self.period(when)[0],
+            'month': self.period(when)[1],
+            'count': counter['count'] if counter else 0,
+            'limit': self.limit_for(user),
+        }
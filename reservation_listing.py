@@ -0,0 +1,163 @@
+import datetime
+
+from pymongo import ASCENDING
+
+from indexes import INDEXES, register_indexes
+
+# Query-string filters accepted by the reservation listings
+EQUALITY_FILTERS = ('Reserved_user', 'Reservation_status', 'inv_id', 'inv_type')
+# <prefix>_from is inclusive, <prefix>_before is exclusive
+DATE_RANGE_FILTERS = {
+    'created': 'Reservation_created_date',
+    'expiry': 'Reservation_expiry_date',
+}
+SORT_FIELDS = ('reservation_id', 'Reservation_created_date', 'Reservation_expiry_date')
+PROJECTION_FIELDS = (
+    'reservation_id', 'Reserved_user', 'Reserved_user_email', 'Reservation_created_date',
+    'Reservation_expiry_date', 'Reservation_closed_date', 'Reservation_status', 'Reservation_status_comments',
+    'inv_id', 'inv_type', 'inv_name', 'inv_description', 'inv_blob', 'inv_archive_status', 'inv_copies',
+)
+# reservation_id is unique, so (sort field, reservation_id) is a total order for keyset pages
+TIE_BREAKER = 'reservation_id'
+DEFAULT_SORT = 'reservation_id'
+DEFAULT_FILTERED_SORT = '-Reservation_created_date'
+
+# Equality filter, then the sort field, then the tie breaker: the server walks one
+# index range in order and stops after `limit` entries, so a page reads only the
+# documents it returns. Date ranges are bounded on the sort field.
+LISTING_INDEXES = [
+    ([('Reservation_created_date', ASCENDING), ('reservation_id', ASCENDING)], {'name': 'created_date_id'}),
+    ([('Reservation_expiry_date', ASCENDING), ('reservation_id', ASCENDING)], {'name': 'expiry_date_id'}),
+    ([('Reserved_user', ASCENDING), ('Reservation_created_date', ASCENDING), ('reservation_id', ASCENDING)],
+     {'name': 'user_created_date_id'}),
+    ([('Reserved_user', ASCENDING), ('Reservation_expiry_date', ASCENDING), ('reservation_id', ASCENDING)],
+     {'name': 'user_expiry_date_id'}),
+    ([('Reservation_status', ASCENDING), ('Reservation_created_date', ASCENDING), ('reservation_id', ASCENDING)],
+     {'name': 'status_created_date_id'}),
+    ([('Reservation_status', ASCENDING), ('Reservation_expiry_date', ASCENDING), ('reservation_id', ASCENDING)],
+     {'name': 'status_expiry_date_id'}),
+    ([('inv_id', ASCENDING), ('Reservation_created_date', ASCENDING), ('reservation_id', ASCENDING)],
+     {'name': 'inv_id_created_date_id'}),
+    ([('inv_type', ASCENDING), ('Reservation_created_date', ASCENDING), ('reservation_id', ASCENDING)],
+     {'name': 'inv_type_created_date_id'}),
+]
+LISTING_COLLECTIONS = ('reservation12', 'reservation_history')
+for _collection_name in LISTING_COLLECTIONS:
+    register_indexes('reservations_db', _collection_name, *LISTING_INDEXES)
+
+
+class InvalidListingQuery(ValueError):
+    pass
+
+
+class ListingQuery:
+    """Filter, sort and projection parsed from a listing request's query string."""
+
+    def __init__(self, query, equality, ranges, sort_key, direction, projection):
+        self.query = query
+        self.equality = equality
+        self.ranges = ranges
+        self.sort_key = sort_key
+        self.direction = direction
+        self.projection = projection
+
+    def sort(self):
+        keys = [self.sort_key] if self.sort_key == TIE_BREAKER else [self.sort_key, TIE_BREAKER]
+        return [(key, self.direction) for key in keys]
+
+    def page_projection(self):
+        # Projection that keeps the sort keys (needed to merge pages and build
+        # cursors), plus the keys the caller did not ask for and should be removed
+        projection = dict(self.projection)
+        if len(projection) == 1:
+            return projection, []
+        added = [key for key, _ in self.sort() if key not in projection]
+        projection.update((key, 1) for key in added)
+        return projection, added
+
+    def describe(self):
+        return {
+            'equality': sorted(self.equality),
+            'ranges': sorted(self.ranges),
+            'sort': ('-' if self.direction == -1 else '') + self.sort_key,
+        }
+
+
+def parse_date(name, value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidListingQuery(f'{name} must be an ISO date or datetime, got {value!r}')
+
+
+def parse_listing_args(args):
+    query = {}
+    equality = set()
+    for field in EQUALITY_FILTERS:
+        value = args.get(field)
+        if not value:
+            continue
+        values = [item.strip() for item in value.split(',') if item.strip()]
+        query[field] = values[0] if len(values) == 1 else {'$in': values}
+        equality.add(field)
+
+    ranges = set()
+    for prefix, field in DATE_RANGE_FILTERS.items():
+        bounds = {}
+        if args.get(f'{prefix}_from'):
+            bounds['$gte'] = parse_date(f'{prefix}_from', args[f'{prefix}_from'])
+        if args.get(f'{prefix}_before'):
+            bounds['$lt'] = parse_date(f'{prefix}_before', args[f'{prefix}_before'])
+        if bounds:
+            query[field] = bounds
+            ranges.add(field)
+
+    sort = args.get('sort') or (DEFAULT_FILTERED_SORT if query else DEFAULT_SORT)
+    direction = -1 if sort.startswith('-') else 1
+    sort_key = sort.lstrip('-+')
+    if sort_key not in SORT_FIELDS:
+        raise InvalidListingQuery(f'sort must be one of {", ".join(SORT_FIELDS)} (prefix "-" for descending)')
+
+    projection = {'_id': 0}
+    if args.get('fields'):
+        requested = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        unknown = [field for field in requested if field not in PROJECTION_FIELDS]
+        if unknown:
+            raise InvalidListingQuery(f'Unknown fields: {", ".join(unknown)}')
+        projection.update((field, 1) for field in requested)
+
+    return ListingQuery(query, equality, ranges, sort_key, direction, projection)
+
+
+def supporting_index(listing, db_name='reservations_db', collection_name='reservation12'):
+    # Name of a registered index that serves the listing without a blocking sort:
+    # its keys are the equality fields (any order), then the sort field and the
+    # tie breaker, and every range field is among the keys after the equality prefix.
+    sort_keys = [key for key, _ in listing.sort()]
+    for keys, options in INDEXES.get(db_name, {}).get(collection_name, []):
+        fields = [key for key, _ in keys]
+        prefix, rest = fields[:len(listing.equality)], fields[len(listing.equality):]
+        if set(prefix) != listing.equality or rest[:len(sort_keys)] != sort_keys:
+            continue
+        if listing.ranges <= set(rest):
+            return options.get('name')
+    return None
+
+
+def supported_combinations():
+    return [
+        {'equality': [key for key, _ in keys[:-2]], 'sort': keys[-2][0]}
+        for keys, _ in LISTING_INDEXES
+    ] + [{'equality': [], 'sort': TIE_BREAKER}]
+
+
+def plan_summary(explanation):
+    # The winning plan and the work it did, from cursor.explain()
+    stats = explanation.get('executionStats', {})
+    return {
+        'winning_plan': explanation.get('queryPlanner', {}).get('winningPlan'),
+        'n_returned': stats.get('nReturned'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'execution_time_ms': stats.get('executionTimeMillis'),
+    }
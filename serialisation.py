@@ -0,0 +1,72 @@
+import datetime
+import json
+from decimal import Decimal
+
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+from flask import make_response
+
+# orjson is pinned in requirements.txt and is what makes responses fast. The
+# standard library encoder below is only a compatibility fallback for
+# environments without it; it produces the same output but none of the speed-up.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+
+
+def bson_default(obj):
+    # Called by the encoder only for values it cannot encode itself, so documents
+    # are converted during the single encoding pass instead of a loop beforehand.
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class BSONJSONEncoder(json.JSONEncoder):
+    """json.JSONEncoder that understands ObjectId, datetime and Decimal128."""
+
+    def default(self, obj):
+        try:
+            return bson_default(obj)
+        except TypeError:
+            return super().default(obj)
+
+
+if orjson is not None:
+    def dumps_bytes(obj):
+        # orjson writes datetimes itself, in the same format as isoformat()
+        return orjson.dumps(obj, default=bson_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps_bytes(obj):
+        # Compatibility fallback only, see the orjson import above
+        return json.dumps(obj, default=bson_default, separators=(',', ':')).encode('utf-8')
+
+
+def dumps(obj):
+    return dumps_bytes(obj).decode('utf-8')
+
+
+def backend():
+    return 'orjson' if orjson is not None else 'json'
+
+
+def output_json(data, code, headers=None):
+    response = make_response(dumps_bytes(data) + b'\n', code)
+    response.headers['Content-Type'] = JSON_MIMETYPE
+    response.headers.extend(headers or {})
+    return response
+
+
+def use_bson_json(app, api):
+    # Resource return values and jsonify() both go through the BSON-aware encoder
+    api.representations[JSON_MIMETYPE] = output_json
+    app.json_encoder = BSONJSONEncoder
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+from circuit_breaker import CircuitBreaker
+from logs import REQUEST_ID_HEADER, current_request_id
+from metrics import observe_breaker_rejection, observe_breaker_state, observe_breaker_transition, observe_outbound
+
+
+# urllib3 1.26 renamed method_whitelist to allowed_methods; 2.x dropped the old name
+RETRY_METHODS_ARGUMENT = 'allowed_methods' if hasattr(Retry, 'DEFAULT_ALLOWED_METHODS') else 'method_whitelist'
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+    def __init__(self, service, retry_after):
+        super().__init__(f'{service} is unavailable (circuit open, retry in {retry_after}s)')
+        self.service = service
+        self.retry_after = retry_after
+
+
+class CallStats:
+    """Per-endpoint call counts and latency totals for one client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def record(self, endpoint, elapsed, error=False):
+        with self._lock:
+            stats = self._calls.setdefault(endpoint, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            elapsed_ms = elapsed * 1000
+            stats['calls'] += 1
+            stats['errors'] += int(error)
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: dict(stats, avg_ms=round(stats['total_ms'] / stats['calls'], 3))
+                for endpoint, stats in self._calls.items()
+            }
+
+
+class ServiceClient:
+    """Pooled keep-alive HTTP client for one downstream service."""
+
+    def __init__(self, base_url, pool_size=10, connect_timeout=2.0, read_timeout=10.0,
+                 retries=2, backoff=0.2, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.stats = CallStats()
+        self.breaker = breaker
+        self._pool_size = pool_size
+        # Only idempotent GETs are retried; reservation writes must not be replayed
+        self._retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,
+            **{RETRY_METHODS_ARGUMENT: frozenset(['GET'])}
+        )
+        self._local_pid = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Sessions are rebuilt after a fork so workers never share pooled sockets
+        pid = os.getpid()
+        if self._session is None or self._local_pid != pid:
+            with self._lock:
+                if self._session is None or self._local_pid != pid:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size,
+                                          max_retries=self._retry)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session, self._local_pid = session, pid
+        return self._session
+
+    def request(self, method, path, endpoint=None, **kwargs):
+        # endpoint names the route template (e.g. 'GET /inventory/<inv_id>') for the latency stats
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint or f'{method} {path}'
+        if self.breaker and not self.breaker.allow():
+            # Fail fast instead of tying up a worker on a service that is down
+            observe_breaker_rejection(self.breaker.name)
+            raise CircuitOpenError(self.breaker.name, self.breaker.retry_after())
+        if current_request_id():
+            # Carry the caller's request id so both services' logs line up
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **{REQUEST_ID_HEADER: current_request_id()})
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', **kwargs)
+        except requests.RequestException:
+            elapsed = time.perf_counter() - started
+            self.stats.record(endpoint, elapsed, error=True)
+            observe_outbound(endpoint, elapsed, error=True)
+            if self.breaker:
+                self.breaker.record(elapsed, failed=True)
+            raise
+        elapsed = time.perf_counter() - started
+        self.stats.record(endpoint, elapsed, error=response.status_code >= 500)
+        observe_outbound(endpoint, elapsed, error=response.status_code >= 500)
+        if self.breaker:
+            self.breaker.record(elapsed, failed=response.status_code >= 500)
+        return response
+
+    def get(self, path, endpoint=None, **kwargs):
+        return self.request('GET', path, endpoint, **kwargs)
+
+    def post(self, path, endpoint=None, **kwargs):
+        return self.request('POST', path, endpoint, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name, base_url):
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = ServiceClient(
+                base_url,
+                pool_size=config.HTTP_POOL_SIZE,
+                connect_timeout=config.HTTP_CONNECT_TIMEOUT,
+                read_timeout=config.HTTP_READ_TIMEOUT,
+                retries=config.HTTP_RETRIES,
+                backoff=config.HTTP_RETRY_BACKOFF,
+                breaker=CircuitBreaker(
+                    name,
+                    failure_rate=config.CIRCUIT_FAILURE_RATE,
+                    slow_call_seconds=config.CIRCUIT_SLOW_CALL_SECONDS,
+                    slow_call_rate=config.CIRCUIT_SLOW_CALL_RATE,
+                    window=config.CIRCUIT_WINDOW,
+                    min_calls=config.CIRCUIT_MIN_CALLS,
+                    open_seconds=config.CIRCUIT_OPEN_SECONDS,
+                    half_open_calls=config.CIRCUIT_HALF_OPEN_CALLS,
+                    on_transition=observe_breaker_transition,
+                ) if config.CIRCUIT_BREAKER_ENABLED else None,
+            )
+            if client.breaker:
+                # Export the closed state before the first transition
+                observe_breaker_state(name, client.breaker.state)
+        return client
+
+
+def inventory_client():
+    return get_client('inventory', config.INVENTORY_API_URL)
+
+
+def reservation_client():
+    return get_client('reservation', config.RESERVATION_API_URL)
+
+
+def client_stats():
+    with _clients_lock:
+        clients = dict(_clients)
+    return {
+        name: {'base_url': client.base_url, 'endpoints': client.stats.snapshot(),
+               'breaker': client.breaker.snapshot() if client.breaker else None}
+        for name, client in clients.items()
+    }
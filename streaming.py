@@ -0,0 +1,53 @@
+from flask import Response, stream_with_context
+
+from serialisation import dumps
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+DEFAULT_STREAM_BATCH_SIZE = 500
+MAX_STREAM_BATCH_SIZE = 10000
+
+
+def wants_ndjson(request):
+    # Either ?format=ndjson or an Accept header that prefers NDJSON selects streaming
+    if request.args.get('format', '').lower() == 'ndjson':
+        return True
+    # Wildcards such as */* keep the regular JSON document
+    accept = request.accept_mimetypes
+    explicit = any(mimetype == NDJSON_MIMETYPE and quality > 0 for mimetype, quality in accept)
+    return explicit and accept.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_batch_size(request):
+    try:
+        batch_size = int(request.args.get('batch_size', DEFAULT_STREAM_BATCH_SIZE))
+    except ValueError:
+        batch_size = DEFAULT_STREAM_BATCH_SIZE
+    return max(1, min(batch_size, MAX_STREAM_BATCH_SIZE))
+
+
+def ndjson_response(cursor, batch_size=DEFAULT_STREAM_BATCH_SIZE):
+    # Write documents straight from the Mongo cursor; one batch is buffered at a time
+    # and the record count goes out as a trailing summary line.
+    cursor = cursor.batch_size(batch_size)
+
+    def generate():
+        total_records = 0
+        lines = []
+        try:
+            for document in cursor:
+                lines.append(dumps(document))
+                total_records += 1
+                if len(lines) >= batch_size:
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+            if lines:
+                yield '\n'.join(lines) + '\n'
+            yield dumps({'total_records': total_records}) + '\n'
+        except Exception as e:
+            if lines:
+                yield '\n'.join(lines) + '\n'
+            yield dumps({'error': str(e), 'total_records': total_records}) + '\n'
+        finally:
+            cursor.close()
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
@@ -0,0 +1,44 @@
+import os
+import sys
+import threading
+
+# Settings are read when config is first imported
+os.environ.setdefault('ENSURE_INDEXES_ON_STARTUP', 'false')
+os.environ.setdefault('INVENTORY_REPLICA_ENABLED', 'false')
+os.environ.setdefault('EXPIRY_SWEEP_ENABLED', 'false')
+os.environ.setdefault('HISTORY_ARCHIVE_ENABLED', 'false')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mongomock
+import pytest
+
+import mongo
+import pagination
+
+_find_and_modify = mongomock.collection.Collection._find_and_modify
+_find_and_modify_lock = threading.RLock()
+
+
+def find_and_modify(collection, query, projection=None, *args, **kwargs):
+    # mongomock re-reads the updated document by _id, or by the original filter when
+    # the projection drops _id (which then no longer matches after a guarded $inc),
+    # and reads then writes without a lock. MongoDB does neither, so match it here.
+    exclude_id = bool(projection) and not projection.get('_id', 1)
+    projection = {field: value for field, value in (projection or {}).items() if field != '_id'} or None
+    with _find_and_modify_lock:
+        document = _find_and_modify(collection, query, projection, *args, **kwargs)
+    if document is not None and exclude_id:
+        document.pop('_id', None)
+    return document
+
+
+@pytest.fixture(autouse=True)
+def mongo_client(monkeypatch):
+    # Every LazyDatabase/LazyCollection resolves through mongo.get_client()
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(mongo, 'get_client', lambda: client)
+    monkeypatch.setattr(mongomock.collection.Collection, '_find_and_modify', find_and_modify)
+    pagination._count_cache.clear()
+    return client
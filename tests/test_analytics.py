@@ -0,0 +1,99 @@
+import datetime
+
+import pytest
+from pymongo.errors import PyMongoError
+
+import prj2
+
+
+@pytest.fixture
+def client():
+    return prj2.create_app().test_client()
+
+
+@pytest.mark.parametrize('top', ['abc', '0', '-3'])
+def test_stats_rejects_a_bad_top(client, top):
+    response = client.get('/reservation/stats', query_string={'by': 'key', 'top': top})
+    assert response.status_code == 400
+
+
+def test_stats_by_bucket_is_capped(client, monkeypatch):
+    monkeypatch.setattr(prj2, 'MAX_STATS_ROWS', 3)
+    prj2.reservation_rollups.rollups.insert_many([
+        {'period': 'day', 'dimension': 'inv_type', 'bucket': f'2024-01-{day:02d}', 'key': 'Book', 'created': 1}
+        for day in range(1, 6)
+    ])
+
+    response = client.get('/reservation/stats', query_string={'period': 'day'})
+    assert response.status_code == 200
+    assert [row['bucket'] for row in response.json['data']] == ['2024-01-01', '2024-01-02', '2024-01-03']
+    assert response.json['truncated'] is True
+
+    response = client.get('/reservation/stats', query_string={'period': 'day', 'from': '2024-01-04'})
+    assert len(response.json['data']) == 2
+    assert 'truncated' not in response.json
+
+
+def reservation(status='Reserved', **fields):
+    return dict({'reservation_id': 'R1', 'Reserved_user': 'alice', 'inv_id': 'INV1', 'inv_type': 'Book',
+                 'inv_name': 'Item 1', 'Reservation_status': status,
+                 'Reservation_created_date': datetime.datetime(2024, 5, 10)}, **fields)
+
+
+def rollup(period, dimension, bucket, key):
+    return prj2.reservation_rollups.rollups.find_one(
+        {'period': period, 'dimension': dimension, 'bucket': bucket, 'key': key}, {'_id': 0})
+
+
+def test_record_counts_every_period_and_dimension():
+    rollups = prj2.reservation_rollups
+
+    assert rollups.record('created', [reservation(), reservation(inv_id='INV2', inv_name='Item 2'),
+                                      reservation(Reservation_created_date=None)]) == 2
+    assert rollups.record('returned', [reservation(Reservation_closed_date=datetime.datetime(2024, 6, 1))]) == 1
+
+    assert rollup('month', 'inv_type', '2024-05', 'Book')['created'] == 2
+    assert rollup('day', 'user', '2024-05-10', 'alice')['created'] == 2
+    assert rollup('month', 'inv_id', '2024-05', 'INV2') == {
+        'period': 'month', 'dimension': 'inv_id', 'bucket': '2024-05', 'key': 'INV2', 'created': 1,
+        'inv_name': 'Item 2'}
+    assert rollup('month', 'user', '2024-06', 'alice')['returned'] == 1
+
+
+def test_record_failure_is_logged_not_raised(monkeypatch):
+    def fail(*args, **kwargs):
+        raise PyMongoError('connection reset')
+    monkeypatch.setattr(type(prj2.reservation_rollups.rollups.resolve()), 'bulk_write', fail)
+
+    assert prj2.reservation_rollups.record('created', [reservation()]) == 0
+
+
+def test_cancel_records_open_reservations_only(client):
+    prj2.collection.insert_many([reservation(), reservation('Returned', reservation_id='R2')])
+
+    assert client.delete('/reservation/delete/R1').status_code == 200
+    assert client.delete('/reservation/delete/R2').status_code == 200
+
+    month = datetime.datetime.utcnow().strftime('%Y-%m')
+    assert rollup('month', 'user', month, 'alice')['cancelled'] == 1
+
+
+def test_rebuild_swaps_in_the_aggregated_rollups(monkeypatch):
+    # mongomock cannot run the rebuild pipeline ($unionWith), so the aggregation
+    # is stood in for by writing its $out collection
+    rollups = prj2.reservation_rollups
+    rollups.rollups.insert_one({'period': 'month', 'dimension': 'user', 'bucket': '2024-05', 'key': 'stale'})
+    rebuilt = [{'period': 'month', 'dimension': 'user', 'bucket': '2024-05', 'key': 'alice', 'created': 3}]
+    pipelines = []
+
+    def aggregate(collection, pipeline, **kwargs):
+        pipelines.append(pipeline)
+        collection.database[pipeline[-1]['$out']].insert_many([dict(row) for row in rebuilt])
+    monkeypatch.setattr(type(prj2.collection.resolve()), 'aggregate', aggregate)
+
+    assert rollups.rebuild() == {'rollup_documents': 1}
+
+    assert pipelines[0][0] == {'$unionWith': {'coll': 'reservation_history'}}
+    assert list(rollups.rollups.find({}, {'_id': 0})) == rebuilt
+    assert 'period_dimension_bucket_key_unique' in rollups.rollups.index_information()
+    assert 'reservation_rollups_rebuild' not in rollups.rollups.database.list_collection_names()
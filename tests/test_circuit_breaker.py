@@ -0,0 +1,87 @@
+import inventory_transport
+import metrics
+import prj2
+import service_client
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from inventory_transport import HTTPInventoryTransport
+from service_client import ServiceClient
+
+
+def breaker(**options):
+    transitions = []
+    options = dict({'window': 4, 'min_calls': 4, 'open_seconds': 60, 'half_open_calls': 2,
+                    'on_transition': lambda name, previous, state: transitions.append(state)}, **options)
+    return CircuitBreaker('inventory', **options), transitions
+
+
+def test_failure_rate_opens_the_breaker():
+    circuit, transitions = breaker(failure_rate=0.5)
+    for failed in (False, True, False):
+        circuit.record(0.01, failed=failed)
+    assert circuit.state == CLOSED
+
+    circuit.record(0.01, failed=True)
+    assert transitions == [OPEN]
+    assert not circuit.allow()
+    assert 0 < circuit.retry_after() <= 60
+    assert circuit.snapshot()['rejected'] == 1
+
+
+def test_slow_call_rate_opens_the_breaker():
+    circuit, transitions = breaker(slow_call_seconds=1.0, slow_call_rate=0.75)
+    for elapsed in (1.5, 0.1, 2.0):
+        circuit.record(elapsed)
+    assert circuit.state == CLOSED
+
+    circuit.record(1.0)
+    assert transitions == [OPEN]
+
+
+def test_successful_probes_close_the_breaker():
+    circuit, transitions = breaker(open_seconds=0)
+    for _ in range(4):
+        circuit.record(0.01, failed=True)
+
+    assert circuit.allow() and circuit.allow()
+    assert circuit.state == HALF_OPEN
+    # Only half_open_calls probes go through
+    assert not circuit.allow()
+    circuit.record(0.01)
+    circuit.record(0.01)
+    assert transitions == [OPEN, HALF_OPEN, CLOSED]
+    assert circuit.snapshot()['window_calls'] == 0
+
+
+def test_failed_probe_opens_the_breaker_again():
+    circuit, transitions = breaker(open_seconds=0)
+    for _ in range(4):
+        circuit.record(0.01, failed=True)
+
+    assert circuit.allow()
+    circuit.record(0.01, failed=True)
+    assert transitions == [OPEN, HALF_OPEN, OPEN]
+    assert circuit.snapshot()['opened'] == 2
+
+
+def test_open_breaker_answers_503_with_retry_after(monkeypatch):
+    circuit, _ = breaker()
+    for _ in range(4):
+        circuit.record(0.01, failed=True)
+    client = ServiceClient('http://inventory.invalid', breaker=circuit)
+    monkeypatch.setattr(inventory_transport, '_transport', HTTPInventoryTransport(client))
+
+    response = prj2.create_app().test_client().post(
+        '/reservations/create', json={'inv_id': 'INV-BREAKER', 'Reserved_user': 'alice'})
+
+    assert response.status_code == 503
+    assert 1 <= int(response.headers['Retry-After']) <= 60
+    assert 'circuit open' in response.json['message']
+
+
+def test_new_breaker_exports_the_closed_state(monkeypatch):
+    monkeypatch.setattr(service_client, '_clients', {})
+    monkeypatch.setattr(service_client.config, 'CIRCUIT_BREAKER_ENABLED', True)
+
+    service_client.get_client('gauge-test', 'http://gauge.invalid')
+
+    assert 'circuit_breaker_state{breaker="gauge-test"} 0' in metrics.BREAKER_STATE.render()
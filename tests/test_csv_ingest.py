@@ -0,0 +1,120 @@
+import io
+
+import pytest
+from pymongo.errors import PyMongoError
+
+import app
+import prj1
+from csv_ingest import BatchWriter, ReloadFailed, reload_collection
+
+
+@pytest.fixture
+def client():
+    return prj1.create_app().test_client()
+
+
+def upload(client, text, batch_size=2):
+    return client.post('/inventory/upload', query_string={'batch_size': batch_size}, content_type='multipart/form-data',
+                       data={'file': (io.BytesIO(text.encode()), 'inventory.csv')})
+
+
+def test_upload_writes_in_batches_split_by_archive_status(client):
+    rows = ''.join(f'Item {index},Book,{"TRUE" if index % 2 else "FALSE"},{index}\n' for index in range(5))
+    response = upload(client, 'inv_name,inv_type,inv_archive_status,inv_copies\n' + rows)
+
+    assert response.status_code == 200
+    assert response.json['total_rows'] == 5
+    assert response.json['inserted'] == 5
+    assert response.json['collections']['inventory_items'] == {'inserted': 2, 'batches': 1, 'failed_batches': 0}
+    assert response.json['collections']['archived_inventory'] == {'inserted': 3, 'batches': 2, 'failed_batches': 0}
+    assert prj1.collection.count_documents({}) == 2
+    assert prj1.archived_collection.count_documents({}) == 3
+
+
+def test_duplicate_keys_fail_only_their_rows(mongo_client):
+    items = mongo_client['inventory_db']['inventory_items']
+    items.create_index('inv_id', unique=True)
+    written = []
+    writer = BatchWriter(items, batch_size=10, on_written=written.extend)
+
+    for inv_id in ('a', 'b', 'a', 'c'):
+        writer.add({'inv_id': inv_id})
+    writer.flush()
+
+    assert writer.inserted == 3
+    assert [document['inv_id'] for document in written] == ['a', 'b', 'c']
+    assert writer.errors[0]['errors'][0]['index'] == 2
+
+
+class FailingCollection:
+    name = 'inventory_items'
+
+    def insert_many(self, documents, ordered=True):
+        raise PyMongoError('connection reset')
+
+
+def test_failed_batch_is_reported_and_not_passed_on():
+    written = []
+    writer = BatchWriter(FailingCollection(), batch_size=2, on_written=written.extend)
+
+    for index in range(3):
+        writer.add({'inv_id': str(index)})
+    writer.flush()
+
+    assert written == []
+    assert writer.summary() == {'inserted': 0, 'batches': 2, 'failed_batches': 2}
+    assert writer.errors[0]['errors'] == [{'message': 'connection reset'}]
+
+
+@pytest.fixture
+def reservations():
+    app.collection.insert_one({'reservation_id': 'OLD', 'Reserved_user': 'alice'})
+    return app.collection
+
+
+def upload_reservations(data):
+    return app.create_app().test_client().post(
+        '/inventory/upload', content_type='multipart/form-data',
+        data={'file': (io.BytesIO(data), 'reservations.csv')})
+
+
+def staging_collections():
+    return [name for name in app.db.list_collection_names() if '_staging_' in name]
+
+
+def test_reload_replaces_the_live_collection(reservations):
+    response = upload_reservations(b'reservation_id,Reserved_user\nR1,bob\nR2,carol\n')
+
+    assert response.status_code == 200
+    assert response.json['total_rows'] == 2
+    assert sorted(document['reservation_id'] for document in reservations.find()) == ['R1', 'R2']
+    assert 'user_created_date' in reservations.index_information()
+    assert staging_collections() == []
+
+
+def test_failing_prepare_leaves_the_live_collection_untouched(reservations, monkeypatch):
+    monkeypatch.setattr(app, 'ensure_collection_indexes', lambda collection, registry_name: ([], ['reservation_id']))
+
+    response = upload_reservations(b'reservation_id,Reserved_user\nR1,bob\n')
+
+    assert response.status_code == 500
+    assert response.json['errors'] == ['reservation_id']
+    assert [document['reservation_id'] for document in reservations.find()] == ['OLD']
+    assert staging_collections() == []
+
+
+def test_undecodable_row_leaves_the_live_collection_untouched(reservations):
+    response = upload_reservations(b'reservation_id,Reserved_user\nR1,bob\nR2,\xff\xfe\n')
+
+    assert response.status_code == 500
+    assert [document['reservation_id'] for document in reservations.find()] == ['OLD']
+    assert staging_collections() == []
+
+
+def test_failed_batch_aborts_the_reload(reservations):
+    with pytest.raises(ReloadFailed) as failure:
+        reload_collection(app.db, reservations.name, [{'_id': 1}, {'_id': 1}], batch_size=10)
+
+    assert failure.value.errors
+    assert [document['reservation_id'] for document in reservations.find()] == ['OLD']
+    assert staging_collections() == []
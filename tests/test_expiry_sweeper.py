@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+
+from expiry_sweeper import ExpirySweeper
+from indexes import ensure_collection_indexes
+
+NOW = datetime.datetime(2024, 5, 10)
+
+
+class FlakyRelease:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+
+    def __call__(self, copies):
+        self.calls.append(dict(copies))
+        if len(self.calls) <= self.failures:
+            raise ConnectionError('inventory service unreachable')
+
+
+@pytest.fixture
+def reservations(mongo_client):
+    collection = mongo_client['reservations_db']['reservation12']
+    ensure_collection_indexes(collection)
+    collection.insert_many([
+        {'reservation_id': f'R{index}', 'inv_id': 'INV1', 'inv_copies': 1, 'Reserved_user': 'alice',
+         'Reservation_status': 'Reserved', 'Reservation_expiry_date': NOW - datetime.timedelta(days=index + 1)}
+        for index in range(3)
+    ])
+    return collection
+
+
+def test_failed_release_is_retried_by_the_next_run(reservations):
+    release = FlakyRelease(failures=1)
+    expired = []
+    sweeper = ExpirySweeper(reservations, release, on_expired=expired.extend)
+
+    with pytest.raises(ConnectionError):
+        sweeper.run()
+    assert reservations.count_documents({'Reservation_status': 'Expired'}) == 3
+    assert reservations.count_documents({'Reservation_copies_released': True}) == 0
+    assert len(expired) == 3
+
+    run = sweeper.run()
+    assert run['swept'] == 3
+    assert release.calls == [{'INV1': 3}, {'INV1': 3}]
+    assert len(expired) == 3
+    assert reservations.count_documents({'Reservation_copies_released': True}) == 3
+    assert reservations.count_documents({'Reservation_release_pending': {'$exists': True}}) == 0
+
+    assert sweeper.run()['swept'] == 0
+    assert len(release.calls) == 2
+
+
+def test_failed_return_release_is_retried_without_reporting_an_expiry(reservations):
+    release = FlakyRelease()
+    expired = []
+    sweeper = ExpirySweeper(reservations, release, on_expired=expired.extend)
+    reservations.update_many({}, {'$set': {'Reservation_expiry_date': datetime.datetime(9999, 1, 1)}})
+    reservations.update_one({'reservation_id': 'R0'}, {'$set': {
+        'Reservation_status': 'Returned', 'Reservation_release_pending': datetime.datetime(1970, 1, 1)}})
+
+    assert sweeper.run()['swept'] == 1
+    assert release.calls == [{'INV1': 1}]
+    assert expired == []
+    document = reservations.find_one({'reservation_id': 'R0'})
+    assert document['Reservation_status'] == 'Returned'
+    assert document['Reservation_copies_released'] is True
+    assert 'Reservation_release_pending' not in document
@@ -0,0 +1,51 @@
+import datetime
+
+import pytest
+
+from history import HistoryArchiver
+from indexes import ensure_collection_indexes
+
+CLOSED = datetime.datetime.utcnow() - datetime.timedelta(days=60)
+
+
+@pytest.fixture
+def collections(mongo_client):
+    db = mongo_client['reservations_db']
+    for name in ('reservation12', 'reservation_history'):
+        ensure_collection_indexes(db[name])
+    return db['reservation12'], db['reservation_history']
+
+
+def closed_reservation(reservation_id):
+    return {'reservation_id': reservation_id, 'Reservation_status': 'Returned', 'Reservation_closed_date': CLOSED}
+
+
+def test_rerun_after_insert_finishes_the_move(collections):
+    hot, history = collections
+    hot.insert_many([closed_reservation('R1'), closed_reservation('R2')])
+    # A previous run wrote R1 to history and died before the delete
+    history.insert_one(hot.find_one({'reservation_id': 'R1'}))
+
+    assert HistoryArchiver(hot, history).archive_batch(datetime.datetime.utcnow()) == 2
+    assert hot.count_documents({}) == 0
+    assert history.count_documents({}) == 2
+
+
+def test_reservation_id_clash_is_not_taken_as_archived(collections):
+    hot, history = collections
+    hot.insert_many([closed_reservation('R1'), closed_reservation('R2')])
+    # A different document already holds R1 in history
+    history.insert_one(closed_reservation('R1'))
+
+    assert HistoryArchiver(hot, history).archive_batch(datetime.datetime.utcnow()) == 1
+    assert [reservation['reservation_id'] for reservation in hot.find()] == ['R1']
+    assert history.count_documents({}) == 2
+
+
+def test_pending_copy_release_is_not_archived(collections):
+    hot, history = collections
+    hot.insert_many([closed_reservation('R1'),
+                     dict(closed_reservation('R2'), Reservation_release_pending=datetime.datetime(1970, 1, 1))])
+
+    assert HistoryArchiver(hot, history).archive_batch(datetime.datetime.utcnow()) == 1
+    assert [reservation['reservation_id'] for reservation in hot.find()] == ['R2']
@@ -0,0 +1,43 @@
+import reservation_listing
+from indexes import ensure_collection_indexes, ensure_indexes
+
+
+def test_unique_index_replaces_legacy_plain_index(mongo_client):
+    items = mongo_client['inventory_db']['inventory_items']
+    items.create_index('inv_id')
+    items.insert_many([{'inv_id': 'a'}, {'inv_id': 'b'}])
+
+    result = ensure_indexes(mongo_client['inventory_db'])
+
+    indexes = items.index_information()
+    assert 'inv_id_1' not in indexes
+    assert indexes['inv_id_unique'].get('unique')
+    assert 'inventory_items.inv_id_unique' in result['created']
+
+
+def test_legacy_index_is_restored_when_duplicates_block_unique(mongo_client):
+    reservations = mongo_client['reservations_db']['reservation12']
+    reservations.create_index('reservation_id')
+    reservations.insert_many([{'reservation_id': 'r1'}, {'reservation_id': 'r1'}])
+
+    _, failed = ensure_collection_indexes(reservations)
+
+    indexes = reservations.index_information()
+    assert 'reservation_id_1' in indexes
+    assert 'reservation_id_unique' not in indexes
+    assert [failure['index'] for failure in failed] == ['reservation_id_unique']
+
+
+def test_retired_index_is_dropped_once_its_replacement_exists(mongo_client):
+    # Importing reservation_listing registers the replacement
+    assert 'status_expiry_date_id' in [options['name'] for _, options in reservation_listing.LISTING_INDEXES]
+    reservations = mongo_client['reservations_db']['reservation12']
+    reservations.create_index([('Reservation_status', 1), ('Reservation_expiry_date', 1)],
+                              name='status_expiry_date')
+
+    _, failed = ensure_collection_indexes(reservations)
+
+    indexes = reservations.index_information()
+    assert not failed
+    assert 'status_expiry_date' not in indexes
+    assert 'status_expiry_date_id' in indexes
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+import prj1
+
+
+@pytest.fixture
+def client():
+    prj1.collection.insert_many([
+        {'inv_id': 'INV1', 'inv_name': 'Item 1', 'inv_type': 'Book', 'inv_archive_status': True, 'inv_copies': 2},
+        {'inv_id': 'INV2', 'inv_name': 'Item 2', 'inv_type': 'Book', 'inv_archive_status': True, 'inv_copies': 0},
+        {'inv_id': 'HIDDEN', 'inv_name': 'Hidden', 'inv_type': 'Book', 'inv_archive_status': 'FALSE',
+         'inv_copies': 1},
+    ])
+    return prj1.create_app().test_client()
+
+
+def test_lookup_returns_found_and_missing_ids(client):
+    response = client.post('/inventory/lookup', json={'inv_ids': ['INV1', ' INV2 ', 'HIDDEN', 'NOPE', 'INV1'],
+                                                      'fields': ['inv_name']})
+
+    assert response.status_code == 200
+    assert response.json['data'] == {'INV1': {'inv_id': 'INV1', 'inv_name': 'Item 1'},
+                                     'INV2': {'inv_id': 'INV2', 'inv_name': 'Item 2'}}
+    assert response.json['missing'] == ['HIDDEN', 'NOPE']
+
+
+@pytest.mark.parametrize('payload', [{}, {'inv_ids': []}, {'inv_ids': ['INV1'], 'fields': ['secret']},
+                                     {'inv_ids': [f'INV{index}' for index in range(prj1.MAX_LOOKUP_IDS + 1)]}])
+def test_lookup_rejects_bad_requests(client, payload):
+    assert client.post('/inventory/lookup', json=payload).status_code == 400
+
+
+def test_point_lookup(client):
+    response = client.get('/inventory/INV1', query_string={'fields': 'inv_copies'})
+    assert response.json == {'inv_id': 'INV1', 'inv_copies': 2}
+    assert client.get('/inventory/HIDDEN').status_code == 404
+
+
+def test_reserve_and_release_adjust_copies(client):
+    response = client.post('/inventory/INV1/reserve', json={'copies': 2})
+    assert response.status_code == 200
+    assert response.json == {'inv_id': 'INV1', 'inv_copies': 0}
+
+    response = client.post('/inventory/INV1/release', json={'copies': 1})
+    assert response.json == {'inv_id': 'INV1', 'inv_copies': 1}
+
+
+def test_reserve_refuses_more_copies_than_available(client):
+    assert client.post('/inventory/INV2/reserve', json={}).status_code == 409
+    assert client.post('/inventory/NOPE/reserve', json={}).status_code == 404
+    assert client.post('/inventory/NOPE/release', json={}).status_code == 404
+    assert prj1.collection.find_one({'inv_id': 'INV2'})['inv_copies'] == 0
+
+
+@pytest.mark.parametrize('copies', [0, -1, 'two', True])
+def test_copies_must_be_a_positive_integer(client, copies):
+    assert client.post('/inventory/INV1/reserve', json={'copies': copies}).status_code == 400
+    assert client.post('/inventory/INV1/release', json={'copies': copies}).status_code == 400
+
+
+def test_concurrent_reserves_never_go_below_zero(client):
+    statuses = []
+
+    def reserve():
+        statuses.append(client.post('/inventory/INV1/reserve', json={'copies': 1}).status_code)
+
+    threads = [threading.Thread(target=reserve) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200, 200, 409, 409, 409, 409]
+    assert prj1.collection.find_one({'inv_id': 'INV1'})['inv_copies'] == 0
+
+
+def test_reserve_claims_stay_out_of_read_responses(client):
+    prj1.collection.update_one({'inv_id': 'INV1'}, {'$set': {'inv_reserve_claims': {'stale': 1}}})
+
+    records = [
+        client.get('/inventory/INV1').json,
+        client.post('/inventory/lookup', json={'inv_ids': ['INV1']}).json['data']['INV1'],
+        *client.get('/inventory/view-all').json['data'],
+        *client.get('/inventory/view').json['data'],
+        *client.get('/inventory/view', query_string={'cursor': ''}).json['data'],
+    ]
+    assert records and all('inv_reserve_claims' not in record for record in records)
+
+
+def test_delete_many_tombstones_only_deleted_ids(client):
+    response = client.delete('/inventory/delete-many', json={'inventory_ids': ['INV1', 'NOPE', 'INV2']})
+
+    assert response.status_code == 200
+    assert sorted(tombstone['inv_id'] for tombstone in prj1.tombstones.find()) == ['INV1', 'INV2']
+    assert client.delete('/inventory/delete-many', json={'inventory_ids': ['NOPE']}).status_code == 404
+    assert prj1.tombstones.count_documents({}) == 2
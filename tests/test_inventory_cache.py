@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from inventory_cache import InventoryCache
+
+
+class GatedLoader:
+    """Loader that blocks until released, counting its calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = None
+
+    def __call__(self, inv_id):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        if self.error:
+            raise self.error
+        return {'inv_id': inv_id, 'load': self.calls}
+
+
+def run_in_threads(target, count):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_misses_share_one_load():
+    loader = GatedLoader()
+    cache = InventoryCache(loader)
+
+    threads, results = run_in_threads(lambda: cache.get('INV1'), 8)
+    assert loader.started.wait(5)
+    time.sleep(0.05)
+    loader.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert loader.calls == 1
+    assert results == [{'inv_id': 'INV1', 'load': 1}] * 8
+    stats = cache.stats()
+    assert stats['coalesced'] + stats['hits'] == 7
+
+
+def test_invalidate_during_a_load_keeps_its_result_out_of_the_cache():
+    loader = GatedLoader()
+    cache = InventoryCache(loader)
+
+    threads, results = run_in_threads(lambda: cache.get('INV1'), 1)
+    assert loader.started.wait(5)
+    # The record changed while the load was reading it
+    cache.invalidate('INV1')
+    loader.release.set()
+    threads[0].join()
+
+    assert results == [{'inv_id': 'INV1', 'load': 1}]
+    assert cache.get('INV1') == {'inv_id': 'INV1', 'load': 2}
+    assert loader.calls == 2
+
+
+def test_last_known_record_is_served_when_the_reload_fails():
+    loader = GatedLoader()
+    loader.release.set()
+    stale = []
+    cache = InventoryCache(loader, ttl=30, stale_ttl=60, on_stale=lambda inv_id, age: stale.append(inv_id))
+
+    assert cache.get('INV1') == {'inv_id': 'INV1', 'load': 1}
+    cache.invalidate('INV1')
+    loader.error = ConnectionError('inventory service unreachable')
+
+    assert cache.get('INV1') == {'inv_id': 'INV1', 'load': 1}
+    assert stale == ['INV1']
+    assert cache.stats()['stale_fallbacks'] == 1
+
+
+def test_failed_load_without_a_fallback_raises():
+    loader = GatedLoader()
+    loader.release.set()
+    loader.error = ConnectionError('inventory service unreachable')
+
+    with pytest.raises(ConnectionError):
+        InventoryCache(loader).get('INV1')
+
+
+def test_expired_record_is_served_while_it_refreshes_in_the_background():
+    loader = GatedLoader()
+    loader.release.set()
+    cache = InventoryCache(loader, ttl=0.01, stale_ttl=60)
+
+    cache.get('INV1')
+    time.sleep(0.02)
+    assert cache.get('INV1') == {'inv_id': 'INV1', 'load': 1}
+    cache._refresher.shutdown(wait=True)
+    assert cache.get('INV1') == {'inv_id': 'INV1', 'load': 2}
+
+
+def test_least_recently_used_entries_are_evicted():
+    loader = GatedLoader()
+    loader.release.set()
+    cache = InventoryCache(loader, max_entries=2)
+
+    cache.get('INV1')
+    cache.get('INV2')
+    cache.get('INV1')
+    cache.get('INV3')
+
+    assert cache.stats()['size'] == 2
+    assert cache.stats()['evictions'] == 1
+    calls = loader.calls
+    cache.get('INV1')
+    assert loader.calls == calls
+    cache.get('INV2')
+    assert loader.calls == calls + 1
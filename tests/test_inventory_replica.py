@@ -0,0 +1,76 @@
+import datetime
+
+import pytest
+import requests
+
+import prj1
+import prj2
+from inventory_replica import InventoryReplica
+
+
+def local_replica(mongo_client, **options):
+    db = mongo_client['reservations_db']
+    return InventoryReplica(db['inventory_replica'], db['replica_state'], prj1.list_inventory_changes,
+                            prj1.inventory_page, version_overlap=0, **options)
+
+
+def add_items(*inv_ids):
+    documents = [{'inv_id': inv_id, 'inv_name': inv_id, 'inv_copies': 1} for inv_id in inv_ids]
+    prj1.stamp_versions(documents)
+    prj1.collection.insert_many(documents)
+
+
+def delete_item(inv_id):
+    prj1.collection.delete_one({'inv_id': inv_id})
+    prj1.write_tombstones([inv_id])
+
+
+def test_changes_report_the_oldest_kept_tombstone(mongo_client):
+    add_items('A', 'B')
+    assert prj1.list_inventory_changes(0, 10)['oldest_tombstone'] is None
+    delete_item('A')
+    tombstone = prj1.tombstones.find_one({'inv_id': 'A'})
+    assert prj1.list_inventory_changes(0, 10)['oldest_tombstone'] == tombstone['version']
+
+
+def test_replica_behind_the_kept_tombstones_resyncs(mongo_client):
+    replica = local_replica(mongo_client)
+    add_items('A', 'B', 'C')
+    assert replica.sync()['mode'] == 'snapshot'
+
+    # B is deleted and its tombstone expires before the replica polls again
+    delete_item('B')
+    prj1.tombstones.delete_many({})
+    add_items('D')
+    delete_item('D')
+
+    assert replica.sync()['mode'] == 'snapshot'
+    assert set(replica.get_many(['A', 'B', 'C', 'D'])) == {'A', 'C'}
+    assert 'snapshot' not in replica.get('A')
+    assert replica.sync()['mode'] == 'poll'
+
+
+def test_replica_not_synced_within_the_tombstone_lifetime_resyncs(mongo_client):
+    replica = local_replica(mongo_client, resync_after=datetime.timedelta(days=7))
+    add_items('A')
+    replica.sync()
+    replica.state.update_one({'_id': 'inventory'}, {'$set': {
+        'synced_at': datetime.datetime.utcnow() - datetime.timedelta(days=8)}})
+
+    assert replica.sync()['mode'] == 'snapshot'
+
+
+def test_unreachable_inventory_service_is_a_503(mongo_client, monkeypatch):
+    def unreachable(inv_id, fields=None):
+        raise requests.ConnectionError('inventory service unreachable')
+
+    monkeypatch.setattr(prj2, 'replica_enabled', lambda: True)
+    monkeypatch.setattr(prj2.inventory_replica, 'ready', lambda: True)
+    monkeypatch.setattr(prj2, 'fetch_inventory_record', unreachable)
+    prj2.inventory_cache.invalidate('NEW')
+
+    with pytest.raises(requests.ConnectionError):
+        prj2.load_inventory_record('NEW')
+    response = prj2.create_app().test_client().post('/reservations/create', json={
+        'Reserved_user': 'alice', 'Reserved_user_email': 'alice@example.com', 'inv_id': 'NEW'})
+    assert response.status_code == 503
@@ -0,0 +1,86 @@
+import pytest
+import requests
+
+import prj1
+from inventory_transport import HTTPInventoryTransport, LocalInventoryTransport
+
+
+class FlaskResponse:
+    """The parts of requests.Response the HTTP transport reads, over a Flask test response."""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self._json = response.get_json()
+
+    def json(self):
+        return self._json
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} error')
+
+
+class FlaskServiceClient:
+    """Stands in for ServiceClient, sending its requests to prj1's test client."""
+
+    def __init__(self):
+        self.client = prj1.create_app().test_client()
+
+    def get(self, path, endpoint=None, params=None):
+        return FlaskResponse(self.client.get(path, query_string=params))
+
+    def post(self, path, endpoint=None, json=None):
+        return FlaskResponse(self.client.post(path, json=json))
+
+
+@pytest.fixture(params=['http', 'local'])
+def transport(request):
+    prj1.collection.insert_many([
+        {'inv_id': 'INV1', 'inv_name': 'Item 1', 'inv_type': 'Book', 'inv_archive_status': True, 'inv_copies': 2},
+        {'inv_id': 'INV2', 'inv_name': 'Item 2', 'inv_type': 'Book', 'inv_archive_status': True, 'inv_copies': 0},
+        {'inv_id': 'INV3 b', 'inv_name': 'Item 3', 'inv_type': 'Book', 'inv_archive_status': True, 'inv_copies': 1},
+    ])
+    if request.param == 'http':
+        return HTTPInventoryTransport(FlaskServiceClient(), batch_size=2)
+    return LocalInventoryTransport(prj1)
+
+
+def test_record(transport):
+    assert transport.record('INV1') == {'inv_id': 'INV1', 'inv_name': 'Item 1', 'inv_type': 'Book',
+                                        'inv_archive_status': True, 'inv_copies': 2}
+    assert transport.record('INV1', ['inv_copies']) == {'inv_id': 'INV1', 'inv_copies': 2}
+    assert transport.record('INV3 b', ['inv_name']) == {'inv_id': 'INV3 b', 'inv_name': 'Item 3'}
+    assert transport.record('NOPE') is None
+
+
+def test_records_span_batches(transport):
+    records = transport.records(['INV1', 'INV2', 'INV3 b', 'NOPE', 'INV1'], ['inv_copies'])
+    assert records == {'INV1': {'inv_id': 'INV1', 'inv_copies': 2}, 'INV2': {'inv_id': 'INV2', 'inv_copies': 0},
+                       'INV3 b': {'inv_id': 'INV3 b', 'inv_copies': 1}}
+
+
+def test_reserve_and_release(transport):
+    assert transport.reserve('INV1', 2) == 0
+    assert transport.reserve('INV1', 1) is None
+    assert transport.reserve('NOPE', 1) is None
+    assert transport.release('INV1', 3) == 3
+    assert transport.release('NOPE', 1) is None
+
+
+def test_reserve_many_and_release_many(transport):
+    assert transport.reserve_many({'INV1': 3, 'INV2': 1, 'INV3 b': 1}) == {'INV1': 2, 'INV2': 0, 'INV3 b': 1}
+    assert sorted(transport.release_many({'INV1': 2, 'NOPE': 1, 'INV3 b': 1})) == ['NOPE']
+    assert transport.record('INV1', ['inv_copies'])['inv_copies'] == 2
+
+
+def test_page_and_changes(transport):
+    data, next_cursor = transport.page(None, 2)
+    assert [record['inv_id'] for record in data] == ['INV1', 'INV2']
+    data, next_cursor = transport.page(next_cursor, 2)
+    assert [record['inv_id'] for record in data] == ['INV3 b']
+    assert next_cursor is None
+
+    prj1.write_tombstones(['GONE'])
+    changes = transport.changes(0, 10)
+    assert [tombstone['inv_id'] for tombstone in changes['deleted']] == ['GONE']
+    assert changes['items'] == []
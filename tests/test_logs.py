@@ -0,0 +1,24 @@
+import pytest
+from flask import Flask
+
+import config
+from logs import init_request_logging, is_traced
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    init_request_logging(app)
+    app.add_url_rule('/traced', 'traced', lambda: {'traced': is_traced()})
+    return app.test_client()
+
+
+def test_trace_header_is_ignored_by_default(client, monkeypatch):
+    monkeypatch.setattr(config, 'LOG_TRACE_HEADER_ENABLED', False)
+    assert client.get('/traced', headers={'X-Trace': '1'}).json == {'traced': False}
+
+
+def test_trace_header_is_honoured_when_enabled(client, monkeypatch):
+    monkeypatch.setattr(config, 'LOG_TRACE_HEADER_ENABLED', True)
+    assert client.get('/traced', headers={'X-Trace': '1'}).json == {'traced': True}
+    assert client.get('/traced').json == {'traced': False}
@@ -0,0 +1,96 @@
+import datetime
+
+import pytest
+
+import prj1
+from pagination import InvalidPageRequest, keyset_page, page_limit, MAX_PAGE_LIMIT
+
+
+@pytest.fixture
+def client():
+    return prj1.create_app({'TESTING': True}).test_client()
+
+
+@pytest.fixture
+def items():
+    prj1.collection.insert_many([{'inv_id': f'inv{index:03d}', 'inv_name': f'Item {index}'} for index in range(25)])
+
+
+def test_page_limit_is_clamped():
+    assert page_limit(None, 10) == 10
+    assert page_limit('0', 10) == 1
+    assert page_limit('-1', 10) == 1
+    assert page_limit(str(MAX_PAGE_LIMIT + 1), 10) == MAX_PAGE_LIMIT
+    with pytest.raises(InvalidPageRequest):
+        page_limit('abc', 10)
+
+
+@pytest.mark.parametrize('limit', ['0', '-1'])
+def test_inventory_view_clamps_limit(client, items, limit):
+    response = client.get(f'/inventory/view?limit={limit}&cursor=')
+    assert response.status_code == 200
+    assert response.json['limit'] == 1
+    assert len(response.json['data']) == 1
+
+
+def test_inventory_view_rejects_bad_limit(client, items):
+    assert client.get('/inventory/view?limit=abc').status_code == 400
+
+
+def test_inventory_view_defaults_to_skip_pages_with_total(client, items):
+    response = client.get('/inventory/view?limit=10&page=3')
+    assert response.json['total_records'] == 25
+    assert len(response.json['data']) == 5
+    assert client.get('/inventory/view').json['total_records'] == 25
+
+
+def test_keyset_pages_walk_every_item_once(client, items):
+    seen, cursor = [], ''
+    while cursor is not None:
+        page = client.get(f'/inventory/view?limit=7&cursor={cursor}').json
+        seen.extend(item['inv_id'] for item in page['data'])
+        cursor = page['next']
+    assert seen == [f'inv{index:03d}' for index in range(25)]
+
+
+def test_keyset_tie_breaker_keeps_duplicates(mongo_client):
+    collection = mongo_client['db']['items']
+    collection.insert_many([{'name': 'same', 'key': index} for index in range(5)])
+    seen, cursor = [], None
+    while True:
+        data, cursor = keyset_page(collection, 'name', 2, cursor=cursor, projection={'_id': 0}, tie_breaker='key')
+        seen.extend(item['key'] for item in data)
+        if not cursor:
+            break
+    assert seen == [0, 1, 2, 3, 4]
+
+
+def test_reservation_view_clamps_limit_and_keeps_total():
+    import prj2
+    prj2.collection.insert_many([{'reservation_id': f'r{index:03d}', 'Reserved_user': 'bob'} for index in range(3)])
+    client = prj2.create_app({'TESTING': True}).test_client()
+    response = client.get('/reservation/view?limit=-1')
+    assert response.status_code == 200
+    assert response.json['limit'] == 1
+    assert response.json['total_records'] == 3
+    assert client.get('/reservation/view?limit=x').status_code == 400
+
+
+def test_reservation_viewall_merges_history_on_the_sort_key():
+    import prj2
+    created = [datetime.datetime(2024, 5, day) for day in range(1, 5)]
+    prj2.collection.insert_many([{'reservation_id': f'r{day}', 'Reserved_user': 'bob', 'Reservation_created_date':
+                                  created[day]} for day in (0, 2)])
+    prj2.history_collection.insert_many([{'reservation_id': f'r{day}', 'Reserved_user': 'bob',
+                                          'Reservation_created_date': created[day]} for day in (1, 3)])
+    client = prj2.create_app({'TESTING': True}).test_client()
+
+    response = client.get('/reservation/viewall', query_string={'Reserved_user': 'bob', 'include_history': 'true',
+                                                                'fields': 'Reserved_user'})
+    assert response.status_code == 200
+    assert response.json['total_records'] == 4
+    assert response.json['data'] == [{'Reserved_user': 'bob'}] * 4
+
+    response = client.get('/reservation/viewall', query_string={'Reserved_user': 'bob', 'include_history': 'true',
+                                                                'fields': 'reservation_id'})
+    assert [item['reservation_id'] for item in response.json['data']] == ['r3', 'r2', 'r1', 'r0']
@@ -0,0 +1,68 @@
+import datetime
+import threading
+
+import pytest
+
+from indexes import ensure_collection_indexes
+from quota import QuotaExceeded, ReservationQuota
+
+WHEN = datetime.datetime(2024, 5, 10)
+
+
+@pytest.fixture
+def counters(mongo_client):
+    collection = mongo_client['reservations_db']['reservation_quotas']
+    ensure_collection_indexes(collection)
+    return collection
+
+
+def test_acquire_stops_at_the_limit(counters):
+    quota = ReservationQuota(counters, {'default': 2})
+    assert quota.acquire('bob', WHEN) == 1
+    assert quota.acquire('bob', WHEN) == 2
+    with pytest.raises(QuotaExceeded):
+        quota.acquire('bob', WHEN)
+    assert quota.usage('bob', WHEN)['count'] == 2
+
+
+def test_zero_limit_grants_nothing(counters):
+    quota = ReservationQuota(counters, {'default': 0})
+    with pytest.raises(QuotaExceeded):
+        quota.acquire('bob', WHEN)
+    assert quota.acquire_many({'bob': 3}, WHEN) == {'bob': 0}
+    assert counters.count_documents({}) == 0
+
+
+def test_acquire_many_grants_only_the_room_left(counters):
+    quota = ReservationQuota(counters, {'default': 3, 'staff': 1}, {'eve': 'staff'})
+    quota.acquire('bob', WHEN)
+    assert quota.acquire_many({'bob': 5, 'eve': 2, 'amy': 1}, WHEN) == {'bob': 2, 'eve': 1, 'amy': 1}
+    assert quota.usage('bob', WHEN)['count'] == 3
+
+
+def test_release_gives_units_back(counters):
+    quota = ReservationQuota(counters, {'default': 1})
+    quota.acquire('bob', WHEN)
+    assert quota.release('bob', WHEN)
+    assert quota.acquire('bob', WHEN) == 1
+
+
+def test_concurrent_acquires_never_pass_the_limit(counters):
+    quota = ReservationQuota(counters, {'default': 5})
+    granted, lock = [], threading.Lock()
+
+    def acquire():
+        try:
+            quota.acquire('bob', WHEN)
+        except QuotaExceeded:
+            return
+        with lock:
+            granted.append(1)
+
+    threads = [threading.Thread(target=acquire) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(granted) == 5
+    assert quota.usage('bob', WHEN)['count'] == 5
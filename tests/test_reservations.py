@@ -0,0 +1,132 @@
+import io
+import threading
+
+import pytest
+import requests
+
+import prj1
+import prj2
+from quota import ReservationQuota
+
+
+@pytest.fixture
+def inventory(monkeypatch):
+    # The reservation service talks to prj1's data layer in-process
+    prj1.collection.insert_many([
+        {'inv_id': 'INV1', 'inv_name': 'Item 1', 'inv_type': 'Book', 'inv_archive_status': True, 'inv_copies': 5},
+        {'inv_id': 'INV2', 'inv_name': 'Item 2', 'inv_type': 'Book', 'inv_archive_status': True, 'inv_copies': 1},
+    ])
+    monkeypatch.setattr(prj2.inventory_cache, 'get_many',
+                        lambda inv_ids: prj1.find_inventory_records(inv_ids))
+    monkeypatch.setattr(prj2, 'reserve_many_inventory_copies', prj1.reserve_many_copies)
+    monkeypatch.setattr(prj2, 'release_many_inventory_copies', lambda copies: prj1.release_many_copies(copies)[1])
+    monkeypatch.setattr(prj2, 'reservation_quota', ReservationQuota(prj2.db['reservation_quotas'], {'default': 10}))
+    return prj1.collection
+
+
+def copies_of(inv_id):
+    return prj1.collection.find_one({'inv_id': inv_id})['inv_copies']
+
+
+def entries(*pairs):
+    return [{'Reserved_user': user, 'Reserved_user_email': f'{user}@example.com', 'inv_id': inv_id}
+            for user, inv_id in pairs]
+
+
+def test_reserve_many_grants_what_is_left(inventory):
+    assert prj1.reserve_many_copies({'INV1': 2, 'INV2': 3, 'MISSING': 1}) == {'INV1': 2, 'INV2': 1, 'MISSING': 0}
+    assert copies_of('INV1') == 3
+    assert copies_of('INV2') == 0
+    # The claims that told granted items apart are removed again
+    assert not any(record.get('inv_reserve_claims') for record in prj1.collection.find())
+
+
+def test_concurrent_reserve_many_never_oversells(inventory):
+    granted = []
+
+    def reserve():
+        granted.append(prj1.reserve_many_copies({'INV1': 1, 'INV2': 1}))
+
+    threads = [threading.Thread(target=reserve) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(grant['INV1'] for grant in granted) == 5
+    assert sum(grant['INV2'] for grant in granted) == 1
+    assert copies_of('INV1') == 0
+    assert copies_of('INV2') == 0
+
+
+def test_failed_insert_refunds_quota_and_copies(inventory, monkeypatch):
+    def insert_many(collection, documents, ordered=True):
+        raise ConnectionError('primary stepped down')
+
+    # On the collection class: LazyCollection resolves a fresh handle on every use
+    monkeypatch.setattr(type(prj2.collection.resolve()), 'insert_many', insert_many)
+    results, created = prj2.create_reservations(entries(('alice', 'INV1'), ('bob', 'INV2')))
+
+    assert created == 0
+    assert [result['status'] for result in results] == ['error', 'error']
+    assert copies_of('INV1') == 5
+    assert copies_of('INV2') == 1
+    assert prj2.reservation_quota.usage('alice', prj2.datetime.datetime.utcnow())['count'] == 0
+
+
+def test_import_numbers_ids_across_chunks(inventory, monkeypatch):
+    # Every chunk in the same second could otherwise draw the same prefix
+    monkeypatch.setattr(prj2, 'generate_reservation_id', lambda: 'r202405100000001234')
+    csv_file = io.BytesIO(('reserved_user,reserved_user_email,inv_id\n'
+                           + ''.join(f'user{index},user{index}@example.com,INV1\n' for index in range(7))).encode())
+
+    response, status = prj2.import_reservations(csv_file, batch_size=2)
+
+    assert status == 200
+    assert response['inserted'] == 7
+    assert len({reservation['reservation_id'] for reservation in prj2.collection.find()}) == 7
+    # INV1 only had 5 copies for the 7 imported reservations
+    assert response['copies_reserved'] == {'INV1': 5}
+    assert response['copies_shortfall'] == {'INV1': 2}
+
+
+@pytest.fixture
+def single_create(inventory, monkeypatch):
+    monkeypatch.setattr(prj2.inventory_cache, 'get', lambda inv_id: prj1.find_inventory_record(inv_id))
+    monkeypatch.setattr(prj2, 'reserve_inventory_copies',
+                        lambda inv_id, copies=1: (prj1.reserve_copies(inv_id, copies) or {}).get('inv_copies'))
+    monkeypatch.setattr(prj2, 'release_inventory_copies',
+                        lambda inv_id, copies=1: (prj1.release_copies(inv_id, copies) or {}).get('inv_copies'))
+    client = prj2.create_app().test_client()
+    return lambda: client.post('/reservations/create', json={
+        'Reserved_user': 'alice', 'Reserved_user_email': 'alice@example.com', 'inv_id': 'INV1', 'inv_copies': 1})
+
+
+def quota_used(user='alice'):
+    return prj2.reservation_quota.usage(user, prj2.datetime.datetime.utcnow())['count']
+
+
+@pytest.mark.parametrize('error', [requests.ConnectionError('refused'), requests.Timeout('timed out'),
+                                   requests.HTTPError('400 Client Error')])
+def test_unreachable_inventory_gives_the_quota_back(single_create, monkeypatch, error):
+    def reserve(inv_id, copies=1):
+        raise error
+
+    monkeypatch.setattr(prj2, 'reserve_inventory_copies', reserve)
+    assert single_create().status_code == 503
+    assert quota_used() == 0
+
+
+def test_failed_insert_gives_quota_and_copies_back(single_create, monkeypatch):
+    def insert_one(collection, document):
+        raise ConnectionError('primary stepped down')
+
+    monkeypatch.setattr(type(prj2.collection.resolve()), 'insert_one', insert_one)
+    assert single_create().status_code == 500
+    assert quota_used() == 0
+    assert copies_of('INV1') == 5
+
+
+def test_single_create_takes_quota_and_a_copy(single_create):
+    assert single_create().status_code == 201
+    assert quota_used() == 1
+    assert copies_of('INV1') == 4
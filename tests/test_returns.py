@@ -0,0 +1,113 @@
+import datetime
+
+import pytest
+
+import prj2
+
+CREATED = datetime.datetime(2024, 5, 10)
+
+
+class FlakyRelease:
+    """Stands in for release_many_inventory_copies; fails the first `failures` calls."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+
+    def __call__(self, copies):
+        self.calls.append(dict(copies))
+        if len(self.calls) <= self.failures:
+            raise ConnectionError('inventory service unreachable')
+        return []
+
+
+@pytest.fixture
+def reservations():
+    prj2.collection.insert_many([
+        {'reservation_id': f'R{index}', 'inv_id': f'INV{index}', 'inv_copies': 1, 'inv_type': 'Book',
+         'inv_name': f'Item {index}', 'Reserved_user': 'alice', 'Reservation_status': 'Reserved',
+         'Reservation_created_date': CREATED}
+        for index in range(3)
+    ])
+    return prj2.collection
+
+
+def test_failed_release_is_retried_by_the_next_return(reservations, monkeypatch):
+    release = FlakyRelease(failures=1)
+    monkeypatch.setattr(prj2, 'release_many_inventory_copies', release)
+
+    response, status = prj2.return_reservations(['R0', 'R1'], 'back')
+    assert status == 207
+    assert response['results'] == {'R0': 'release_pending', 'R1': 'release_pending'}
+    assert reservations.find_one({'reservation_id': 'R0'})['Reservation_status'] == 'Returned'
+
+    response, status = prj2.return_reservations(['R0', 'R1'], 'back')
+    assert status == 200
+    assert response['results'] == {'R0': 'returned', 'R1': 'returned'}
+    assert release.calls[-1] == {'INV0': 1, 'INV1': 1}
+
+    response, status = prj2.return_reservations(['R0', 'R1'], 'back')
+    assert status == 404
+    assert response['results'] == {'R0': 'already_returned', 'R1': 'already_returned'}
+    assert len(release.calls) == 2
+    document = reservations.find_one({'reservation_id': 'R0'})
+    assert document['Reservation_copies_released'] is True
+    assert 'Reservation_release_pending' not in document
+
+
+def test_release_in_flight_is_not_claimed_twice(reservations, monkeypatch):
+    release = FlakyRelease()
+    monkeypatch.setattr(prj2, 'release_many_inventory_copies', release)
+    reservations.update_one({'reservation_id': 'R2'}, {'$set': {
+        'Reservation_status': 'Returned', 'Reservation_release_pending': datetime.datetime.utcnow()}})
+
+    response, _ = prj2.return_reservations(['R2'], 'back')
+    assert response['results'] == {'R2': 'release_pending'}
+    assert release.calls == []
+
+
+def test_single_return_goes_through_the_pending_release(reservations, monkeypatch):
+    release = FlakyRelease(failures=1)
+    monkeypatch.setattr(prj2, 'release_many_inventory_copies', release)
+    client = prj2.create_app().test_client()
+
+    response = client.put('/reservation/update/R0', json={'Reservation_status': 'Returned'})
+    assert response.status_code == 202
+    response = client.put('/reservation/update/R0', json={'Reservation_status': 'Returned'})
+    assert response.status_code == 200
+    assert release.calls == [{'INV0': 1}, {'INV0': 1}]
+    response = client.put('/reservation/update/R0', json={'Reservation_status': 'Returned'})
+    assert response.status_code == 500
+    assert len(release.calls) == 2
+
+
+def test_return_takes_over_a_failed_expiry_release(reservations, monkeypatch):
+    release = FlakyRelease()
+    monkeypatch.setattr(prj2, 'release_many_inventory_copies', release)
+    reservations.update_one({'reservation_id': 'R1'}, {'$set': {
+        'Reservation_status': 'Expired', 'Reservation_release_pending': prj2.RELEASE_RETRY_NOW}})
+
+    response, _ = prj2.return_reservations(['R1'], 'back')
+    assert response['results'] == {'R1': 'returned'}
+    assert release.calls == [{'INV1': 1}]
+
+
+def test_failed_return_is_counted_once_and_released_by_the_sweeper(reservations, monkeypatch):
+    release = FlakyRelease(failures=1)
+    monkeypatch.setattr(prj2, 'release_many_inventory_copies', release)
+    recorded = []
+    monkeypatch.setattr(prj2.reservation_rollups, 'record', lambda event, docs: recorded.append((event, len(docs))))
+    released_quota = []
+    monkeypatch.setattr(prj2.reservation_quota, 'release_many', lambda items: released_quota.extend(items))
+
+    response, status = prj2.return_reservations(['R0', 'R1'], 'back')
+    assert status == 207
+    assert recorded == [('returned', 2)]
+    assert len(released_quota) == 2
+
+    sweeper = prj2.ExpirySweeper(reservations, release)
+    assert sweeper.run()['swept'] == 2
+    assert release.calls[-1] == {'INV0': 1, 'INV1': 1}
+    assert reservations.count_documents({'Reservation_copies_released': True}) == 2
+    assert recorded == [('returned', 2)]
+    assert len(released_quota) == 2
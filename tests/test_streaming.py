@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+import prj1
+
+
+@pytest.fixture
+def client():
+    prj1.collection.insert_many([{'inv_id': f'INV{index}', 'inv_name': f'Item {index}', 'inv_copies': index}
+                                 for index in range(5)])
+    return prj1.create_app().test_client()
+
+
+def ndjson_lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_ndjson_streams_every_record_then_the_total(client):
+    response = client.get('/inventory/view-all', query_string={'format': 'ndjson', 'batch_size': 2})
+
+    assert response.mimetype == 'application/x-ndjson'
+    lines = ndjson_lines(response)
+    assert [line['inv_id'] for line in lines[:-1]] == [f'INV{index}' for index in range(5)]
+    assert lines[-1] == {'total_records': 5}
+
+
+def test_accept_header_selects_ndjson(client):
+    response = client.get('/archived_inventory/view-all', headers={'Accept': 'application/x-ndjson'})
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert ndjson_lines(response) == [{'total_records': 0}]
+
+
+def test_wildcard_accept_keeps_the_json_document(client):
+    response = client.get('/inventory/view-all', headers={'Accept': '*/*'})
+
+    assert response.mimetype == 'application/json'
+    assert response.json['total_records'] == 5